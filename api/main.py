@@ -7,10 +7,10 @@ import os
 # Добавляем корневую директорию в путь для импортов
 sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
-from fastapi import FastAPI, HTTPException, Depends, status, Query, Header
+from fastapi import FastAPI, HTTPException, Depends, status, Query, Header, Request
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.security import HTTPBasic, HTTPBasicCredentials
-from fastapi.responses import JSONResponse, FileResponse
+from fastapi.responses import JSONResponse, FileResponse, Response, StreamingResponse
 from pydantic import BaseModel
 from typing import List, Optional, Dict, Any
 import secrets
@@ -19,42 +19,119 @@ from datetime import datetime, timedelta
 import asyncio
 import json
 import hashlib
+import tempfile
 import hmac
 import os
+from contextlib import asynccontextmanager, suppress
 
-from services.game_data import GameDataManager
+from services.game_data import get_game_data
+from services import local_store, excel_io, outbox, scheduler, data_export, data_import, auth_tokens
 from config_reader import config
 
 # Настройка логирования
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """Запускает сервис данных и очистку токенов при старте; при остановке сервис данных
+    выгружает отложенные изменения на Я.Диск (с таймаутом) и закрывает HTTP-сессию и БД"""
+    await game_data.start()
+    sweeper = asyncio.create_task(auth_tokens.run_sweeper())
+    yield
+    sweeper.cancel()
+    with suppress(asyncio.CancelledError):
+        await sweeper
+    await game_data.stop()
+
+
 # Создаем FastAPI приложение
 app = FastAPI(
     title="90 Days Game API",
     description="API для веб-платформы игры '90 дней - 10 целей'",
-    version="1.0.0"
+    version="1.0.0",
+    lifespan=lifespan
 )
 
-# CORS middleware для работы с фронтендом
+# HTTP Basic Auth для админки
+security = HTTPBasic()
+
+# Менеджер данных игры
+game_data = get_game_data()
+
+
+# Кэш ответов публичных GET-эндпоинтов. Ответы зависят только от данных игры и текущего дня,
+# поэтому ETag строится из data_version локальной БД (растет при каждой записи из любого процесса)
+# и номера дня. Тела ответов хранятся в памяти только для текущего ETag.
+_CACHED_PATHS = (
+    "/api/participants",
+    "/api/reports",
+    "/api/stats/",
+    "/api/community/stats",
+    "/api/current-day",
+    "/api/game/start-status",
+)
+_RESPONSE_CACHE_SIZE = 512
+_response_cache: Dict[str, tuple] = {}
+_response_cache_state: Dict[str, Any] = {"etag": None, "hits": 0, "misses": 0, "not_modified": 0}
+
+
+def _is_cached_path(path: str) -> bool:
+    return any(path == prefix or path.startswith(prefix.rstrip("/") + "/") for prefix in _CACHED_PATHS)
+
+
+async def _current_etag() -> str:
+    version = await local_store.get_data_version()
+    current_day = await game_data.get_current_day_async()
+    return f'W/"{version}-{current_day}"'
+
+
+@app.middleware("http")
+async def etag_cache(request: Request, call_next):
+    """ETag / If-None-Match и кэш сериализованных ответов для публичных эндпоинтов чтения"""
+    if request.method != "GET" or not _is_cached_path(request.url.path):
+        return await call_next(request)
+    etag = await _current_etag()
+    headers = {"ETag": etag, "Cache-Control": "no-cache"}
+    if _response_cache_state["etag"] != etag:
+        _response_cache.clear()
+        _response_cache_state["etag"] = etag
+    if etag in [tag.strip() for tag in request.headers.get("if-none-match", "").split(",")]:
+        _response_cache_state["not_modified"] += 1
+        return Response(status_code=304, headers=headers)
+    key = str(request.url.path) + "?" + str(request.url.query)
+    cached = _response_cache.get(key)
+    if cached is not None:
+        _response_cache_state["hits"] += 1
+        body, extra_headers = cached
+        return Response(content=body, media_type="application/json", headers={**extra_headers, **headers})
+    _response_cache_state["misses"] += 1
+    response = await call_next(request)
+    if response.status_code != 200:
+        return response
+    body = b"".join([chunk async for chunk in response.body_iterator])
+    # Если пока строился ответ другой запрос увидел новый ETag (и очистил кэш), тело не кэшируем:
+    # оно могло быть построено по старым данным
+    if len(_response_cache) < _RESPONSE_CACHE_SIZE and _response_cache_state["etag"] == etag:
+        # Вместе с телом храним собственные заголовки ответа (X-Next-Cursor, X-Total-Count)
+        _response_cache[key] = (body, {k: v for k, v in response.headers.items() if k.lower().startswith("x-")})
+    response_headers = {k: v for k, v in response.headers.items() if k.lower() != "content-length"}
+    response_headers.update(headers)
+    return Response(content=body, status_code=200, headers=response_headers, media_type=response.media_type)
+
+
+# CORS middleware для работы с фронтендом. Добавляется после etag_cache, чтобы быть внешним слоем:
+# заголовки CORS нужны и на ответах из кэша, и на 304
 app.add_middleware(
     CORSMiddleware,
     allow_origins=["*"],  # В продакшене заменить на конкретный домен
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["ETag", "X-Next-Cursor", "X-Total-Count"],
 )
 
-# HTTP Basic Auth для админки
-security = HTTPBasic()
-
-# Менеджер данных игры
-game_data = GameDataManager()
-
-# Хранилище токенов для аутентификации (в продакшене использовать Redis или БД)
-# Формат: {token: {"user_id": int, "expires_at": datetime}}
-auth_tokens: Dict[str, Dict[str, Any]] = {}
-
 # Валидация админских данных
 ADMIN_USERNAME = "admin"
 ADMIN_PASSWORD = "admin"  # В продакшене использовать переменную окружения
@@ -89,17 +166,17 @@ async def verify_user_token(
     if not token:
         raise HTTPException(status_code=401, detail="Токен не предоставлен")
     
-    if token not in auth_tokens:
-        raise HTTPException(status_code=401, detail="Токен не найден или истек")
-    
-    token_data = auth_tokens[token]
-    
-    # Проверяем срок действия
-    if token_data["expires_at"] < datetime.now():
-        del auth_tokens[token]
+    return await _token_user_id(token)
+
+
+async def _token_user_id(token: str) -> int:
+    """user_id владельца токена; 401, если токена нет или он истек"""
+    user_id, expired = await auth_tokens.lookup(token)
+    if expired:
         raise HTTPException(status_code=401, detail="Токен истек")
-    
-    return token_data["user_id"]
+    if user_id is None:
+        raise HTTPException(status_code=401, detail="Токен не найден или истек")
+    return user_id
 
 
 # Pydantic модели
@@ -179,6 +256,8 @@ class CommunityStatsResponse(BaseModel):
     active_participants: int
     total_participants: int
     participants_ranking: List[Dict[str, Any]]
+    ranking_total: int = 0
+    ranking_offset: int = 0
 
 class GameStartRequest(BaseModel):
     user_id: int
@@ -218,9 +297,9 @@ async def get_participant(user_id: int):
     """Получить информацию о конкретном участнике"""
     try:
         data = await game_data.get_all_data()
-        for p in data.get("participants", []):
-            if p["user_id"] == user_id:
-                return ParticipantResponse(**p)
+        participant = game_data.find_participant(user_id, data)
+        if participant:
+            return ParticipantResponse(**participant)
         raise HTTPException(status_code=404, detail="Участник не найден")
     except HTTPException:
         raise
@@ -229,16 +308,60 @@ async def get_participant(user_id: int):
         raise HTTPException(status_code=500, detail=str(e))
 
 
+_REPORT_FIELDS = ("user_id", "day", "date", "progress", "rest_day", "progress_count")
+_MAX_REPORTS_PAGE = 1000
+
+
+def _parse_report_cursor(cursor: str) -> tuple:
+    try:
+        day, user_id = cursor.split(".")
+        return int(day), int(user_id)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Неверный курсор")
+
+
 @app.get("/api/reports", response_model=List[ReportResponse])
-async def get_reports(user_id: Optional[int] = None):
-    """Получить отчеты (все или конкретного пользователя)"""
+async def get_reports(
+    user_id: Optional[int] = None,
+    day_from: Optional[int] = Query(None, ge=1),
+    day_to: Optional[int] = Query(None, ge=1),
+    rest_day: Optional[bool] = None,
+    participant_status: Optional[str] = Query(None, alias="status", description="Статус участника: active / removed"),
+    fields: Optional[str] = Query(None, description="Поля через запятую, например user_id,day,date,rest_day,progress_count"),
+    limit: Optional[int] = Query(None, ge=1, le=_MAX_REPORTS_PAGE),
+    cursor: Optional[str] = None,
+):
+    """Получить отчеты (все или конкретного пользователя).
+
+    Без дополнительных параметров — все отчеты, как раньше. С фильтрами, limit или fields
+    отчеты читаются из БД по индексам в порядке (день, user_id) по убыванию; курсор
+    следующей страницы и общее число отчетов — в заголовках X-Next-Cursor и X-Total-Count.
+    """
     try:
-        data = await game_data.get_all_data()
-        reports = []
-        for r in data.get("reports", []):
-            if user_id is None or r["user_id"] == user_id:
-                reports.append(ReportResponse(**r))
-        return reports
+        if all(value is None for value in (day_from, day_to, rest_day, participant_status, fields, limit, cursor)):
+            data = await game_data.get_all_data()
+            source = data.get("reports", []) if user_id is None else game_data.get_user_reports(user_id, data)
+            return [ReportResponse(**r) for r in source]
+
+        selected = _REPORT_FIELDS
+        if fields:
+            requested = {field.strip() for field in fields.split(",") if field.strip()}
+            unknown = requested - set(_REPORT_FIELDS)
+            if unknown:
+                raise HTTPException(status_code=400, detail=f"Неизвестные поля: {', '.join(sorted(unknown))}")
+            # user_id и day — ключ отчета, они есть всегда
+            selected = tuple(f for f in _REPORT_FIELDS if f in requested or f in ("user_id", "day"))
+        page = await game_data.query_reports(
+            user_id=user_id, day_from=day_from, day_to=day_to, rest_day=rest_day, status=participant_status,
+            after=_parse_report_cursor(cursor) if cursor else None, limit=limit,
+        )
+        headers = {"X-Total-Count": str(page["total"])}
+        if page["next"]:
+            headers["X-Next-Cursor"] = f"{page['next'][0]}.{page['next'][1]}"
+        content = [{field: report[field] for field in selected} for report in page["reports"]]
+        return JSONResponse(content=content, headers=headers)
+    except HTTPException:
+        raise
     except Exception as e:
         logger.error(f"Ошибка при получении отчетов: {e}")
         raise HTTPException(status_code=500, detail=str(e))
@@ -251,18 +374,14 @@ async def get_user_stats(user_id: int):
         data = await game_data.get_all_data()
         current_day = await game_data.get_current_day_async()
         
-        participant = None
-        for p in data.get("participants", []):
-            if p["user_id"] == user_id:
-                participant = p
-                break
+        participant = game_data.find_participant(user_id, data)
         
         if not participant:
             raise HTTPException(status_code=404, detail="Участник не найден")
         
-        user_reports = [r for r in data.get("reports", []) if r["user_id"] == user_id]
-        reports_count = len(user_reports)
-        has_today_report = any(r["day"] == current_day for r in user_reports)
+        progress_stats = await game_data.get_progress_stats(user_id)
+        reports_count = progress_stats[1]["reports_count"] if progress_stats else 0
+        has_today_report = game_data.has_report(user_id, current_day, data)
         
         goals_stats = []
         goals = participant.get("goals", [""] * 10)
@@ -271,14 +390,9 @@ async def get_user_stats(user_id: int):
             if not goal.strip():
                 continue
             
-            progress_days = 0
-            last_progress_day = 0
-            
-            for report in user_reports:
-                progress = report["progress"][i] if i < len(report["progress"]) else ""
-                if progress and progress.strip() and progress not in ["Отдых", "❌ Не выполнено"]:
-                    progress_days += 1
-                    last_progress_day = max(last_progress_day, report["day"])
+            goal_stats = progress_stats.get(i + 1, {})
+            progress_days = goal_stats.get("progress_days", 0)
+            last_progress_day = goal_stats.get("last_progress_day", 0)
             
             progress_percent = (progress_days / max(current_day, 1)) * 100
             
@@ -317,8 +431,17 @@ async def get_current_day():
 
 
 @app.get("/api/community/stats", response_model=CommunityStatsResponse)
-async def get_community_stats():
-    """Получить статистику комьюнити (рейтинг участников, прогресс и т.д.)"""
+async def get_community_stats(
+    limit: Optional[int] = Query(None, ge=1, le=500),
+    offset: int = Query(0, ge=0),
+    around_user_id: Optional[int] = None,
+    radius: int = Query(5, ge=0, le=50),
+):
+    """Получить статистику комьюнити (рейтинг участников, прогресс и т.д.).
+
+    Рейтинг хранится в БД уже упорядоченным; limit/offset — страница рейтинга,
+    around_user_id — участник и radius мест выше и ниже него. Без параметров — весь рейтинг.
+    """
     try:
         data = await game_data.get_all_data()
         current_day = await game_data.get_current_day_async()
@@ -326,61 +449,42 @@ async def get_community_stats():
         active_participants = [p for p in data.get("participants", []) if p.get("status") == "active"]
         total_participants = len(data.get("participants", []))
         
-        # Создаем рейтинг участников
-        participants_ranking = []
+        if around_user_id is not None:
+            rank = await game_data.get_leaderboard_rank(around_user_id)
+            if rank is None:
+                raise HTTPException(status_code=404, detail="Участник не найден в рейтинге")
+            offset = max(rank - 1 - radius, 0)
+            limit = rank + radius - offset
+        leaderboard = await game_data.get_leaderboard(offset, limit)
         
-        for participant in active_participants:
-            user_id = participant["user_id"]
-            user_reports = [r for r in data.get("reports", []) if r["user_id"] == user_id]
-            
-            # Подсчитываем статистику
-            reports_count = len(user_reports)
-            has_today_report = any(r["day"] == current_day for r in user_reports)
-            
-            # Считаем средний прогресс по целям
-            goals = participant.get("goals", [""] * 10)
-            total_progress_days = 0
-            active_goals = 0
-            
-            for i, goal in enumerate(goals):
-                if not goal.strip():
-                    continue
-                active_goals += 1
-                
-                for report in user_reports:
-                    progress = report["progress"][i] if i < len(report["progress"]) else ""
-                    if progress and progress.strip() and progress not in ["Отдых", "❌ Не выполнено"]:
-                        total_progress_days += 1
-            
-            avg_progress = (total_progress_days / max(active_goals * current_day, 1)) * 100 if active_goals > 0 else 0
-            
-            # Подсчитываем дни активности (количество отчетов)
-            activity_score = reports_count
-            
+        participants_ranking = []
+        for entry in leaderboard["entries"]:
+            user_id = entry["user_id"]
+            participant = game_data.find_participant(user_id, data) or {}
+            active_goals = entry["active_goals"]
+            avg_progress = (entry["progress_days"] / max(active_goals * current_day, 1)) * 100 if active_goals > 0 else 0
             participants_ranking.append({
                 "user_id": user_id,
                 "game_name": participant.get("game_name", participant.get("full_name", f"ID {user_id}")),
                 "username": participant.get("username", ""),
-                "reports_count": reports_count,
-                "has_today_report": has_today_report,
+                "reports_count": entry["reports_count"],
+                "has_today_report": game_data.has_report(user_id, current_day, data),
                 "avg_progress": round(avg_progress, 1),
-                "activity_score": activity_score,
+                "activity_score": entry["reports_count"],
                 "active_goals": active_goals,
+                "rank": entry["rank"],
             })
         
-        # Сортируем по активности (количество отчетов) и среднему прогрессу
-        participants_ranking.sort(key=lambda x: (x["activity_score"], x["avg_progress"]), reverse=True)
-        
-        # Добавляем позицию в рейтинге
-        for idx, p in enumerate(participants_ranking):
-            p["rank"] = idx + 1
-        
         return CommunityStatsResponse(
             current_day=current_day,
             active_participants=len(active_participants),
             total_participants=total_participants,
-            participants_ranking=participants_ranking
+            participants_ranking=participants_ranking,
+            ranking_total=leaderboard["total"],
+            ranking_offset=offset,
         )
+    except HTTPException:
+        raise
     except Exception as e:
         logger.error(f"Ошибка при получении статистики комьюнити: {e}")
         raise HTTPException(status_code=500, detail=str(e))
@@ -454,11 +558,12 @@ async def get_bot_status(admin: str = Depends(verify_admin)):
 
         # Кто без отчета на текущий момент
         users_without_report = []
+        reported_today = game_data.get_day_report_user_ids(current_day, data)
         for participant in data.get("participants", []):
             if participant.get("status") != "active":
                 continue
             uid = participant.get("user_id")
-            if not any(r.get("user_id") == uid and r.get("day") == current_day for r in data.get("reports", [])):
+            if uid not in reported_today:
                 users_without_report.append({
                     "user_id": uid,
                     "game_name": participant.get("game_name", participant.get("full_name", f"ID {uid}")),
@@ -476,6 +581,11 @@ async def get_bot_status(admin: str = Depends(verify_admin)):
             "thread_id": chat_config.get("thread_id"),
             "users_without_report_count": len(users_without_report),
             "users_without_report": users_without_report[:50],
+            "sync": game_data.get_sync_status(),
+            "last_runs": {
+                "reminders": await scheduler.get_last_run("reminders"),
+                "removal": await scheduler.get_last_run("removal"),
+            },
         }
     except Exception as e:
         logger.error(f"Ошибка при получении статуса бота: {e}")
@@ -491,14 +601,19 @@ async def get_admin_stats(admin: str = Depends(verify_admin)):
         
         active_users = sum(1 for p in data.get("participants", []) if p.get("status") == "active")
         total_users = len(data.get("participants", []))
-        reports_today = sum(1 for r in data.get("reports", []) if r.get("day") == current_day)
+        reports_today = len(game_data.get_day_report_user_ids(current_day, data))
         
         return {
             "current_day": current_day,
             "active_users": active_users,
             "total_users": total_users,
             "reports_today": reports_today,
-            "reports_percentage": (reports_today / active_users * 100) if active_users > 0 else 0
+            "reports_percentage": (reports_today / active_users * 100) if active_users > 0 else 0,
+            "data_cache": game_data.get_cache_stats(),
+            "excel_jobs": excel_io.get_metrics(),
+            "response_cache": {**_response_cache_state, "entries": len(_response_cache)},
+            "outbox": await outbox.get_stats(),
+            "auth_tokens": await auth_tokens.get_stats()
         }
     except Exception as e:
         logger.error(f"Ошибка при получении статистики: {e}")
@@ -522,9 +637,10 @@ async def trigger_remind(admin: str = Depends(verify_admin)):
             thread_id = await get_bot_thread_id()
             
             # Отправляем напоминания
-            await check_and_remind_users(bot, chat_id, thread_id)
+            # Напоминания ставятся в очередь, отправляет их воркер очереди в процессе бота
+            result = await check_and_remind_users(bot, chat_id, thread_id)
             
-            return {"message": "Напоминания отправлены всем участникам"}
+            return {"message": "Напоминания поставлены в очередь", **result}
         finally:
             # Закрываем сессию бота
             await bot.session.close()
@@ -534,8 +650,11 @@ async def trigger_remind(admin: str = Depends(verify_admin)):
 
 
 @app.post("/api/admin/remove-inactive")
-async def trigger_remove_inactive(admin: str = Depends(verify_admin)):
-    """Исключить неактивных участников прямо сейчас (только для админа)"""
+async def trigger_remove_inactive(dry_run: bool = False, admin: str = Depends(verify_admin)):
+    """Исключить неактивных участников прямо сейчас (только для админа).
+
+    dry_run=true — показать, кто был бы исключен и сколько длится проход, ничего не меняя.
+    """
     try:
         from aiogram import Bot
         from services.reminders import check_and_remove_inactive_users, get_bot_thread_id
@@ -545,10 +664,21 @@ async def trigger_remove_inactive(admin: str = Depends(verify_admin)):
         try:
             chat_id = await get_game_chat_id()
             thread_id = await get_bot_thread_id()
-            await check_and_remove_inactive_users(bot, chat_id, thread_id)
-            return {"message": "Проверка выполнена. Неактивные участники исключены (если были)."}
+            result = await check_and_remove_inactive_users(bot, chat_id, thread_id, dry_run=dry_run)
+            if result.get("too_early"):
+                raise HTTPException(
+                    status_code=409,
+                    detail=(f"Время исключения еще не наступило: по времени бота сейчас {result['bot_time']}, "
+                            f"исключение не раньше {result['removal_time']}. "
+                            "Чтобы посмотреть, кто был бы исключен, используйте dry_run=true."),
+                )
+            if dry_run:
+                return {"message": "Предварительный просмотр: участники не исключены.", **result}
+            return {"message": "Проверка выполнена. Неактивные участники исключены (если были).", **result}
         finally:
             await bot.session.close()
+    except HTTPException:
+        raise
     except Exception as e:
         logger.error(f"Ошибка при исключении неактивных: {e}")
         raise HTTPException(status_code=500, detail=str(e))
@@ -599,26 +729,13 @@ async def generate_auth_token(request: TokenGenerateRequest):
         
         # Проверяем, что пользователь существует
         data = await game_data.get_all_data()
-        user_exists = any(p["user_id"] == user_id for p in data.get("participants", []))
+        user_exists = game_data.is_user_registered(user_id, data)
         
         if not user_exists:
             raise HTTPException(status_code=404, detail="Пользователь не найден")
         
-        # Генерируем токен
-        token = secrets.token_urlsafe(32)
-        expires_at = datetime.now() + timedelta(hours=24)  # Токен действителен 24 часа
-        
-        # Сохраняем токен
-        auth_tokens[token] = {
-            "user_id": user_id,
-            "expires_at": expires_at
-        }
-        
-        # Очищаем старые токены
-        now = datetime.now()
-        expired_tokens = [t for t, data in auth_tokens.items() if data["expires_at"] < now]
-        for t in expired_tokens:
-            del auth_tokens[t]
+        # Генерируем и сохраняем токен (действителен 24 часа; истекшие удаляет фоновая очистка)
+        token, expires_at = await auth_tokens.issue(user_id)
         
         # Получаем URL сайта из переменной окружения или используем дефолтный
         web_url = os.getenv("WEB_URL", "http://192.168.3.2:3000")
@@ -639,25 +756,12 @@ async def generate_auth_token(request: TokenGenerateRequest):
 async def verify_auth_token(token: str):
     """Проверяет токен аутентификации и возвращает данные пользователя"""
     try:
-        if token not in auth_tokens:
-            raise HTTPException(status_code=401, detail="Токен не найден или истек")
-        
-        token_data = auth_tokens[token]
-        
-        # Проверяем срок действия
-        if token_data["expires_at"] < datetime.now():
-            del auth_tokens[token]
-            raise HTTPException(status_code=401, detail="Токен истек")
+        user_id = await _token_user_id(token)
         
         # Получаем данные пользователя
         data = await game_data.get_all_data()
-        user_id = token_data["user_id"]
         
-        participant = None
-        for p in data.get("participants", []):
-            if p["user_id"] == user_id:
-                participant = p
-                break
+        participant = game_data.find_participant(user_id, data)
         
         if not participant:
             raise HTTPException(status_code=404, detail="Пользователь не найден")
@@ -680,12 +784,9 @@ async def verify_auth_token(token: str):
 async def create_participant(participant: ParticipantCreate, admin: str = Depends(verify_admin)):
     """Создать нового участника (только для админа)"""
     try:
-        data = await game_data.get_all_data()
-        
         # Проверяем, не существует ли уже участник с таким user_id
-        for p in data.get("participants", []):
-            if p["user_id"] == participant.user_id:
-                raise HTTPException(status_code=400, detail="Участник с таким ID уже существует")
+        if await game_data.get_participant(participant.user_id):
+            raise HTTPException(status_code=400, detail="Участник с таким ID уже существует")
         
         new_participant = {
             "user_id": participant.user_id,
@@ -697,8 +798,7 @@ async def create_participant(participant: ParticipantCreate, admin: str = Depend
             "goals": participant.goals if len(participant.goals) == 10 else participant.goals + [""] * (10 - len(participant.goals))
         }
         
-        data["participants"].append(new_participant)
-        await game_data.save_data(data, sync_to_main=True)
+        await game_data.upsert_participant(new_participant, sync_to_main=True)
         
         return ParticipantResponse(**new_participant)
     except HTTPException:
@@ -712,24 +812,18 @@ async def create_participant(participant: ParticipantCreate, admin: str = Depend
 async def update_participant(user_id: int, participant_update: ParticipantUpdate, admin: str = Depends(verify_admin)):
     """Обновить данные участника (только для админа)"""
     try:
-        data = await game_data.get_all_data()
-        
-        participant = None
-        for i, p in enumerate(data.get("participants", [])):
-            if p["user_id"] == user_id:
-                participant = p
-                if participant_update.game_name is not None:
-                    p["game_name"] = participant_update.game_name
-                if participant_update.status is not None:
-                    p["status"] = participant_update.status
-                if participant_update.goals is not None:
-                    p["goals"] = participant_update.goals if len(participant_update.goals) == 10 else participant_update.goals + [""] * (10 - len(participant_update.goals))
-                break
-        
+        participant = await game_data.get_participant(user_id)
         if not participant:
             raise HTTPException(status_code=404, detail="Участник не найден")
         
-        await game_data.save_data(data, sync_to_main=True)
+        if participant_update.game_name is not None:
+            participant["game_name"] = participant_update.game_name
+        if participant_update.status is not None:
+            participant["status"] = participant_update.status
+        if participant_update.goals is not None:
+            participant["goals"] = participant_update.goals if len(participant_update.goals) == 10 else participant_update.goals + [""] * (10 - len(participant_update.goals))
+        
+        await game_data.upsert_participant(participant, sync_to_main=True)
         return ParticipantResponse(**participant)
     except HTTPException:
         raise
@@ -742,20 +836,10 @@ async def update_participant(user_id: int, participant_update: ParticipantUpdate
 async def delete_participant(user_id: int, admin: str = Depends(verify_admin)):
     """Удалить участника (только для админа)"""
     try:
-        data = await game_data.get_all_data()
-        
-        # Считаем, был ли участник в исходном списке до фильтрации
-        original_count = len(data.get("participants", []))
-        data["participants"] = [p for p in data.get("participants", []) if p["user_id"] != user_id]
-        participant_found = len(data["participants"]) < original_count
-        
-        # Удаляем также все отчеты участника
-        data["reports"] = [r for r in data.get("reports", []) if r["user_id"] != user_id]
-        
-        if not participant_found:
+        # Удаляем участника вместе со всеми его отчетами
+        if not await game_data.delete_participant(user_id):
             raise HTTPException(status_code=404, detail="Участник не найден")
         
-        await game_data.save_data(data, sync_to_main=True)
         return {"message": "Участник удален"}
     except HTTPException:
         raise
@@ -769,17 +853,13 @@ async def delete_participant(user_id: int, admin: str = Depends(verify_admin)):
 async def create_report(report: ReportCreate, admin: str = Depends(verify_admin)):
     """Создать отчет (только для админа)"""
     try:
-        data = await game_data.get_all_data()
-        
         # Проверяем, существует ли участник
-        participant_exists = any(p["user_id"] == report.user_id for p in data.get("participants", []))
-        if not participant_exists:
+        if not await game_data.get_participant(report.user_id):
             raise HTTPException(status_code=404, detail="Участник не найден")
         
         # Проверяем, нет ли уже отчета за этот день
-        for r in data.get("reports", []):
-            if r["user_id"] == report.user_id and r["day"] == report.day:
-                raise HTTPException(status_code=400, detail="Отчет за этот день уже существует")
+        if await game_data.get_report(report.user_id, report.day):
+            raise HTTPException(status_code=400, detail="Отчет за этот день уже существует")
         
         new_report = {
             "user_id": report.user_id,
@@ -789,8 +869,7 @@ async def create_report(report: ReportCreate, admin: str = Depends(verify_admin)
             "rest_day": report.rest_day
         }
         
-        data["reports"].append(new_report)
-        await game_data.save_data(data, sync_to_main=True)
+        await game_data.upsert_report(new_report, sync_to_main=True)
         
         return ReportResponse(**new_report)
     except HTTPException:
@@ -804,22 +883,16 @@ async def create_report(report: ReportCreate, admin: str = Depends(verify_admin)
 async def update_report(user_id: int, day: int, report_update: ReportUpdate, admin: str = Depends(verify_admin)):
     """Обновить отчет (только для админа)"""
     try:
-        data = await game_data.get_all_data()
-        
-        report = None
-        for r in data.get("reports", []):
-            if r["user_id"] == user_id and r["day"] == day:
-                report = r
-                if report_update.progress is not None:
-                    r["progress"] = report_update.progress if len(report_update.progress) == 10 else report_update.progress + [""] * (10 - len(report_update.progress))
-                if report_update.rest_day is not None:
-                    r["rest_day"] = report_update.rest_day
-                break
-        
+        report = await game_data.get_report(user_id, day)
         if not report:
             raise HTTPException(status_code=404, detail="Отчет не найден")
         
-        await game_data.save_data(data, sync_to_main=True)
+        if report_update.progress is not None:
+            report["progress"] = report_update.progress if len(report_update.progress) == 10 else report_update.progress + [""] * (10 - len(report_update.progress))
+        if report_update.rest_day is not None:
+            report["rest_day"] = report_update.rest_day
+        
+        await game_data.upsert_report(report, sync_to_main=True)
         return ReportResponse(**report)
     except HTTPException:
         raise
@@ -832,17 +905,9 @@ async def update_report(user_id: int, day: int, report_update: ReportUpdate, adm
 async def delete_report(user_id: int, day: int, admin: str = Depends(verify_admin)):
     """Удалить отчет (только для админа)"""
     try:
-        data = await game_data.get_all_data()
-        
-        report_found = False
-        original_count = len(data.get("reports", []))
-        data["reports"] = [r for r in data.get("reports", []) if not (r["user_id"] == user_id and r["day"] == day)]
-        report_found = len(data["reports"]) < original_count
-        
-        if not report_found:
+        if not await game_data.delete_report(user_id, day):
             raise HTTPException(status_code=404, detail="Отчет не найден")
         
-        await game_data.save_data(data, sync_to_main=True)
         return {"message": "Отчет удален"}
     except HTTPException:
         raise
@@ -853,11 +918,29 @@ async def delete_report(user_id: int, day: int, admin: str = Depends(verify_admi
 
 # Экспорт/импорт данных
 @app.get("/api/admin/export")
-async def export_data(admin: str = Depends(verify_admin)):
-    """Экспортировать все данные в JSON (только для админа)"""
+async def export_data(
+    format: str = Query("json", description="json / ndjson / csv"),
+    entity: str = Query("reports", description="Сущность для csv: participants / reports"),
+    day_from: Optional[int] = Query(None, ge=1),
+    day_to: Optional[int] = Query(None, ge=1),
+    gzip: bool = False,
+    admin: str = Depends(verify_admin),
+):
+    """Экспортировать данные потоком (только для админа).
+
+    Строки читаются из БД курсором и отдаются по мере сериализации. json — прежний объект
+    со всеми данными, ndjson — по записи на строку, csv — таблица одной сущности.
+    """
+    if format not in data_export.FORMATS:
+        raise HTTPException(status_code=400, detail=f"Формат должен быть одним из: {', '.join(data_export.FORMATS)}")
+    if entity not in data_export.ENTITIES:
+        raise HTTPException(status_code=400, detail=f"Сущность должна быть одной из: {', '.join(data_export.ENTITIES)}")
     try:
-        data = await game_data.get_all_data()
-        return JSONResponse(content=data)
+        body = await game_data.export_stream(fmt=format, entity=entity, day_from=day_from, day_to=day_to, compress=gzip)
+        name = data_export.filename(format, entity, gzip, datetime.now().strftime("%Y-%m-%d"))
+        headers = {"Content-Disposition": f'attachment; filename="{name}"'}
+        media_type = "application/gzip" if gzip else data_export.MEDIA_TYPES[format]
+        return StreamingResponse(body, media_type=media_type, headers=headers)
     except Exception as e:
         logger.error(f"Ошибка при экспорте данных: {e}")
         raise HTTPException(status_code=500, detail=str(e))
@@ -865,14 +948,19 @@ async def export_data(admin: str = Depends(verify_admin)):
 
 @app.post("/api/admin/import")
 async def import_data(data: Dict[str, Any], admin: str = Depends(verify_admin)):
-    """Импортировать данные из JSON (только для админа)"""
+    """Импортировать данные из JSON (только для админа).
+
+    Строки проверяются и записываются upsert'ом одной транзакцией, как в массовом импорте:
+    участники и отчеты, которых нет в файле, остаются как есть.
+    """
     try:
         # Валидация структуры данных
         if "participants" not in data or "reports" not in data:
             raise HTTPException(status_code=400, detail="Неверный формат данных")
         
-        await game_data.save_data(data, sync_to_main=True)
-        return {"message": "Данные импортированы успешно"}
+        parsed = data_import.parse_document(data)
+        result = await game_data.bulk_import(parsed, sync_to_main=True)
+        return {"message": "Данные импортированы успешно", **result}
     except HTTPException:
         raise
     except Exception as e:
@@ -880,6 +968,39 @@ async def import_data(data: Dict[str, Any], admin: str = Depends(verify_admin)):
         raise HTTPException(status_code=500, detail=str(e))
 
 
+_IMPORT_SPOOL_SIZE = 8 * 1024 * 1024
+
+
+@app.post("/api/admin/import/bulk")
+async def bulk_import_data(
+    request: Request,
+    format: str = Query("ndjson", description="ndjson / csv (можно сжатые gzip)"),
+    entity: str = Query("reports", description="Сущность для csv и строк ndjson без поля type"),
+    dry_run: bool = False,
+    admin: str = Depends(verify_admin),
+):
+    """Массовый импорт из NDJSON/CSV (только для админа).
+
+    Тело читается потоком во временный файл, каждая строка проверяется, корректные строки
+    записываются одной транзакцией (upsert), ошибки возвращаются по номерам строк.
+    dry_run=true — только проверка.
+    """
+    if format not in data_import.FORMATS:
+        raise HTTPException(status_code=400, detail=f"Формат должен быть одним из: {', '.join(data_import.FORMATS)}")
+    if entity not in data_import.ENTITIES:
+        raise HTTPException(status_code=400, detail=f"Сущность должна быть одной из: {', '.join(data_import.ENTITIES)}")
+    try:
+        with tempfile.SpooledTemporaryFile(max_size=_IMPORT_SPOOL_SIZE) as upload:
+            async for chunk in request.stream():
+                upload.write(chunk)
+            upload.seek(0)
+            parsed = await asyncio.to_thread(data_import.parse, upload, format, entity)
+        return await game_data.bulk_import(parsed, dry_run=dry_run)
+    except Exception as e:
+        logger.error(f"Ошибка при массовом импорте: {e}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+
 # Управление днем игры
 @app.post("/api/admin/game-day")
 async def set_game_day(day_update: GameDayUpdate, admin: str = Depends(verify_admin)):
@@ -912,23 +1033,20 @@ async def create_user_report(
         if report.user_id != user_id:
             raise HTTPException(status_code=403, detail="Нельзя создавать отчеты за другого пользователя")
         
-        data = await game_data.get_all_data()
         current_day = await game_data.get_current_day_async()
         
         # Проверяем, существует ли участник
-        participant_exists = any(p["user_id"] == report.user_id for p in data.get("participants", []))
-        if not participant_exists:
+        participant = await game_data.get_participant(report.user_id)
+        if not participant:
             raise HTTPException(status_code=404, detail="Участник не найден")
         
         # Проверяем, что участник активен
-        participant = next(p for p in data.get("participants", []) if p["user_id"] == report.user_id)
         if participant.get("status") != "active":
             raise HTTPException(status_code=400, detail="Участник не активен")
         
         # Проверяем, нет ли уже отчета за этот день
-        for r in data.get("reports", []):
-            if r["user_id"] == report.user_id and r["day"] == report.day:
-                raise HTTPException(status_code=400, detail="Отчет за этот день уже существует")
+        if await game_data.get_report(report.user_id, report.day):
+            raise HTTPException(status_code=400, detail="Отчет за этот день уже существует")
         
         # Проверяем, что день не превышает текущий день игры
         if report.day > current_day:
@@ -942,8 +1060,7 @@ async def create_user_report(
             "rest_day": report.rest_day
         }
         
-        data["reports"].append(new_report)
-        await game_data.save_data(data, sync_to_main=True)
+        await game_data.upsert_report(new_report, sync_to_main=True)
         
         return ReportResponse(**new_report)
     except HTTPException:
@@ -961,27 +1078,22 @@ async def update_user_report(
 ):
     """Обновить отчет участника"""
     try:
-        data = await game_data.get_all_data()
         current_day = await game_data.get_current_day_async()
         
         # Проверяем, что день не превышает текущий день игры
         if day > current_day:
             raise HTTPException(status_code=400, detail=f"Нельзя обновить отчет за день больше текущего ({current_day})")
         
-        report = None
-        for r in data.get("reports", []):
-            if r["user_id"] == user_id and r["day"] == day:
-                report = r
-                if report_update.progress is not None:
-                    r["progress"] = report_update.progress if len(report_update.progress) == 10 else report_update.progress + [""] * (10 - len(report_update.progress))
-                if report_update.rest_day is not None:
-                    r["rest_day"] = report_update.rest_day
-                break
-        
+        report = await game_data.get_report(user_id, day)
         if not report:
             raise HTTPException(status_code=404, detail="Отчет не найден")
         
-        await game_data.save_data(data, sync_to_main=True)
+        if report_update.progress is not None:
+            report["progress"] = report_update.progress if len(report_update.progress) == 10 else report_update.progress + [""] * (10 - len(report_update.progress))
+        if report_update.rest_day is not None:
+            report["rest_day"] = report_update.rest_day
+        
+        await game_data.upsert_report(report, sync_to_main=True)
         return ReportResponse(**report)
     except HTTPException:
         raise
@@ -997,21 +1109,15 @@ async def update_user_goals(
 ):
     """Обновить цели участника"""
     try:
-        data = await game_data.get_all_data()
-        
-        participant = None
-        for i, p in enumerate(data.get("participants", [])):
-            if p["user_id"] == user_id:
-                participant = p
-                # Разрешаем обновлять только цели
-                if goals_update.goals is not None:
-                    p["goals"] = goals_update.goals if len(goals_update.goals) == 10 else goals_update.goals + [""] * (10 - len(goals_update.goals))
-                break
-        
+        participant = await game_data.get_participant(user_id)
         if not participant:
             raise HTTPException(status_code=404, detail="Участник не найден")
         
-        await game_data.save_data(data, sync_to_main=True)
+        # Разрешаем обновлять только цели
+        if goals_update.goals is not None:
+            participant["goals"] = goals_update.goals if len(goals_update.goals) == 10 else goals_update.goals + [""] * (10 - len(goals_update.goals))
+        
+        await game_data.upsert_participant(participant, sync_to_main=True)
         return ParticipantResponse(**participant)
     except HTTPException:
         raise
@@ -1059,22 +1165,14 @@ async def agree_to_start_game(
     """Согласиться на начало игры"""
     try:
         # Проверяем токен
-        if request.token not in auth_tokens:
-            raise HTTPException(status_code=401, detail="Токен не найден или истек")
-        
-        token_data = auth_tokens[request.token]
-        if token_data["expires_at"] < datetime.now():
-            del auth_tokens[request.token]
-            raise HTTPException(status_code=401, detail="Токен истек")
-        
-        if token_data["user_id"] != request.user_id:
+        if await _token_user_id(request.token) != request.user_id:
             raise HTTPException(status_code=403, detail="Неверный user_id для токена")
         
         data = await game_data.get_all_data()
         settings = await game_data.get_settings()
         
         # Проверяем, что пользователь существует
-        participant_exists = any(p["user_id"] == request.user_id for p in data.get("participants", []))
+        participant_exists = game_data.is_user_registered(request.user_id, data)
         if not participant_exists:
             raise HTTPException(status_code=404, detail="Участник не найден")
         
@@ -2,11 +2,13 @@ import asyncio
 import logging
 import sys
 from aiogram import Bot, Dispatcher
-from aiogram.fsm.storage.memory import MemoryStorage
 from config_reader import config
 from handlers import common, registration, goals, reports, admin, group
 from handlers.group import get_game_chat_id
-from services.reminders import get_bot_thread_id, reminder_loop
+from services.reminders import get_bot_thread_id, start_reminder_scheduler, stop_reminder_scheduler
+from services.game_data import get_game_data
+from services import outbox
+from services.fsm_storage import SQLiteStorage
 
 # Настройка логирования
 logging.basicConfig(
@@ -21,7 +23,9 @@ logging.basicConfig(
 async def main():
     # Создаем бота и диспетчер
     bot = Bot(token=config.bot_token.get_secret_value())
-    dp = Dispatcher(storage=MemoryStorage())
+    # Состояния диалогов хранятся в локальной БД и переживают перезапуск
+    storage = SQLiteStorage()
+    dp = Dispatcher(storage=storage)
     
     # Подключаем роутеры
     dp.include_router(common.router)
@@ -31,6 +35,15 @@ async def main():
     dp.include_router(admin.router)
     dp.include_router(group.router)
     
+    # Запускаем общий сервис данных: локальная БД (долгоживущие соединения) и выбор процесса,
+    # который выгружает данные на Я.Диск (бот и API работают с одной БД)
+    game_data = get_game_data()
+    await game_data.start()
+    await storage.prune()
+    
+    # Воркер очереди исходящих сообщений (напоминания, уведомления об исключении)
+    outbox.start_worker(bot)
+    
     # Удаляем вебхук и пропускаем накопленные обновления
     await bot.delete_webhook(drop_pending_updates=True)
     
@@ -39,12 +52,19 @@ async def main():
     thread_id = await get_bot_thread_id()
     if chat_id and thread_id:
         logging.info(f"Найден настроенный чат {chat_id} и тред {thread_id}")
-        # Запускаем цикл напоминаний в фоне
-        asyncio.create_task(reminder_loop(bot, chat_id, thread_id))
+        # Запускаем планировщик напоминаний в фоне
+        start_reminder_scheduler(bot, chat_id, thread_id)
     
     # Запускаем поллинг
     logging.info("Бот запущен!")
-    await dp.start_polling(bot)
+    try:
+        await dp.start_polling(bot)
+    finally:
+        # Остановка (Ctrl-C, SIGTERM контейнера): останавливаем напоминания и исключения, доотправляем
+        # начатые сообщения, выгружаем отложенные изменения на Я.Диск и только потом закрываем HTTP-сессию и БД
+        await stop_reminder_scheduler()
+        await outbox.stop_worker()
+        await game_data.stop()
 
 
 if __name__ == "__main__":
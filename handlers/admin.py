@@ -2,11 +2,11 @@ from aiogram import Router, F, Bot
 from aiogram.filters import Command
 from aiogram.types import Message
 from aiogram.filters import CommandObject
-from services.game_data import GameDataManager
+from services.game_data import get_game_data
 from config_reader import config
 
 router = Router()
-game_data = GameDataManager()
+game_data = get_game_data()
 
 
 def is_admin(user_id: int) -> bool:
@@ -54,7 +54,7 @@ async def cmd_admin_stats(message: Message):
     data = await game_data.get_all_data()
     active_users = sum(1 for p in data["participants"] if p["status"] == "active")
     total_users = len(data["participants"])
-    current_day = game_data.get_current_day()
+    current_day = await game_data.get_current_day_async()
     
     stats_text = f"""
 📊 <b>Статистика игры</b>
@@ -70,7 +70,7 @@ async def cmd_admin_stats(message: Message):
 """
     
     # Считаем отчеты за сегодня
-    reports_today = sum(1 for r in data["reports"] if r["day"] == current_day)
+    reports_today = len(game_data.get_day_report_user_ids(current_day, data))
     stats_text += f"• Отправлено: {reports_today}/{active_users}"
     
     await message.answer(stats_text, parse_mode="HTML")
@@ -106,8 +106,11 @@ async def cmd_admin_remind(message: Message, bot: Bot):
     chat_id = await get_game_chat_id()
     thread_id = await get_bot_thread_id()
     
-    await check_and_remind_users(bot, chat_id, thread_id)
-    await message.answer("✅ Напоминания отправлены всем участникам.")
+    result = await check_and_remind_users(bot, chat_id, thread_id)
+    await message.answer(
+        f"✅ Напоминания поставлены в очередь: {result['enqueued']} "
+        f"(уже отправлялись сегодня: {result['duplicates']})."
+    )
 
 
 @router.message(Command("time"))
@@ -144,8 +147,7 @@ async def cmd_set_group(message: Message, bot: Bot, command: CommandObject = Non
         return
     
     from handlers.group import set_game_chat_id, get_or_create_bot_thread
-    from services.reminders import set_bot_thread_id, reminder_loop
-    import asyncio
+    from services.reminders import set_bot_thread_id, start_reminder_scheduler
     
     # Проверяем, есть ли аргументы команды
     if command and command.args:
@@ -207,16 +209,15 @@ async def cmd_set_group(message: Message, bot: Bot, command: CommandObject = Non
                 await set_game_chat_id(chat_id)
                 await set_bot_thread_id(thread_id)
                 
-                # Перезапускаем цикл напоминаний
-                # Старый цикл продолжит работать, но новый будет использовать новые настройки
-                asyncio.create_task(reminder_loop(bot, chat_id, thread_id))
+                # Планировщик один на процесс: запускаем или переключаем его на новый чат
+                start_reminder_scheduler(bot, chat_id, thread_id)
                 
                 await message.answer(
                     f"✅ <b>Чат и тред установлены!</b>\n\n"
                     f"• <b>Chat ID:</b> {chat_id}\n"
                     f"• <b>Thread ID:</b> {thread_id}\n\n"
                     f"Бот теперь будет отправлять напоминания в этот чат.\n"
-                    f"Цикл напоминаний перезапущен с новыми настройками.",
+                    f"Планировщик напоминаний использует новые настройки.",
                     parse_mode="HTML"
                 )
             else:
@@ -271,7 +272,7 @@ async def cmd_startup_test(message: Message, bot: Bot):
             test_results.append("⚠️ Пользователь не зарегистрирован")
         
         # 3. Проверка текущего дня
-        current_day = game_data.get_current_day()
+        current_day = await game_data.get_current_day_async()
         test_results.append(f"✅ Текущий день: {current_day}/90")
         
         # 4. Тест отправки сообщения пользователю
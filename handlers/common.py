@@ -3,11 +3,12 @@ from aiogram.filters import Command, StateFilter
 from aiogram.fsm.context import FSMContext
 from aiogram.types import Message
 from keyboards.common import get_main_menu
-from services.game_data import GameDataManager
+from services.game_data import get_game_data
+from services.local_store import is_progress
 import logging
 
 router = Router()
-game_data = GameDataManager()
+game_data = get_game_data()
 
 
 @router.message(Command("start"))
@@ -101,10 +102,8 @@ async def cmd_start(message: Message, state: FSMContext):
 @router.message(Command("time"))
 async def cmd_time_user(message: Message):
     """Показывает текущее время бота для обычных пользователей"""
-    from services.game_data import GameDataManager
     from datetime import datetime, timedelta
     
-    game_data = GameDataManager()
     settings = await game_data.get_settings()
     
     # Вычисляем время бота с учетом смещения
@@ -173,23 +172,23 @@ async def cmd_stats(message: Message):
         return
     
     # Находим пользователя
-    user_data = None
-    for participant in data["participants"]:
-        if participant["user_id"] == user_id:
-            user_data = participant
-            break
+    user_data = game_data.find_participant(user_id, data)
     
     if not user_data:
         await message.answer("Ошибка: данные пользователя не найдены.")
         return
     
-    # Считаем статистику по отчетам
-    user_reports = [r for r in data["reports"] if r["user_id"] == user_id]
-    reports_count = len(user_reports)
-    current_day = game_data.get_current_day()
+    # Статистика по отчетам — из агрегатов, которые обновляются при записи отчетов
+    progress_stats = await game_data.get_progress_stats(user_id)
+    reports_count = progress_stats[1]["reports_count"] if progress_stats else 0
+    current_day = await game_data.get_current_day_async()
+    
+    # Отчеты за дни после текущего (внесенные заранее) не считаются днями без прогресса
+    future_reports = [report for report in game_data.get_user_reports(user_id, data)
+                      if report["day"] > current_day and not report.get("rest_day", False)]
     
     # Проверяем отчет за сегодня
-    has_today_report = any(r["day"] == current_day for r in user_reports)
+    has_today_report = game_data.has_report(user_id, current_day, data)
     
     # Находим дату регистрации
     reg_date_str = user_data.get("registered_date", "")
@@ -213,22 +212,14 @@ async def cmd_stats(message: Message):
             continue
         
         active_goals_count += 1
-        goal_progress_days = 0
-        goal_rest_days = 0
-        goal_no_progress_days = 0
-        last_progress_day = 0
-        
-        for report in user_reports:
-            progress = report["progress"][i] if i < len(report["progress"]) else ""
-            is_rest_day = report.get("rest_day", False)
-            
-            if is_rest_day:
-                goal_rest_days += 1
-            elif progress and progress.strip() and progress not in ["Отдых", "❌ Не выполнено"]:
-                goal_progress_days += 1
-                last_progress_day = max(last_progress_day, report["day"])
-            elif report["day"] <= current_day:
-                goal_no_progress_days += 1
+        goal_stats = progress_stats.get(i + 1, {})
+        goal_progress_days = goal_stats.get("progress_days", 0)
+        goal_rest_days = goal_stats.get("rest_days", 0)
+        goal_no_progress_days = reports_count - goal_rest_days - goal_progress_days - sum(
+            1 for report in future_reports
+            if not is_progress(report["progress"][i] if i < len(report["progress"]) else "")
+        )
+        last_progress_day = goal_stats.get("last_progress_day", 0)
         
         total_progress_days += goal_progress_days
         
@@ -4,10 +4,10 @@ from aiogram.types import Message, CallbackQuery
 from aiogram.fsm.context import FSMContext
 from states import GoalSettingStates
 from keyboards.common import get_main_menu, get_goals_menu, get_cancel_keyboard, get_edit_goals_keyboard
-from services.game_data import GameDataManager
+from services.game_data import get_game_data
 
 router = Router()
-game_data = GameDataManager()
+game_data = get_game_data()
 
 
 @router.message(Command("goals"))
@@ -64,11 +64,9 @@ async def callback_set_goals(callback: CallbackQuery, state: FSMContext):
         )
         return
     
-    # Начинаем установку целей - сохраняем данные в состоянии для переиспользования
-    await state.update_data(goals=goals, game_data=data)
-    await state.set_state(GoalSettingStates.setting_goal_1)
-    
+    # Начинаем установку с первой неустановленной цели; номер цели — в самом состоянии
     goal_num = next((i for i, g in enumerate(goals, 1) if not g.strip()), 1)
+    await state.set_state(_goal_state(goal_num))
     await callback.message.answer(
         f"🎯 <b>Установка цели #{goal_num}</b>\n\n"
         "Введите вашу цель. Помните: ставим самые смелые цели, от которых мурашки по коже бегут!\n\n"
@@ -120,7 +118,7 @@ async def callback_edit_specific_goal(callback: CallbackQuery, state: FSMContext
     current_goal = goals[goal_num - 1] if goals[goal_num - 1] else ""
     
     # Сохраняем номер цели для редактирования
-    await state.update_data(editing_goal_num=goal_num, game_data=data)
+    await state.update_data(editing_goal_num=goal_num)
     await state.set_state(GoalSettingStates.editing_goal)
     
     await callback.message.answer(
@@ -153,10 +151,6 @@ async def process_edited_goal(message: Message, state: FSMContext):
     user_id = message.from_user.id
     state_data = await state.get_data()
     goal_num = state_data.get("editing_goal_num")
-    data = state_data.get("game_data")
-    
-    if not data:
-        data = await game_data.get_all_data()
     
     if not goal_num or goal_num < 1 or goal_num > 10:
         await message.answer("Ошибка: неверный номер цели.")
@@ -164,8 +158,7 @@ async def process_edited_goal(message: Message, state: FSMContext):
         return
     
     # Сохраняем отредактированную цель
-    game_data.set_user_goal(user_id, goal_num, goal_text, data)
-    await game_data.save_data(data, sync_to_main=False)
+    await game_data.set_user_goals_async(user_id, {goal_num: goal_text}, sync_to_main=False)
     
     await message.answer(
         f"✅ <b>Цель #{goal_num} успешно обновлена!</b>\n\n"
@@ -179,8 +172,13 @@ async def process_edited_goal(message: Message, state: FSMContext):
 
 
 # Обработчики для установки целей по очереди
-async def handle_goal_input(message: Message, state: FSMContext, goal_num: int, next_state):
-    """Обрабатывает ввод цели"""
+def _goal_state(goal_num: int):
+    """Состояние ввода цели с номером goal_num"""
+    return getattr(GoalSettingStates, f"setting_goal_{goal_num}")
+
+
+async def handle_goal_input(message: Message, state: FSMContext, goal_num: int):
+    """Сохраняет введенную цель и спрашивает следующую неустановленную"""
     goal_text = message.text.strip()
     
     if len(goal_text) < 5:
@@ -189,32 +187,21 @@ async def handle_goal_input(message: Message, state: FSMContext, goal_num: int,
     
     user_id = message.from_user.id
     
-    # Получаем данные один раз и храним в состоянии
-    state_data = await state.get_data()
-    data = state_data.get("game_data")
-    
-    if not data:
-        # Если данных нет в состоянии, загружаем
-        data = await game_data.get_all_data()
-    
-    # Сохраняем цель в данные
-    game_data.set_user_goal(user_id, goal_num, goal_text, data)
-    
-    # Обновляем цели в состоянии
-    goals = state_data.get("goals", [])
-    if len(goals) < 10:
-        goals = [""] * 10
-    goals[goal_num - 1] = goal_text
-    
-    # Сохраняем обновленные данные в состояние (но НЕ на диск)
-    await state.update_data(goals=goals, game_data=data)
+    # Записываем только эту цель (без синхронизации с основным файлом): остальные цели берутся
+    # из БД, поэтому правки с сайта между шагами диалога не затираются
+    goals = await game_data.set_user_goals_async(user_id, {goal_num: goal_text}, sync_to_main=False)
+    if goals is None:
+        await state.clear()
+        await message.answer("Вы еще не зарегистрированы в игре!\n\nИспользуйте /register для регистрации.",
+                             reply_markup=get_main_menu())
+        return
     
     # Проверяем, остались ли не установленные цели
     unset_goals = [i for i, g in enumerate(goals, 1) if not g.strip()]
     
     if unset_goals:
         next_goal = unset_goals[0]
-        await state.set_state(next_state)
+        await state.set_state(_goal_state(next_goal))
         await message.answer(
             f"✅ Цель #{goal_num} установлена!\n\n"
             f"🎯 <b>Установка цели #{next_goal}</b>\n\n"
@@ -223,8 +210,6 @@ async def handle_goal_input(message: Message, state: FSMContext, goal_num: int,
             reply_markup=get_cancel_keyboard()
         )
     else:
-        # Все цели установлены - сохраняем на диск (без синхронизации с основным файлом)
-        await game_data.save_data(data, sync_to_main=False)
         await message.answer(
             "🎉 <b>Отлично! Все 10 целей установлены!</b>\n\n"
             "Теперь каждый день вы будете отправлять отчет о прогрессе по целям.\n\n"
@@ -237,53 +222,52 @@ async def handle_goal_input(message: Message, state: FSMContext, goal_num: int,
 
 @router.message(GoalSettingStates.setting_goal_1, F.text)
 async def process_goal_1(message: Message, state: FSMContext):
-    await handle_goal_input(message, state, 1, GoalSettingStates.setting_goal_2)
+    await handle_goal_input(message, state, 1)
 
 
 @router.message(GoalSettingStates.setting_goal_2, F.text)
 async def process_goal_2(message: Message, state: FSMContext):
-    await handle_goal_input(message, state, 2, GoalSettingStates.setting_goal_3)
+    await handle_goal_input(message, state, 2)
 
 
 @router.message(GoalSettingStates.setting_goal_3, F.text)
 async def process_goal_3(message: Message, state: FSMContext):
-    await handle_goal_input(message, state, 3, GoalSettingStates.setting_goal_4)
+    await handle_goal_input(message, state, 3)
 
 
 @router.message(GoalSettingStates.setting_goal_4, F.text)
 async def process_goal_4(message: Message, state: FSMContext):
-    await handle_goal_input(message, state, 4, GoalSettingStates.setting_goal_5)
+    await handle_goal_input(message, state, 4)
 
 
 @router.message(GoalSettingStates.setting_goal_5, F.text)
 async def process_goal_5(message: Message, state: FSMContext):
-    await handle_goal_input(message, state, 5, GoalSettingStates.setting_goal_6)
+    await handle_goal_input(message, state, 5)
 
 
 @router.message(GoalSettingStates.setting_goal_6, F.text)
 async def process_goal_6(message: Message, state: FSMContext):
-    await handle_goal_input(message, state, 6, GoalSettingStates.setting_goal_7)
+    await handle_goal_input(message, state, 6)
 
 
 @router.message(GoalSettingStates.setting_goal_7, F.text)
 async def process_goal_7(message: Message, state: FSMContext):
-    await handle_goal_input(message, state, 7, GoalSettingStates.setting_goal_8)
+    await handle_goal_input(message, state, 7)
 
 
 @router.message(GoalSettingStates.setting_goal_8, F.text)
 async def process_goal_8(message: Message, state: FSMContext):
-    await handle_goal_input(message, state, 8, GoalSettingStates.setting_goal_9)
+    await handle_goal_input(message, state, 8)
 
 
 @router.message(GoalSettingStates.setting_goal_9, F.text)
 async def process_goal_9(message: Message, state: FSMContext):
-    await handle_goal_input(message, state, 9, GoalSettingStates.setting_goal_10)
+    await handle_goal_input(message, state, 9)
 
 
 @router.message(GoalSettingStates.setting_goal_10, F.text)
 async def process_goal_10(message: Message, state: FSMContext):
-    await handle_goal_input(message, state, 10, None)
-    # После 10-й цели состояние очищается в handle_goal_input
+    await handle_goal_input(message, state, 10)
 
 
 # Обработка некорректного ввода при установке целей
@@ -3,14 +3,13 @@ from aiogram import Router, Bot
 from aiogram.filters import KICKED, LEFT, ADMINISTRATOR, MEMBER
 from aiogram.types import ChatMemberUpdated
 from aiogram.filters.chat_member_updated import ChatMemberUpdatedFilter, IS_MEMBER, IS_NOT_MEMBER
-from services.game_data import GameDataManager
-from services.reminders import set_bot_thread_id, reminder_loop
+from services.game_data import get_game_data
+from services.reminders import set_bot_thread_id, start_reminder_scheduler
 from config_reader import config
-import asyncio
 import logging
 
 router = Router()
-game_data = GameDataManager()
+game_data = get_game_data()
 
 # Глобальное хранилище для ID чата (можно улучшить, добавив в БД)
 _game_chat_id: int | None = None
@@ -170,8 +169,8 @@ async def bot_added_to_chat(event: ChatMemberUpdated, bot: Bot):
             await set_game_chat_id(chat_id)
             await set_bot_thread_id(thread_id)
             
-            # Запускаем цикл напоминаний для этого чата (если еще не запущен)
-            asyncio.create_task(reminder_loop(bot, chat_id, thread_id))
+            # Запускаем планировщик напоминаний (если уже запущен — он переключится на этот чат)
+            start_reminder_scheduler(bot, chat_id, thread_id)
         else:
             logging.error(f"Не удалось создать тред бота в чате {chat_id}")
     except Exception as e:
@@ -4,10 +4,10 @@ from aiogram.fsm.context import FSMContext
 from aiogram.types import Message, CallbackQuery
 from states import RegistrationStates
 from keyboards.common import get_main_menu, get_cancel_keyboard
-from services.game_data import GameDataManager
+from services.game_data import get_game_data
 
 router = Router()
-game_data = GameDataManager()
+game_data = get_game_data()
 
 
 @router.message(Command("register"))
@@ -48,11 +48,9 @@ async def process_name(message: Message, state: FSMContext):
     username = message.from_user.username or f"user_{user_id}"
     full_name = message.from_user.full_name or username
     
-    # Регистрируем пользователя
+    # Регистрируем пользователя (с немедленной синхронизацией в основной файл, чтобы API сразу увидел участника)
+    await game_data.register_user_async(user_id, username, full_name, name)
     data = await game_data.get_all_data()
-    game_data.register_user(user_id, username, full_name, name, data)
-    # Сохраняем с немедленной синхронизацией в основной файл, чтобы API сразу увидел участника
-    await game_data.save_data(data, sync_to_main=True)
     
     # Отправляем обновление в тред, если он настроен
     from services.reminders import send_update_to_thread, get_bot_thread_id
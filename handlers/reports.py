@@ -7,11 +7,11 @@ from keyboards.common import (
     get_main_menu, get_goals_selector,
     get_cancel_keyboard
 )
-from services.game_data import GameDataManager
+from services.game_data import get_game_data
 from datetime import datetime
 
 router = Router()
-game_data = GameDataManager()
+game_data = get_game_data()
 
 
 @router.message(Command("report"))
@@ -39,7 +39,7 @@ async def cmd_report(message: Message, state: FSMContext):
         return
     
     # Начинаем процесс отправки отчета
-    current_day = game_data.get_current_day()
+    current_day = await game_data.get_current_day_async()
     
     await message.answer(
         f"📊 <b>Ежедневный отчет. День #{current_day}</b>\n\n"
@@ -51,7 +51,7 @@ async def cmd_report(message: Message, state: FSMContext):
     )
     
     await state.set_state(ReportStates.selecting_goals)
-    await state.update_data(selected_goals=set(), goals_progress={}, current_day=current_day)
+    await state.update_data(selected_goals=[], goals_progress={}, current_day=current_day)
 
 
 @router.callback_query(ReportStates.selecting_goals, F.data.startswith("toggle_goal_"))
@@ -60,14 +60,15 @@ async def callback_toggle_goal(callback: CallbackQuery, state: FSMContext):
     
     goal_num = int(callback.data.split("_")[-1])
     state_data = await state.get_data()
-    selected_goals = state_data.get("selected_goals", set())
+    selected_goals = set(state_data.get("selected_goals", []))
     
     if goal_num in selected_goals:
         selected_goals.remove(goal_num)
     else:
         selected_goals.add(goal_num)
     
-    await state.update_data(selected_goals=selected_goals)
+    # Состояние хранится в JSON — множество сохраняем списком
+    await state.update_data(selected_goals=sorted(selected_goals))
     
     user_id = callback.from_user.id
     data = await game_data.get_all_data()
@@ -83,7 +84,7 @@ async def callback_finish_selection(callback: CallbackQuery, state: FSMContext):
     await callback.answer()
     
     state_data = await state.get_data()
-    selected_goals = state_data.get("selected_goals", set())
+    selected_goals = state_data.get("selected_goals", [])
     current_day = state_data.get("current_day", 1)
     
     # Проверка на день отдыха (каждый 10-й день)
@@ -92,7 +93,7 @@ async def callback_finish_selection(callback: CallbackQuery, state: FSMContext):
     if len(selected_goals) == 0:
         # Пользователь хочет использовать день отдыха
         if can_rest:
-            await state.update_data(rest_day=True, selected_goals=set(range(1, 11)), goals_progress={})
+            await state.update_data(rest_day=True, selected_goals=list(range(1, 11)), goals_progress={})
             await save_report(callback.message, state)
         else:
             next_rest_day = ((current_day // 10) + 1) * 10
@@ -123,7 +124,7 @@ async def callback_finish_selection(callback: CallbackQuery, state: FSMContext):
 async def process_next_goal(message: Message, state: FSMContext):
     """Обрабатывает следующую цель из выбранных"""
     state_data = await state.get_data()
-    selected_goals = sorted(list(state_data.get("selected_goals", set())))
+    selected_goals = sorted(state_data.get("selected_goals", []))
     goals_progress = state_data.get("goals_progress", {})
     current_index = state_data.get("current_goal_index", 0)
     rest_day = state_data.get("rest_day", False)
@@ -178,7 +179,7 @@ async def callback_back_to_goals(callback: CallbackQuery, state: FSMContext):
     goals = game_data.get_user_goals(user_id, data)
     
     state_data = await state.get_data()
-    selected_goals = state_data.get("selected_goals", set())
+    selected_goals = state_data.get("selected_goals", [])
     
     await callback.message.answer(
         "Выберите цели, по которым хотите указать прогресс:",
@@ -229,7 +230,7 @@ async def process_progress_text(message: Message, state: FSMContext):
     state_data = await state.get_data()
     goal_num = state_data.get("current_goal_for_text")
     goals_progress = state_data.get("goals_progress", {})
-    goals_progress[goal_num] = progress_text
+    goals_progress[str(goal_num)] = progress_text  # ключи JSON — строки
     
     current_index = state_data.get("current_goal_index", 0)
     await state.update_data(goals_progress=goals_progress, current_goal_index=current_index + 1)
@@ -254,17 +255,15 @@ async def save_report(message: Message, state: FSMContext):
     state_data = await state.get_data()
     user_id = message.from_user.id
     current_day = state_data.get("current_day", 1)
-    goals_progress = state_data.get("goals_progress", {})
+    # В состоянии номера целей — строки (JSON), в отчет передаем числа
+    goals_progress = {int(k): v for k, v in state_data.get("goals_progress", {}).items()}
     rest_day = state_data.get("rest_day", False)
     
-    data = await game_data.get_all_data()
-    
     if rest_day:
         goals_progress = {i: "Отдых" for i in range(1, 11)}
     
-    game_data.save_daily_report(user_id, current_day, goals_progress, rest_day, data)
-    # Сохраняем с синхронизацией с основным файлом (это важно для отчетов)
-    await game_data.save_data(data, sync_to_main=True)
+    # Сохраняем только строку отчета, с синхронизацией с основным файлом (это важно для отчетов)
+    await game_data.save_daily_report_async(user_id, current_day, goals_progress, rest_day)
     
     await state.clear()
     
@@ -1,15 +1,31 @@
 #!/usr/bin/env python3
 """
 Скрипт для запуска API сервера
+
+Без аргументов — режим разработки (один процесс с автоперезагрузкой).
+С флагом --prod — продакшен: несколько воркеров (API_WORKERS, по умолчанию 2) без reload.
+Воркеры работают с общей локальной БД: изменения видны всем через счетчик data_version,
+а выгрузку на Я.Диск ведет один процесс-лидер.
 """
+import os
+import sys
+
 import uvicorn
 
 if __name__ == "__main__":
-    uvicorn.run(
-        "api.main:app",
-        host="0.0.0.0",
-        port=8000,
-        reload=True,
-        log_level="info"
-    )
-
+    if "--prod" in sys.argv:
+        uvicorn.run(
+            "api.main:app",
+            host="0.0.0.0",
+            port=int(os.getenv("API_PORT", "8000")),
+            workers=int(os.getenv("API_WORKERS", "2")),
+            log_level="info"
+        )
+    else:
+        uvicorn.run(
+            "api.main:app",
+            host="0.0.0.0",
+            port=8000,
+            reload=True,
+            log_level="info"
+        )
@@ -0,0 +1,131 @@
+import os
+import time
+import heapq
+import asyncio
+import hashlib
+import logging
+import secrets
+from datetime import datetime
+from typing import Any, Dict, List, Optional, Tuple
+
+from services import local_store
+
+
+# Токены входа на сайт по ссылке из бота. По умолчанию хранятся в локальной БД — общей для
+# бота и всех воркеров API, поэтому переживают перезапуск; AUTH_TOKEN_STORE=memory — только
+# в памяти процесса (один воркер, для отладки). В хранилище лежит хеш токена, а не сам токен.
+TOKEN_TTL_SECONDS = 24 * 3600
+_SWEEP_INTERVAL_SECONDS = 600
+
+
+def _hash(token: str) -> str:
+    return hashlib.sha256(token.encode("utf-8")).hexdigest()
+
+
+class MemoryTokenStore:
+    """Токены в памяти процесса: словарь для поиска и куча сроков для очистки."""
+
+    name = "memory"
+
+    def __init__(self):
+        self._tokens: Dict[str, Tuple[int, int]] = {}
+        self._expiry: List[Tuple[int, str]] = []
+
+    async def add(self, token_hash: str, user_id: int, expires_at: int) -> None:
+        self._tokens[token_hash] = (user_id, expires_at)
+        heapq.heappush(self._expiry, (expires_at, token_hash))
+
+    async def get(self, token_hash: str) -> Optional[Dict[str, Any]]:
+        entry = self._tokens.get(token_hash)
+        return {"user_id": entry[0], "expires_at": entry[1]} if entry else None
+
+    async def delete(self, token_hash: str) -> None:
+        self._tokens.pop(token_hash, None)
+
+    async def sweep(self, now: int) -> int:
+        removed = 0
+        while self._expiry and self._expiry[0][0] <= now:
+            expires_at, token_hash = heapq.heappop(self._expiry)
+            entry = self._tokens.get(token_hash)
+            if entry is not None and entry[1] == expires_at:
+                del self._tokens[token_hash]
+                removed += 1
+        return removed
+
+    async def count(self) -> int:
+        return len(self._tokens)
+
+
+class SqliteTokenStore:
+    """Токены в таблице auth_tokens локальной БД (поиск по ключу, очистка по индексу срока)."""
+
+    name = "sqlite"
+
+    async def add(self, token_hash: str, user_id: int, expires_at: int) -> None:
+        await local_store.add_auth_token(token_hash, user_id, expires_at)
+
+    async def get(self, token_hash: str) -> Optional[Dict[str, Any]]:
+        return await local_store.get_auth_token(token_hash)
+
+    async def delete(self, token_hash: str) -> None:
+        await local_store.delete_auth_token(token_hash)
+
+    async def sweep(self, now: int) -> int:
+        return await local_store.delete_expired_auth_tokens(now)
+
+    async def count(self) -> int:
+        return await local_store.count_auth_tokens()
+
+
+def create_store(kind: str):
+    """Хранилище токенов по имени: sqlite (по умолчанию) или memory"""
+    return MemoryTokenStore() if kind == "memory" else SqliteTokenStore()
+
+
+_store = create_store(os.getenv("AUTH_TOKEN_STORE", "sqlite"))
+_stats: Dict[str, Any] = {"swept": 0, "last_sweep_at": None}
+
+
+async def issue(user_id: int, ttl_seconds: int = TOKEN_TTL_SECONDS) -> Tuple[str, datetime]:
+    """Выдает новый токен; возвращает (токен, срок действия)."""
+    token = secrets.token_urlsafe(32)
+    expires_at = int(time.time()) + ttl_seconds
+    await _store.add(_hash(token), user_id, expires_at)
+    return token, datetime.fromtimestamp(expires_at)
+
+
+async def lookup(token: str) -> Tuple[Optional[int], bool]:
+    """Ищет токен: (user_id, истек ли). (None, False) — токена нет; истекший токен удаляется."""
+    token_hash = _hash(token)
+    entry = await _store.get(token_hash)
+    if entry is None:
+        return None, False
+    if entry["expires_at"] <= time.time():
+        await _store.delete(token_hash)
+        return None, True
+    return entry["user_id"], False
+
+
+async def sweep() -> int:
+    """Удаляет истекшие токены; возвращает их число."""
+    removed = await _store.sweep(int(time.time()))
+    _stats["swept"] += removed
+    _stats["last_sweep_at"] = datetime.now().isoformat(timespec="seconds")
+    return removed
+
+
+async def run_sweeper(interval: float = _SWEEP_INTERVAL_SECONDS) -> None:
+    """Фоновая очистка истекших токенов раз в interval секунд."""
+    while True:
+        try:
+            removed = await sweep()
+            if removed:
+                logging.info(f"Удалено истекших токенов: {removed}")
+        except Exception as e:
+            logging.error(f"Ошибка очистки токенов: {e}")
+        await asyncio.sleep(interval)
+
+
+async def get_stats() -> Dict[str, Any]:
+    """Состояние хранилища токенов для админки"""
+    return {"backend": _store.name, "active": await _store.count(), **_stats}
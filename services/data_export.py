@@ -0,0 +1,115 @@
+import io
+import csv
+import json
+import zlib
+from typing import Any, Dict, Iterator, List, Optional
+
+from services import local_store
+
+
+# Потоковая выгрузка данных для админки: строки читаются курсором из локальной БД
+# и сериализуются по одной, поэтому память не растет с размером игры.
+FORMATS = ("json", "ndjson", "csv")
+ENTITIES = ("participants", "reports")
+MEDIA_TYPES = {
+    "json": "application/json",
+    "ndjson": "application/x-ndjson",
+    "csv": "text/csv; charset=utf-8",
+}
+
+_CHUNK_SIZE = 64 * 1024
+_GOALS_COUNT = 10
+
+_CSV_COLUMNS = {
+    "participants": ["user_id", "username", "full_name", "game_name", "registered_date", "status"],
+    "reports": ["user_id", "day", "date", "rest_day"],
+}
+
+
+def _dumps(value: Any) -> str:
+    return json.dumps(value, ensure_ascii=False)
+
+
+def _json_lines(data: Dict[str, Iterator[Any]]) -> Iterator[str]:
+    """Тот же объект {"participants", "reports", "settings"}, что отдавал прежний экспорт"""
+    yield "{"
+    for name in ("participants", "reports"):
+        yield f'"{name}": ['
+        for index, item in enumerate(data[name]):
+            yield ("," if index else "") + _dumps(item)
+        yield "], "
+    yield '"settings": {'
+    for index, (key, value) in enumerate(data["settings"]):
+        yield ("," if index else "") + f"{_dumps(key)}: {_dumps(value)}"
+    yield "}}"
+
+
+def _ndjson_lines(data: Dict[str, Iterator[Any]]) -> Iterator[str]:
+    """Одна запись на строку с полем type: participant, report, settings"""
+    for name, kind in (("participants", "participant"), ("reports", "report")):
+        for item in data[name]:
+            yield _dumps({"type": kind, **item}) + "\n"
+    yield _dumps({"type": "settings", **dict(data["settings"])}) + "\n"
+
+
+def _csv_lines(rows: Iterator[Dict[str, Any]], entity: str) -> Iterator[str]:
+    """Плоская таблица одной сущности: цели/прогресс — колонки goal_1..goal_10"""
+    columns = _CSV_COLUMNS[entity]
+    list_field = "goals" if entity == "participants" else "progress"
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(columns + [f"goal_{i}" for i in range(1, _GOALS_COUNT + 1)])
+    for row in rows:
+        values: List[Any] = list(row.get(list_field) or [])
+        values = (values + [""] * _GOALS_COUNT)[:_GOALS_COUNT]
+        writer.writerow([row.get(column) for column in columns] + values)
+        if buffer.tell() >= _CHUNK_SIZE:
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+    yield buffer.getvalue()
+
+
+def _chunks(lines: Iterator[str], compress: bool) -> Iterator[bytes]:
+    """Склеивает строки в куски ~_CHUNK_SIZE и при необходимости сжимает их в gzip"""
+    compressor = zlib.compressobj(wbits=31) if compress else None
+    parts: List[bytes] = []
+    size = 0
+    for line in lines:
+        encoded = line.encode("utf-8")
+        parts.append(encoded)
+        size += len(encoded)
+        if size >= _CHUNK_SIZE:
+            chunk = b"".join(parts)
+            parts, size = [], 0
+            chunk = compressor.compress(chunk) if compressor else chunk
+            if chunk:
+                yield chunk
+    tail = b"".join(parts)
+    if compressor:
+        tail = compressor.compress(tail) + compressor.flush()
+    if tail:
+        yield tail
+
+
+def iter_export(fmt: str = "json", entity: str = "reports", day_from: Optional[int] = None,
+                day_to: Optional[int] = None, compress: bool = False) -> Iterator[bytes]:
+    """Синхронный генератор байтов выгрузки (для StreamingResponse — читается в пуле потоков).
+
+    json — один объект как в прежнем экспорте, ndjson — все сущности построчно,
+    csv — одна сущность entity. day_from/day_to ограничивают отчеты.
+    """
+    with local_store.export_reader(day_from, day_to) as data:
+        if fmt == "csv":
+            lines = _csv_lines(data[entity], entity)
+        elif fmt == "ndjson":
+            lines = _ndjson_lines(data)
+        else:
+            lines = _json_lines(data)
+        yield from _chunks(lines, compress)
+
+
+def filename(fmt: str, entity: str, compress: bool, day: str) -> str:
+    """Имя файла выгрузки для Content-Disposition"""
+    name = f"game_data_{entity}_{day}" if fmt == "csv" else f"game_data_{day}"
+    return f"{name}.{fmt}" + (".gz" if compress else "")
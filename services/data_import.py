@@ -0,0 +1,176 @@
+import io
+import csv
+import gzip
+import json
+import time
+from typing import Any, BinaryIO, Dict, Iterable, Iterator, List, Optional, Tuple
+
+from pydantic import BaseModel, Field, ValidationError
+
+
+# Массовый импорт для админки: файл NDJSON/CSV (как у data_export) читается построчно,
+# каждая строка проверяется моделью; ошибки не прерывают разбор, а собираются по номерам строк.
+FORMATS = ("ndjson", "csv")
+ENTITIES = ("participants", "reports")
+
+_GOALS_COUNT = 10
+_MAX_ERRORS = 100
+_NDJSON_TYPES = {"participant": "participants", "report": "reports", "settings": "settings"}
+
+
+class ParticipantRow(BaseModel):
+    user_id: int = Field(gt=0)
+    username: str = ""
+    full_name: str = ""
+    game_name: str = ""  # как в БД: участник мог не указать игровое имя
+    registered_date: str = ""
+    status: str = Field("active", pattern="^(active|removed)$")
+    goals: List[str] = Field(default_factory=list, max_length=_GOALS_COUNT)
+
+
+class ReportRow(BaseModel):
+    user_id: int = Field(gt=0)
+    day: int = Field(ge=1, le=90)
+    date: str = ""
+    progress: List[str] = Field(default_factory=list, max_length=_GOALS_COUNT)
+    rest_day: bool = False
+
+
+_MODELS = {"participants": ParticipantRow, "reports": ReportRow}
+_LIST_FIELDS = {"participants": "goals", "reports": "progress"}
+
+
+def _text(stream: BinaryIO) -> io.TextIOWrapper:
+    """Текстовый поток загрузки; gzip распознается по сигнатуре"""
+    if stream.read(2) == b"\x1f\x8b":
+        stream.seek(0)
+        stream = gzip.GzipFile(fileobj=stream, mode="rb")
+    else:
+        stream.seek(0)
+    return io.TextIOWrapper(stream, encoding="utf-8-sig", newline="")
+
+
+def _ndjson_records(text: io.TextIOWrapper, entity: str) -> Iterator[Tuple[int, str, Any]]:
+    for line_no, line in enumerate(text, start=1):
+        if not line.strip():
+            continue
+        try:
+            record = json.loads(line)
+        except ValueError as e:
+            yield line_no, "", ValueError(f"Неверный JSON: {e}")
+            continue
+        if not isinstance(record, dict):
+            yield line_no, "", ValueError("Ожидается JSON-объект")
+            continue
+        kind = record.pop("type", None)
+        target = _NDJSON_TYPES.get(kind) if kind is not None else entity
+        if target is None:
+            yield line_no, "", ValueError(f"Неизвестный тип записи: {kind}")
+            continue
+        yield line_no, target, record
+
+
+def _csv_records(text: io.TextIOWrapper, entity: str) -> Iterator[Tuple[int, str, Any]]:
+    list_field = _LIST_FIELDS[entity]
+    reader = csv.DictReader(text)
+    for row in reader:
+        record: Dict[str, Any] = {
+            k: v for k, v in row.items() if k and not k.startswith("goal_") and v not in ("", None)
+        }
+        goals = [row.get(f"goal_{i}") or "" for i in range(1, _GOALS_COUNT + 1)]
+        if any(goals):
+            record[list_field] = goals
+        yield reader.line_num, entity, record
+
+
+def _error_text(error: Exception) -> str:
+    if isinstance(error, ValidationError):
+        return "; ".join(f"{'.'.join(str(p) for p in e['loc']) or 'строка'}: {e['msg']}" for e in error.errors())
+    return str(error)
+
+
+def _collect(records: Iterable[Tuple[Any, str, Any]], started_at: float) -> Dict[str, Any]:
+    """Проверяет записи (номер, сущность, запись) моделями и собирает результат разбора"""
+    participants: Dict[int, Dict[str, Any]] = {}
+    reports: Dict[Tuple[int, int], Dict[str, Any]] = {}
+    settings: Dict[str, Any] = {}
+    errors: List[Dict[str, Any]] = []
+    error_count = 0
+    rows = 0
+    for line_no, target, record in records:
+        rows += 1
+        try:
+            if isinstance(record, Exception):
+                raise record
+            if target == "settings":
+                settings.update(record)
+                continue
+            # У участника остаются только переданные поля — остальные при импорте не затираются
+            model = _MODELS[target].model_validate(record)
+            row = model.model_dump(exclude_unset=True) if target == "participants" else model.model_dump()
+        except (ValueError, ValidationError) as e:
+            error_count += 1
+            if len(errors) < _MAX_ERRORS:
+                errors.append({"line": line_no, "error": _error_text(e)})
+            continue
+        if target == "participants":
+            participants[row["user_id"]] = row
+        else:
+            reports[(row["user_id"], row["day"])] = row
+    return {
+        "participants": list(participants.values()),
+        "reports": list(reports.values()),
+        "settings": settings,
+        "rows": rows,
+        "error_count": error_count,
+        "errors": errors,
+        "parse_ms": round((time.perf_counter() - started_at) * 1000, 2),
+    }
+
+
+def parse(stream: BinaryIO, fmt: str, entity: str = "reports") -> Dict[str, Any]:
+    """Разбирает и проверяет файл импорта (синхронно — вызывать в пуле потоков).
+
+    Возвращает проверенные строки (повтор ключа — побеждает последняя строка), настройки,
+    число строк, ошибки [{"line", "error"}] (первые _MAX_ERRORS) и время разбора.
+    """
+    started_at = time.perf_counter()
+    text = _text(stream)
+    records = _csv_records(text, entity) if fmt == "csv" else _ndjson_records(text, entity)
+    return _collect(records, started_at)
+
+
+def parse_document(data: Dict[str, Any]) -> Dict[str, Any]:
+    """Проверяет JSON-документ прежнего экспорта {"participants", "reports", "settings"}.
+
+    Результат — как у parse; в ошибках line — номер записи в документе по порядку.
+    """
+    started_at = time.perf_counter()
+
+    def records() -> Iterator[Tuple[int, str, Any]]:
+        line_no = 0
+        for name in ("participants", "reports"):
+            for record in data.get(name) or []:
+                line_no += 1
+                yield line_no, name, record if isinstance(record, dict) else ValueError("Ожидается JSON-объект")
+        if data.get("settings"):
+            yield line_no + 1, "settings", dict(data["settings"])
+
+    return _collect(records(), started_at)
+
+
+def check_references(parsed: Dict[str, Any], known_user_ids: Optional[set] = None) -> None:
+    """Отбрасывает отчеты участников, которых нет ни в БД, ни в самом импорте"""
+    known = set(known_user_ids or ()) | {p["user_id"] for p in parsed["participants"]}
+    kept = []
+    for report in parsed["reports"]:
+        if report["user_id"] in known:
+            kept.append(report)
+            continue
+        parsed["error_count"] += 1
+        if len(parsed["errors"]) < _MAX_ERRORS:
+            parsed["errors"].append({
+                "line": None,
+                "error": f"Отчет за день {report['day']}: участник {report['user_id']} не найден",
+            })
+    parsed["reports"] = kept
@@ -0,0 +1,139 @@
+import time
+import asyncio
+import logging
+from typing import Any, Awaitable, Callable, Dict, Iterable, Optional, Tuple
+
+from aiogram import Bot
+from aiogram.exceptions import TelegramForbiddenError, TelegramRetryAfter, TelegramBadRequest
+
+
+# Telegram ограничивает бота ~30 сообщениями в секунду на всех получателей;
+# держимся чуть ниже, чтобы не ловить flood control на массовых рассылках.
+_RATE_PER_SECOND = 25
+_BURST = 5
+_WORKERS = 8
+_MAX_RETRIES = 3
+
+# Исходы доставки для одного получателя
+SENT = "sent"
+BLOCKED = "blocked"
+BAD_REQUEST = "bad_request"
+FAILED = "failed"
+
+
+class TokenBucket:
+    """Ограничитель частоты: не больше rate отправок в секунду со всплеском до burst.
+
+    pause() останавливает всех ожидающих до указанного момента (RetryAfter от Telegram
+    относится ко всему боту, а не к одному получателю).
+    """
+
+    def __init__(self, rate: float, burst: int):
+        self.rate = rate
+        self.burst = burst
+        self._tokens = float(burst)
+        self._updated_at = time.monotonic()
+        self._paused_until = 0.0
+        self._lock = asyncio.Lock()
+
+    def pause(self, seconds: float) -> None:
+        self._paused_until = max(self._paused_until, time.monotonic() + seconds)
+        self._tokens = 0.0
+
+    async def acquire(self) -> None:
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                if now < self._paused_until:
+                    await asyncio.sleep(self._paused_until - now)
+                    continue
+                self._tokens = min(self.burst, self._tokens + (now - self._updated_at) * self.rate)
+                self._updated_at = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                await asyncio.sleep((1 - self._tokens) / self.rate)
+
+
+_bucket = TokenBucket(_RATE_PER_SECOND, _BURST)
+
+
+async def send_one(bot: Bot, chat_id: int, text: str, **kwargs: Any) -> Tuple[str, Optional[str]]:
+    """Отправляет одно сообщение через общий ограничитель; возвращает (исход, ошибка)."""
+    for attempt in range(_MAX_RETRIES + 1):
+        await _bucket.acquire()
+        try:
+            await bot.send_message(chat_id, text, **kwargs)
+            return SENT, None
+        except TelegramRetryAfter as e:
+            logging.warning(f"Flood control Telegram: пауза {e.retry_after} с")
+            _bucket.pause(e.retry_after)
+            error = str(e)
+        except TelegramForbiddenError as e:
+            return BLOCKED, str(e)
+        except TelegramBadRequest as e:
+            return BAD_REQUEST, str(e)
+        except Exception as e:
+            error = str(e)
+            if attempt < _MAX_RETRIES:
+                await asyncio.sleep(2 ** attempt)
+    return FAILED, error
+
+
+async def dispatch(bot: Bot, messages: Iterable[Dict[str, Any]], name: str = "dispatch",
+                   on_result: Optional[Callable[[Dict[str, Any], str, Optional[str]], Awaitable[None]]] = None,
+                   stop: Optional[asyncio.Event] = None) -> Dict[str, Any]:
+    """Рассылает сообщения пулом воркеров с учетом лимитов Telegram.
+
+    Сообщение — словарь с ключами id, chat_id, text и необязательными thread_id, parse_mode.
+    on_result(сообщение, исход, ошибка) вызывается сразу после каждой отправки.
+    stop — после его установки воркеры доотправляют текущие сообщения и не берут новые.
+    Возвращает сводку: число сообщений по исходам, исход для каждого id и id неотправленных.
+    """
+    queue: asyncio.Queue = asyncio.Queue()
+    for item in messages:
+        queue.put_nowait(item)
+    outcomes: Dict[Any, str] = {}
+    errors: Dict[Any, str] = {}
+    started_at = time.perf_counter()
+
+    async def _worker() -> None:
+        while stop is None or not stop.is_set():
+            try:
+                message = queue.get_nowait()
+            except asyncio.QueueEmpty:
+                return
+            kwargs: Dict[str, Any] = {}
+            if message.get("thread_id"):
+                kwargs["message_thread_id"] = message["thread_id"]
+            if message.get("parse_mode"):
+                kwargs["parse_mode"] = message["parse_mode"]
+            outcome, error = await send_one(bot, message["chat_id"], message["text"], **kwargs)
+            outcomes[message["id"]] = outcome
+            if error:
+                errors[message["id"]] = error
+                logging.warning(f"Не удалось отправить сообщение {message['chat_id']} ({outcome}): {error}")
+            if on_result is not None:
+                await on_result(message, outcome, error)
+
+    total = queue.qsize()
+    await asyncio.gather(*(_worker() for _ in range(min(_WORKERS, total))))
+    unsent = []
+    while not queue.empty():
+        unsent.append(queue.get_nowait()["id"])
+    counts: Dict[str, int] = {}
+    for outcome in outcomes.values():
+        counts[outcome] = counts.get(outcome, 0) + 1
+    duration = time.perf_counter() - started_at
+    report = {
+        "name": name,
+        "total": total,
+        "counts": counts,
+        "duration_seconds": round(duration, 2),
+        "messages_per_second": round(total / duration, 1) if duration > 0 else 0.0,
+        "outcomes": outcomes,
+        "errors": errors,
+        "unsent": unsent,
+    }
+    logging.info(f"Рассылка {name}: {total} сообщений за {report['duration_seconds']} с, {counts}")
+    return report
@@ -0,0 +1,69 @@
+import time
+from typing import Any, Dict, List, Optional
+
+from services.game_data import GameDataManager
+
+
+# Причины исключения
+NO_REPORT = "no_report"
+LOW_PROGRESS = "low_progress"
+
+# Минимум целей с прогрессом в отчете (кроме дня отдыха)
+MIN_PROGRESS_GOALS = 2
+
+
+def _progress_count(report: Dict[str, Any]) -> int:
+    return sum(1 for p in report["progress"] if p and str(p).strip() and p != "Отдых")
+
+
+def compute_verdicts(game_data: GameDataManager, data: Dict[str, Any], day: int) -> List[Dict[str, Any]]:
+    """Решения об исключении за день: один проход по активным участникам и отчетам этого дня.
+
+    Первый день не проверяется. Данные не меняются.
+    """
+    if day <= 1:
+        return []
+    day_reports = game_data.get_day_reports(day, data)
+    verdicts = []
+    for participant in data["participants"]:
+        if participant["status"] != "active":
+            continue
+        user_id = participant["user_id"]
+        report = day_reports.get(user_id)
+        if report is None:
+            reason = NO_REPORT
+        elif not report.get("rest_day", False) and _progress_count(report) < MIN_PROGRESS_GOALS:
+            reason = LOW_PROGRESS
+        else:
+            continue
+        verdicts.append({
+            "user_id": user_id,
+            "game_name": participant.get("game_name", f"ID {user_id}"),
+            "reason": reason,
+        })
+    return verdicts
+
+
+async def run_elimination(game_data: GameDataManager, dry_run: bool = False,
+                          day: Optional[int] = None) -> Dict[str, Any]:
+    """Исключает участников за день одной транзакцией.
+
+    day — проверяемый день; по умолчанию текущий день игры (game_day — тот же, что у отчетов).
+    dry_run=True — только считает, кто был бы исключен. Возвращает день, решения и длительность прохода.
+    """
+    started_at = time.perf_counter()
+    data = await game_data.get_all_data()
+    if day is None:
+        day = await game_data.get_current_day_async()
+    verdicts = compute_verdicts(game_data, data, day)
+    compute_ms = (time.perf_counter() - started_at) * 1000
+    if verdicts and not dry_run:
+        await game_data.set_participant_statuses([v["user_id"] for v in verdicts], "removed", sync_to_main=True)
+    return {
+        "day": day,
+        "dry_run": dry_run,
+        "verdicts": verdicts,
+        "removed_count": len(verdicts),
+        "compute_ms": round(compute_ms, 2),
+        "duration_ms": round((time.perf_counter() - started_at) * 1000, 2),
+    }
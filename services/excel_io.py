@@ -0,0 +1,214 @@
+import io
+import time
+import asyncio
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional, Tuple, TypeVar
+
+from openpyxl import Workbook, load_workbook
+from openpyxl.cell import WriteOnlyCell
+from openpyxl.styles import Font, PatternFill, Alignment
+
+from services import local_store
+
+
+T = TypeVar("T")
+
+PARTICIPANT_HEADERS = ["User ID", "Username", "Full Name", "Game Name", "Registered Date", "Status"] + \
+                      [f"Goal {i}" for i in range(1, 11)]
+REPORT_HEADERS = ["User ID", "Day", "Date"] + [f"Goal {i}" for i in range(1, 11)] + ["Rest Day"]
+SETTINGS_HEADERS = ["Key", "Value"]
+
+# Сборка и разбор книг openpyxl идут в отдельном потоке, чтобы не блокировать event loop.
+# Одновременно ждут выполнения не больше _MAX_PENDING_JOBS задач, остальные вызовы ждут очереди.
+_MAX_PENDING_JOBS = 4
+_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="excel")
+_slots = asyncio.Semaphore(_MAX_PENDING_JOBS)
+_pending = 0
+_metrics: Dict[str, Dict[str, Any]] = {}
+_last_import: Optional[Dict[str, Any]] = None
+
+
+def _record(name: str, wait_ms: float, run_ms: float, ok: bool) -> None:
+    stat = _metrics.setdefault(name, {
+        "count": 0, "errors": 0, "last_ms": 0.0, "max_ms": 0.0, "total_ms": 0.0, "last_wait_ms": 0.0,
+    })
+    stat["count"] += 1
+    if not ok:
+        stat["errors"] += 1
+    stat["last_ms"] = round(run_ms, 1)
+    stat["max_ms"] = max(stat["max_ms"], round(run_ms, 1))
+    stat["total_ms"] = round(stat["total_ms"] + run_ms, 1)
+    stat["last_wait_ms"] = round(wait_ms, 1)
+
+
+def _timed(func: Callable[..., T], *args: Any):
+    started_at = time.perf_counter()
+    result = func(*args)
+    return result, (time.perf_counter() - started_at) * 1000
+
+
+async def run_job(name: str, func: Callable[..., T], *args: Any) -> T:
+    """Выполняет синхронную работу с Excel в пуле потоков и записывает ее длительность."""
+    global _pending
+    queued_at = time.perf_counter()
+    run_ms = 0.0
+    ok = False
+    async with _slots:
+        _pending += 1
+        try:
+            result, run_ms = await asyncio.get_running_loop().run_in_executor(_executor, _timed, func, *args)
+            ok = True
+            return result
+        finally:
+            _pending -= 1
+            total_ms = (time.perf_counter() - queued_at) * 1000
+            _record(name, max(total_ms - run_ms, 0.0), run_ms if ok else total_ms, ok)
+            logging.debug(f"Excel {name}: {run_ms:.1f} мс (ожидание {total_ms - run_ms:.1f} мс)")
+
+
+def get_metrics() -> Dict[str, Any]:
+    """Счетчики и длительности задач сборки/разбора книг"""
+    return {
+        "pending": _pending,
+        "max_pending": _MAX_PENDING_JOBS,
+        "jobs": {name: dict(stat) for name, stat in _metrics.items()},
+        "last_import": dict(_last_import) if _last_import else None,
+    }
+
+
+def _header_row(ws, headers: List[str]) -> List[WriteOnlyCell]:
+    header_fill = PatternFill(start_color="366092", end_color="366092", fill_type="solid")
+    header_font = Font(bold=True, color="FFFFFF")
+    header_alignment = Alignment(horizontal="center", vertical="center")
+    row = []
+    for value in headers:
+        cell = WriteOnlyCell(ws, value=value)
+        cell.fill = header_fill
+        cell.font = header_font
+        cell.alignment = header_alignment
+        row.append(cell)
+    return row
+
+
+def write_workbook(participants: Iterable[Dict[str, Any]], reports: Iterable[Dict[str, Any]],
+                   settings: Iterable[Tuple[str, Any]]) -> bytes:
+    """Пишет книгу в режиме write_only: строки сразу уходят во временный файл openpyxl,
+    поэтому память не растет с числом отчетов. Источники читаются по одному разу, по порядку."""
+    wb = Workbook(write_only=True)
+    # Участники
+    ws = wb.create_sheet("Участники")
+    ws.append(_header_row(ws, PARTICIPANT_HEADERS))
+    for participant in participants:
+        ws.append([
+            participant["user_id"],
+            participant["username"],
+            participant["full_name"],
+            participant["game_name"],
+            participant["registered_date"],
+            participant["status"],
+        ] + participant["goals"])
+    # Отчеты
+    ws_reports = wb.create_sheet("Отчеты")
+    ws_reports.append(_header_row(ws_reports, REPORT_HEADERS))
+    for report in reports:
+        ws_reports.append([report["user_id"], report["day"], report["date"]] + report["progress"] +
+                          ["Да" if report.get("rest_day") else "Нет"])
+    # Настройки
+    ws_settings = wb.create_sheet("Настройки")
+    ws_settings.append(_header_row(ws_settings, SETTINGS_HEADERS))
+    for key, value in settings:
+        if value is not None:
+            ws_settings.append([key, value])
+    buffer = io.BytesIO()
+    wb.save(buffer)
+    return buffer.getvalue()
+
+
+def build_workbook(data: Optional[Dict[str, Any]] = None) -> bytes:
+    """Строит Excel байты из словаря данных (без данных — пустую книгу с заголовками)."""
+    data = data or {}
+    return write_workbook(
+        data.get("participants", []),
+        data.get("reports", []),
+        (data.get("settings", {}) or {}).items(),
+    )
+
+
+def build_workbook_from_store() -> bytes:
+    """Строит Excel байты прямо из локальной БД, читая строки курсором."""
+    with local_store.export_reader() as rows:
+        return write_workbook(rows["participants"], rows["reports"], rows["settings"])
+
+
+def _participant_from_row(row: tuple) -> Dict[str, Any]:
+    if len(row) > 6:
+        goals = [row[5+i] or "" if 5+i < len(row) else "" for i in range(1, 11)]
+    else:
+        goals = [""] * 10
+    return {
+        "user_id": row[0],
+        "username": row[1] if len(row) > 1 else "",
+        "full_name": row[2] if len(row) > 2 else "",
+        "game_name": row[3] if len(row) > 3 else "",
+        "registered_date": row[4] if len(row) > 4 else "",
+        "status": row[5] if len(row) > 5 else "active",
+        "goals": goals,
+    }
+
+
+def _report_from_row(row: tuple) -> Dict[str, Any]:
+    if len(row) > 3:
+        progress = [row[2+i] or "" if 2+i < len(row) else "" for i in range(1, 11)]
+    else:
+        progress = [""] * 10
+    return {
+        "user_id": row[0],
+        "day": row[1] if len(row) > 1 else 1,
+        "date": row[2] if len(row) > 2 else "",
+        "progress": progress,
+        "rest_day": row[13] == "Да" if len(row) > 13 and row[13] else False,
+    }
+
+
+def _sheet_rows(wb, name: str) -> Iterator[tuple]:
+    """Строки листа без заголовка. Размеры листа сбрасываются: в read_only openpyxl верит
+    записанному в файле dimension, а после ручной правки он бывает неверным."""
+    ws = wb[name]
+    ws.reset_dimensions()
+    return ws.iter_rows(min_row=2, values_only=True)
+
+
+def parse_workbook(file_data: bytes) -> Optional[Dict[str, Any]]:
+    """Разбирает Excel байты в словарь данных; None — если в книге нет листа участников.
+
+    Книга открывается в режиме read_only/data_only: строки читаются потоково из XML,
+    объекты ячеек не создаются.
+    """
+    global _last_import
+    started_at = time.perf_counter()
+    wb = load_workbook(io.BytesIO(file_data), read_only=True, data_only=True)
+    try:
+        if "Участники" not in wb.sheetnames:
+            return None
+        participants = [_participant_from_row(row) for row in _sheet_rows(wb, "Участники")
+                        if row and row[0] is not None]
+        reports = []
+        if "Отчеты" in wb.sheetnames:
+            reports = [_report_from_row(row) for row in _sheet_rows(wb, "Отчеты")
+                       if row and row[0] is not None]
+        settings = {}
+        if "Настройки" in wb.sheetnames:
+            for row in _sheet_rows(wb, "Настройки"):
+                if row and row[0]:
+                    settings[str(row[0])] = row[1] if len(row) > 1 else None
+    finally:
+        wb.close()
+    _last_import = {
+        "participants": len(participants),
+        "reports": len(reports),
+        "settings": len(settings),
+        "parse_ms": round((time.perf_counter() - started_at) * 1000, 1),
+        "bytes": len(file_data),
+    }
+    return {"participants": participants, "reports": reports, "settings": settings}
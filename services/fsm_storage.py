@@ -0,0 +1,51 @@
+import logging
+from typing import Any, Dict, Mapping, Optional
+
+from aiogram.fsm.state import State
+from aiogram.fsm.storage.base import BaseStorage, DefaultKeyBuilder, KeyBuilder, StateType, StorageKey
+
+from services import local_store
+
+
+# Брошенные на середине диалоги удаляются при запуске бота
+_STALE_SECONDS = 7 * 24 * 3600
+
+
+class SQLiteStorage(BaseStorage):
+    """Хранилище FSM aiogram в локальной БД (таблица fsm).
+
+    Хранит только небольшое состояние диалога пользователя (JSON), поэтому данные в нем
+    должны сериализоваться в JSON: списки вместо множеств, строковые ключи словарей.
+    Незаконченные диалоги переживают перезапуск бота.
+    """
+
+    def __init__(self, key_builder: Optional[KeyBuilder] = None):
+        self.key_builder = key_builder or DefaultKeyBuilder()
+
+    async def set_state(self, key: StorageKey, state: StateType = None) -> None:
+        value = state.state if isinstance(state, State) else state
+        await local_store.set_fsm_state(self.key_builder.build(key), value)
+
+    async def get_state(self, key: StorageKey) -> Optional[str]:
+        record = await local_store.get_fsm(self.key_builder.build(key))
+        return record["state"] if record else None
+
+    async def set_data(self, key: StorageKey, data: Mapping[str, Any]) -> None:
+        if not isinstance(data, Mapping):
+            raise TypeError(f"Данные состояния должны быть словарем, получено {type(data).__name__}")
+        await local_store.set_fsm_data(self.key_builder.build(key), dict(data))
+
+    async def get_data(self, key: StorageKey) -> Dict[str, Any]:
+        record = await local_store.get_fsm(self.key_builder.build(key))
+        return record["data"] if record else {}
+
+    async def prune(self, older_than_seconds: int = _STALE_SECONDS) -> int:
+        """Удаляет давно брошенные диалоги; возвращает их число."""
+        removed = await local_store.prune_fsm(older_than_seconds)
+        if removed:
+            logging.info(f"Удалено брошенных состояний диалогов: {removed}")
+        return removed
+
+    async def close(self) -> None:
+        # Соединения с БД закрывает сервис данных при остановке бота
+        pass
@@ -1,29 +1,192 @@
-import io
+import copy
+import json
+import time
 import logging
 import asyncio
-from typing import Dict, List, Any, Optional
+from typing import Dict, List, Any, Optional, Set, Tuple, Callable, Iterator
 from datetime import datetime, timedelta
-from openpyxl import Workbook, load_workbook
-from openpyxl.styles import Font, PatternFill, Alignment
 from services.yandex_sheets import YandexDiskAPI
-from services import local_store
+from services import local_store, excel_io, data_export, data_import, yandex_sheets
+from services.sync_scheduler import SyncScheduler
+from services.leader import LeaderLease
+from services.scheduler import bot_now
 from config_reader import config
 
 
+class _IndexedData:
+    """Данные игры вместе с индексами: участники по user_id, отчеты по (user_id, day),
+    отчеты по пользователю и множество отчитавшихся за каждый день.
+
+    Изменения через методы этого класса обновляют списки в data и индексы согласованно.
+    """
+
+    def __init__(self, data: Dict[str, Any]):
+        self.data = data
+        self.participants: Dict[int, Dict[str, Any]] = {}
+        self.reports: Dict[Tuple[int, int], Dict[str, Any]] = {}
+        self.reports_by_user: Dict[int, Dict[int, Dict[str, Any]]] = {}
+        self.users_by_day: Dict[int, Set[int]] = {}
+        for participant in data.get("participants", []):
+            self.participants[participant["user_id"]] = participant
+        for report in data.get("reports", []):
+            self._index_report(report)
+
+    def _index_report(self, report: Dict[str, Any]) -> None:
+        user_id, day = report["user_id"], report["day"]
+        self.reports[(user_id, day)] = report
+        self.reports_by_user.setdefault(user_id, {})[day] = report
+        self.users_by_day.setdefault(day, set()).add(user_id)
+
+    def _unindex_report(self, user_id: int, day: int) -> None:
+        self.reports.pop((user_id, day), None)
+        user_reports = self.reports_by_user.get(user_id)
+        if user_reports is not None:
+            user_reports.pop(day, None)
+            if not user_reports:
+                del self.reports_by_user[user_id]
+        day_users = self.users_by_day.get(day)
+        if day_users is not None:
+            day_users.discard(user_id)
+            if not day_users:
+                del self.users_by_day[day]
+
+    def upsert_participant(self, participant: Dict[str, Any]) -> None:
+        existing = self.participants.get(participant["user_id"])
+        if existing is not None:
+            # Обновляем на месте: тот же объект лежит и в списке, и в индексе
+            existing.clear()
+            existing.update(participant)
+        else:
+            self.data["participants"].append(participant)
+            self.participants[participant["user_id"]] = participant
+
+    def delete_participant(self, user_id: int) -> None:
+        if self.participants.pop(user_id, None) is None:
+            return
+        self.data["participants"] = [p for p in self.data["participants"] if p["user_id"] != user_id]
+        if user_id in self.reports_by_user:
+            for day in list(self.reports_by_user[user_id]):
+                self._unindex_report(user_id, day)
+            self.data["reports"] = [r for r in self.data["reports"] if r["user_id"] != user_id]
+
+    def set_statuses(self, user_ids: List[int], status: str) -> None:
+        for user_id in user_ids:
+            participant = self.participants.get(user_id)
+            if participant is not None:
+                participant["status"] = status
+
+    def set_goals(self, user_id: int, goals: Dict[int, str]) -> None:
+        participant = self.participants.get(user_id)
+        if participant is not None:
+            for goal_num, text in goals.items():
+                participant["goals"][goal_num - 1] = text
+
+    def upsert_report(self, report: Dict[str, Any]) -> None:
+        existing = self.reports.get((report["user_id"], report["day"]))
+        if existing is not None:
+            existing.clear()
+            existing.update(report)
+        else:
+            self.data["reports"].append(report)
+            self._index_report(report)
+
+    def delete_report(self, user_id: int, day: int) -> None:
+        if (user_id, day) not in self.reports:
+            return
+        self._unindex_report(user_id, day)
+        self.data["reports"] = [r for r in self.data["reports"] if not (r["user_id"] == user_id and r["day"] == day)]
+
+    def set_settings(self, settings: Dict[str, Any]) -> None:
+        self.data["settings"] = settings
+
+
+class _DataSnapshot:
+    """Декодированные данные игры в памяти процесса, общие для всех GameDataManager.
+
+    Снимок помечен версией data_version локальной БД: пока версия в БД не изменилась
+    (в том числе из другого процесса), читатели получают его без запроса к таблицам.
+    Записи этого процесса обновляют снимок на месте, если между ними не было чужих записей.
+    Снимок общий — вызывающий код не должен менять его без последующего сохранения.
+    """
+
+    def __init__(self):
+        self.version: Optional[int] = None
+        self.indexed: Optional[_IndexedData] = None
+        self.hits = 0
+        self.misses = 0
+
+    @property
+    def data(self) -> Optional[Dict[str, Any]]:
+        return self.indexed.data if self.indexed is not None else None
+
+    def set(self, version: int, data: Dict[str, Any]) -> None:
+        self.version = version
+        self.indexed = _IndexedData(data)
+
+    def invalidate(self) -> None:
+        self.version = None
+        self.indexed = None
+
+    def apply(self, version: int, change: Callable[[_IndexedData], None]) -> None:
+        """Применяет изменение к снимку, если запись следует сразу за ним по версии."""
+        if self.indexed is not None and self.version is not None and version == self.version + 1:
+            change(self.indexed)
+            self.version = version
+        else:
+            self.invalidate()
+
+    def stats(self) -> Dict[str, Any]:
+        total = self.hits + self.misses
+        return {
+            "version": self.version,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / total, 3) if total else 0.0,
+        }
+
+
+_snapshot = _DataSnapshot()
+
+# Отложенная выгрузка на Я.Диск общая для всех менеджеров процесса
+_sync = SyncScheduler()
+
+# Если бот и воркеры API работают с одной БД, выгрузку ведет только процесс-лидер:
+# записи остальных он видит по журналу изменений, опрашивая его раз в _LEADER_POLL_SECONDS
+_sync_lease = LeaderLease("yadisk_sync")
+_LEADER_POLL_SECONDS = 5
+_leader_task: Optional[asyncio.Task] = None
+
+# Сколько ждать последней выгрузки при остановке (меньше срока аренды лидера и stop_grace_period)
+_SHUTDOWN_SYNC_TIMEOUT_SECONDS = 20
+
+# Между полными выгрузками книги на Я.Диск уходят только части журнала изменений (JSONL)
+_FULL_SYNC_INTERVAL_SECONDS = 30 * 60
+_MAX_LEDGER_PARTS = 48
+
+
+def _indexed(data: Dict[str, Any]) -> _IndexedData:
+    """Индексы для данных: у общего снимка они уже построены, для прочих словарей строятся заново."""
+    if _snapshot.indexed is not None and data is _snapshot.indexed.data:
+        return _snapshot.indexed
+    return _IndexedData(data)
+
+
 class GameDataManager:
-    """Менеджер для работы с данными игры через Excel файл"""
+    """Менеджер для работы с данными игры через Excel файл.
+
+    В процессе используется один экземпляр — get_game_data(); start()/stop() вызываются
+    при запуске и остановке бота или API.
+    """
     
     def __init__(self):
         self.yandex = YandexDiskAPI(config.yadisk_token.get_secret_value())
         self.file_path = config.yadisk_file_path
         self._copy_file_path = self.file_path.replace('.xlsx', '_copy.xlsx')  # Путь к копии
+        self._ledger_dir = self.file_path.replace('.xlsx', '_changes')  # Части журнала изменений
         self._cache: Optional[bytes] = None
         self._cache_time: Optional[datetime] = None
         self._cache_ttl = timedelta(minutes=5)  # Кэш на 5 минут
         self._main_file_mtime: Optional[datetime] = None  # Время последнего изменения основного файла
-        # Локальная БД + отложенная синхронизация
-        self._sync_task = None
-        self._sync_delay_seconds = 60
     
     async def _get_working_file_path(self) -> str:
         """Определяет, с каким файлом работать: основным или копией"""
@@ -148,52 +311,7 @@ class GameDataManager:
     
     async def _create_new_file(self) -> bytes:
         """Создает новый файл Excel с базовой структурой"""
-        wb = Workbook()
-        ws = wb.active
-        ws.title = "Участники"
-        
-        # Заголовки
-        headers = ["User ID", "Username", "Full Name", "Game Name", "Registered Date", "Status"] + \
-                  [f"Goal {i}" for i in range(1, 11)]
-        ws.append(headers)
-        
-        # Стили для заголовков
-        header_fill = PatternFill(start_color="366092", end_color="366092", fill_type="solid")
-        header_font = Font(bold=True, color="FFFFFF")
-        for cell in ws[1]:
-            cell.fill = header_fill
-            cell.font = header_font
-            cell.alignment = Alignment(horizontal="center", vertical="center")
-        
-        # Лист для отчетов
-        ws_reports = wb.create_sheet("Отчеты")
-        report_headers = ["User ID", "Day", "Date", "Goal 1", "Goal 2", "Goal 3", "Goal 4", "Goal 5",
-                         "Goal 6", "Goal 7", "Goal 8", "Goal 9", "Goal 10", "Rest Day"]
-        ws_reports.append(report_headers)
-        
-        # Стили для заголовков отчетов
-        for cell in ws_reports[1]:
-            cell.fill = header_fill
-            cell.font = header_font
-            cell.alignment = Alignment(horizontal="center", vertical="center")
-        
-        # Лист для настроек
-        ws_settings = wb.create_sheet("Настройки")
-        settings_headers = ["Key", "Value"]
-        ws_settings.append(settings_headers)
-        
-        # Стили для заголовков настроек
-        for cell in ws_settings[1]:
-            cell.fill = header_fill
-            cell.font = header_font
-            cell.alignment = Alignment(horizontal="center", vertical="center")
-        
-        # Сохраняем в байты
-        buffer = io.BytesIO()
-        wb.save(buffer)
-        buffer.seek(0)
-        data = buffer.read()
-        buffer.close()
+        data = await excel_io.run_job("build", excel_io.build_workbook)
         
         # Сначала сохраняем в основной файл (при создании нового файла)
         await self.yandex.upload_file(data, self.file_path, overwrite=True)
@@ -209,186 +327,198 @@ class GameDataManager:
         
         return data
     
-    async def _build_excel_bytes(self, data: Dict[str, Any]) -> bytes:
-        """Строит Excel байты из словаря данных."""
-        wb = Workbook()
-        if wb.sheetnames:
-            wb.remove(wb.active)
-        # Участники
-        ws = wb.create_sheet("Участники")
-        headers = ["User ID", "Username", "Full Name", "Game Name", "Registered Date", "Status"] + \
-                  [f"Goal {i}" for i in range(1, 11)]
-        ws.append(headers)
-        header_fill = PatternFill(start_color="366092", end_color="366092", fill_type="solid")
-        header_font = Font(bold=True, color="FFFFFF")
-        for cell in ws[1]:
-            cell.fill = header_fill
-            cell.font = header_font
-            cell.alignment = Alignment(horizontal="center", vertical="center")
-        for participant in data["participants"]:
-            row = [
-                participant["user_id"],
-                participant["username"],
-                participant["full_name"],
-                participant["game_name"],
-                participant["registered_date"],
-                participant["status"],
-            ] + participant["goals"]
-            ws.append(row)
-        # Отчеты
-        ws_reports = wb.create_sheet("Отчеты")
-        report_headers = ["User ID", "Day", "Date", "Goal 1", "Goal 2", "Goal 3", "Goal 4", "Goal 5",
-                          "Goal 6", "Goal 7", "Goal 8", "Goal 9", "Goal 10", "Rest Day"]
-        ws_reports.append(report_headers)
-        for cell in ws_reports[1]:
-            cell.fill = header_fill
-            cell.font = header_font
-            cell.alignment = Alignment(horizontal="center", vertical="center")
-        for report in data["reports"]:
-            row = [report["user_id"], report["day"], report["date"]] + report["progress"] + ["Да" if report.get("rest_day") else "Нет"]
-            ws_reports.append(row)
-        # Настройки
-        ws_settings = wb.create_sheet("Настройки")
-        settings_headers = ["Key", "Value"]
-        ws_settings.append(settings_headers)
-        for cell in ws_settings[1]:
-            cell.fill = header_fill
-            cell.font = header_font
-            cell.alignment = Alignment(horizontal="center", vertical="center")
-        for key, value in (data.get("settings", {}) or {}).items():
-            if value is not None:
-                ws_settings.append([key, value])
-        buffer = io.BytesIO()
-        wb.save(buffer)
-        buffer.seek(0)
-        out = buffer.read()
-        buffer.close()
-        return out
-
-    async def _schedule_sync(self) -> None:
-        """Планирует отложенную синхронизацию на Я.Диск."""
-        async def _job():
-            try:
-                await asyncio.sleep(self._sync_delay_seconds)
-                data = await local_store.get_json("all_data")
-                if not data:
-                    return
-                file_data = await self._build_excel_bytes(data)
-                try:
-                    await self.yandex.upload_file(file_data, self._copy_file_path, overwrite=True)
-                except Exception as e:
-                    logging.error(f"Ошибка сохранения копии на Я.Диске: {e}")
-                    return
+    async def _build_excel_bytes(self) -> bytes:
+        """Строит Excel байты из локальной БД потоково (в пуле потоков, не блокируя event loop)."""
+        return await excel_io.run_job("build", excel_io.build_workbook_from_store)
+
+    async def _sync_to_remote(self) -> None:
+        """Выгружает изменения на Я.Диск: часть журнала или, по расписанию, всю книгу."""
+        if not await local_store.is_loaded():
+            return
+        if _sync_lease.active and not _sync_lease.is_leader:
+            return  # лидерство перешло к другому процессу — выгрузит он
+        pending = await local_store.load_changes()
+        if not pending["last_id"]:
+            return
+        ledger = await local_store.get_json(local_store.LEDGER_PARTS_KEY) or {}
+        parts: List[str] = ledger.get("parts", [])
+        last_full = int(await local_store.get_value(local_store.LAST_FULL_SYNC_KEY) or 0)
+        if (pending["reset"] or len(parts) >= _MAX_LEDGER_PARTS
+                or time.time() - last_full >= _FULL_SYNC_INTERVAL_SECONDS):
+            await self._upload_full_workbook()
+            await local_store.set_value(local_store.LAST_FULL_SYNC_KEY, str(int(time.time())))
+            await local_store.set_json(local_store.LEDGER_PARTS_KEY, {"parts": []})
+            await local_store.prune_changes(pending["last_id"])
+            # Книга уже содержит все из журнала; старые части удаляем без гарантий
+            for part in parts:
                 try:
-                    await self.yandex.copy_file(self._copy_file_path, self.file_path)
+                    await self.yandex.delete_file(part)
                 except Exception as e:
-                    logging.warning(f"Не удалось синхронизировать в основной файл: {e}")
-            except Exception as e:
-                logging.error(f"Ошибка фоновой синхронизации: {e}")
+                    logging.warning(f"Не удалось удалить часть журнала {part}: {e}")
+            return
+        part = await self._upload_ledger_part(pending["changes"])
+        await local_store.set_json(local_store.LEDGER_PARTS_KEY, {"parts": parts + [part]})
+        await local_store.prune_changes(pending["last_id"])
 
-        # Отменяем предыдущую задачу, если еще не стартовала
+    async def _upload_full_workbook(self) -> None:
+        """Выгружает локальную БД в копию на Я.Диске и затем в основной файл."""
+        file_data = await self._build_excel_bytes()
+        await self.yandex.upload_file(file_data, self._copy_file_path, overwrite=True)
         try:
-            if self._sync_task and not self._sync_task.done():
-                self._sync_task.cancel()
-        except Exception:
-            pass
-        loop = asyncio.get_running_loop()
-        self._sync_task = loop.create_task(_job())
+            await self.yandex.copy_file(self._copy_file_path, self.file_path)
+        except Exception as e:
+            logging.warning(f"Не удалось синхронизировать в основной файл: {e}")
+
+    async def _upload_ledger_part(self, changes: List[Dict[str, Any]]) -> str:
+        """Выгружает изменения одной частью журнала (JSONL, по строке на изменение); возвращает путь."""
+        body = "".join(json.dumps(change, ensure_ascii=False, default=str) + "\n" for change in changes)
+        first_id, last_id = changes[0]["change_id"], changes[-1]["change_id"]
+        path = f"{self._ledger_dir}/{datetime.now().strftime('%Y%m%d-%H%M%S')}-{first_id}-{last_id}.jsonl"
+        await self.yandex.create_folder(self._ledger_dir)
+        await self.yandex.upload_file(body.encode("utf-8"), path, overwrite=True)
+        return path
+
+    async def _schedule_sync(self, urgent: bool = False) -> None:
+        """Планирует отложенную синхронизацию на Я.Диск (записи объединяются в одну выгрузку).
+
+        В ведомом процессе только передает лидеру просьбу о срочной выгрузке: саму запись
+        лидер найдет в журнале изменений.
+        """
+        if _sync_lease.active and not _sync_lease.is_leader:
+            if urgent:
+                await local_store.request_urgent_sync()
+            return
+        _sync.mark_dirty(self._sync_to_remote, urgent=urgent)
+
+    async def start(self) -> None:
+        """Запуск сервиса данных: открывает локальную БД и включает выбор лидера выгрузки."""
+        await local_store.init_db()
+        self.start_sync_leader()
+
+    async def stop(self) -> None:
+        """Остановка сервиса данных: последняя выгрузка на Я.Диск, затем лидерство, HTTP-сессия и БД.
+
+        Ошибки выгрузки только логируются — остановка не должна зависать или падать.
+        """
+        await self._stop_leader_loop()
+        try:
+            await self.flush_sync()
+        except Exception as e:
+            logging.error(f"Ошибка выгрузки при остановке: {e}")
+        await self.stop_sync_leader()
+        await yandex_sheets.close_session()
+        await local_store.close_db()
+
+    async def flush_sync(self, timeout: float = _SHUTDOWN_SYNC_TIMEOUT_SECONDS) -> Dict[str, Any]:
+        """Выполняет отложенную выгрузку сразу, не дольше timeout; возвращает и логирует итог."""
+        started_at = time.perf_counter()
+        pending = await local_store.count_changes()
+        result = {"pending_changes": pending, "flushed": False, "timed_out": False}
+        if _sync_lease.active and not _sync_lease.is_leader:
+            logging.info(f"Остановка: выгрузку {pending} изменений выполнит процесс-лидер")
+            return result
+        if pending and not _sync.dirty:
+            # Записи других процессов, которые лидер еще не успел заметить
+            _sync.mark_dirty(self._sync_to_remote)
+        try:
+            result["flushed"] = await asyncio.wait_for(_sync.flush(), timeout)
+        except asyncio.TimeoutError:
+            result["timed_out"] = True
+        result["remaining_changes"] = await local_store.count_changes()
+        result["duration_seconds"] = round(time.perf_counter() - started_at, 2)
+        if result["timed_out"]:
+            logging.warning(f"Остановка: выгрузка не уложилась в {timeout} с, "
+                            f"в журнале осталось {result['remaining_changes']} изменений")
+        elif result["flushed"]:
+            logging.info(f"Остановка: выгружено {pending - result['remaining_changes']} изменений "
+                         f"за {result['duration_seconds']} с")
+        else:
+            logging.info(f"Остановка: отложенной выгрузки нет, в журнале {result['remaining_changes']} изменений")
+        return result
+
+    def start_sync_leader(self) -> None:
+        """Включает выбор лидера выгрузки (вызывать при старте каждого процесса с общей БД)."""
+        global _leader_task
+        if _leader_task is None or _leader_task.done():
+            _leader_task = asyncio.get_running_loop().create_task(self._sync_leader_loop())
+
+    async def stop_sync_leader(self) -> None:
+        """Останавливает выбор лидера и отдает аренду другому процессу."""
+        await self._stop_leader_loop()
+        await _sync_lease.release()
+
+    async def _stop_leader_loop(self) -> None:
+        global _leader_task
+        if _leader_task is not None:
+            _leader_task.cancel()
+            try:
+                await _leader_task
+            except asyncio.CancelledError:
+                pass
+            _leader_task = None
+
+    async def _sync_leader_loop(self) -> None:
+        seen_change_id: Optional[int] = None
+        while True:
+            try:
+                if await _sync_lease.refresh():
+                    last_id = await local_store.last_change_id()
+                    urgent = await local_store.take_urgent_sync_request()
+                    if urgent:
+                        _sync.mark_dirty(self._sync_to_remote, urgent=True)
+                    # Чужие записи (и то, что новый лидер застал в журнале) планируем как обычные;
+                    # если выгрузка уже запланирована, она и так заберет весь журнал
+                    elif last_id and last_id != seen_change_id and not _sync.dirty:
+                        _sync.mark_dirty(self._sync_to_remote)
+                    seen_change_id = last_id
+                else:
+                    seen_change_id = None
+            except Exception as e:
+                logging.error(f"Ошибка цикла лидера синхронизации: {e}")
+            await asyncio.sleep(_LEADER_POLL_SECONDS)
+
+    def get_sync_status(self) -> Dict[str, Any]:
+        """Состояние фоновой синхронизации с Я.Диском"""
+        return {**_sync.status(), "leader": _sync_lease.is_leader, "election": _sync_lease.active}
 
     async def get_all_data(self) -> Dict[str, Any]:
-        """Получает все данные из локальной БД (или инициализирует из Я.Диска один раз)."""
+        """Получает все данные из снимка в памяти, локальной БД (или инициализирует из Я.Диска один раз)."""
         try:
-            data = await local_store.get_json("all_data")
-            if data is not None:
+            version = await local_store.get_data_version()
+            if _snapshot.data is not None and _snapshot.version == version:
+                _snapshot.hits += 1
+                return _snapshot.data
+            _snapshot.misses += 1
+            if await local_store.is_loaded():
+                data = await local_store.load_all()
+                _snapshot.set(version, data)
                 return data
             # Инициализация из Я.Диска, если локально пусто
             file_data = await self._get_file_data()
-            wb = load_workbook(io.BytesIO(file_data))
-            
-            # Проверяем и создаем лист "Участники", если его нет
-            if "Участники" not in wb.sheetnames:
+            if not await self._import_remote(file_data):
                 logging.warning("Лист 'Участники' не найден в файле, возвращаем пустую структуру")
                 return self._create_empty_data_structure()
-            
-            # Участники
-            ws = wb["Участники"]
-            participants = []
-            for row in ws.iter_rows(min_row=2, values_only=True):
-                if row and row[0] is not None:  # User ID не пустой
-                    # Проверяем, что достаточно столбцов
-                    goals = []
-                    if len(row) > 6:
-                        goals = [row[5+i] or "" if 5+i < len(row) else "" for i in range(1, 11)]
-                    else:
-                        goals = [""] * 10
-                        
-                    participants.append({
-                        "user_id": row[0],
-                        "username": row[1] if len(row) > 1 else "",
-                        "full_name": row[2] if len(row) > 2 else "",
-                        "game_name": row[3] if len(row) > 3 else "",
-                        "registered_date": row[4] if len(row) > 4 else "",
-                        "status": row[5] if len(row) > 5 else "active",
-                        "goals": goals
-                    })
-            
-            # Отчеты
-            reports = []
-            if "Отчеты" in wb.sheetnames:
-                ws_reports = wb["Отчеты"]
-                for row in ws_reports.iter_rows(min_row=2, values_only=True):
-                    if row and row[0] is not None:
-                        progress = []
-                        if len(row) > 3:
-                            progress = [row[2+i] or "" if 2+i < len(row) else "" for i in range(1, 11)]
-                        else:
-                            progress = [""] * 10
-                        
-                        reports.append({
-                            "user_id": row[0],
-                            "day": row[1] if len(row) > 1 else 1,
-                            "date": row[2] if len(row) > 2 else "",
-                            "progress": progress,
-                            "rest_day": row[13] == "Да" if len(row) > 13 and row[13] else False
-                        })
-            
-            # Настройки
-            settings = {}
-            if "Настройки" in wb.sheetnames:
-                ws_settings = wb["Настройки"]
-                for row in ws_settings.iter_rows(min_row=2, values_only=True):
-                    if row and row[0]:
-                        key = str(row[0])
-                        value = row[1] if len(row) > 1 else None
-                        settings[key] = value
-            
-            data_dict = {
-                "participants": participants,
-                "reports": reports,
-                "settings": settings
-            }
-            await local_store.set_json("all_data", data_dict)
-            return data_dict
+            return _snapshot.data
         except Exception as e:
-            logging.error(f"Ошибка при чтении данных из файла: {e}")
-            # Возвращаем пустую структуру при ошибке
-            empty = self._create_empty_data_structure()
-            await local_store.set_json("all_data", empty)
-            return empty
+            # Ошибка чтения (например, database is locked) ничего не пишет: пустые данные ушли бы
+            # в журнал как полная перезапись и затерли бы файлы на Я.Диске
+            logging.error(f"Ошибка при чтении данных: {e}")
+            if _snapshot.data is not None:
+                return _snapshot.data
+            raise
 
     async def refresh_local_cache_from_remote(self) -> Dict[str, Any]:
         """Принудительно перечитывает данные из удаленного файла и обновляет локальный кеш."""
         try:
             # Если локальные данные свежее минуты — не перезатираем
             try:
-                local_updated_at = await local_store.get_updated_at("all_data")
+                local_updated_at = await local_store.get_data_updated_at()
             except Exception:
                 local_updated_at = None
             from time import time
             now_epoch = int(time())
             if local_updated_at and (now_epoch - local_updated_at) < 60:
-                current = await local_store.get_json("all_data")
-                return current or self._create_empty_data_structure()
+                return await self._load_local_or_empty()
 
             # Смотрим, новее ли удаленный файл локальных данных
             remote_mtime = None
@@ -405,111 +535,78 @@ class GameDataManager:
                 remote_mtime = None
 
             if local_updated_at and remote_mtime and remote_mtime <= local_updated_at:
-                current = await local_store.get_json("all_data")
-                return current or self._create_empty_data_structure()
+                return await self._load_local_or_empty()
 
             file_data = await self._get_file_data(force_refresh=True)
-            wb = load_workbook(io.BytesIO(file_data))
-
-            # Если нет листа участников — сохранить пустую структуру
-            if "Участники" not in wb.sheetnames:
+            if not await self._import_remote(file_data):
+                # Нет листа участников — сохраняем пустую структуру
                 data = self._create_empty_data_structure()
-                await local_store.set_json("all_data", data)
+                await self._replace_local(data)
                 return data
-
-            # Участники
-            ws = wb["Участники"]
-            participants = []
-            for row in ws.iter_rows(min_row=2, values_only=True):
-                if row and row[0] is not None:
-                    goals = []
-                    if len(row) > 6:
-                        goals = [row[5+i] or "" if 5+i < len(row) else "" for i in range(1, 11)]
-                    else:
-                        goals = [""] * 10
-                    participants.append({
-                        "user_id": row[0],
-                        "username": row[1] if len(row) > 1 else "",
-                        "full_name": row[2] if len(row) > 2 else "",
-                        "game_name": row[3] if len(row) > 3 else "",
-                        "registered_date": row[4] if len(row) > 4 else "",
-                        "status": row[5] if len(row) > 5 else "active",
-                        "goals": goals
-                    })
-
-            # Отчеты
-            reports = []
-            if "Отчеты" in wb.sheetnames:
-                ws_reports = wb["Отчеты"]
-                for row in ws_reports.iter_rows(min_row=2, values_only=True):
-                    if row and row[0] is not None:
-                        progress = []
-                        if len(row) > 3:
-                            progress = [row[2+i] or "" if 2+i < len(row) else "" for i in range(1, 11)]
-                        else:
-                            progress = [""] * 10
-                        reports.append({
-                            "user_id": row[0],
-                            "day": row[1] if len(row) > 1 else 1,
-                            "date": row[2] if len(row) > 2 else "",
-                            "progress": progress,
-                            "rest_day": row[13] == "Да" if len(row) > 13 and row[13] else False
-                        })
-
-            # Настройки
-            settings = {}
-            if "Настройки" in wb.sheetnames:
-                ws_settings = wb["Настройки"]
-                for row in ws_settings.iter_rows(min_row=2, values_only=True):
-                    if row and row[0]:
-                        key = str(row[0])
-                        value = row[1] if len(row) > 1 else None
-                        settings[key] = value
-
-            data_dict = {
-                "participants": participants,
-                "reports": reports,
-                "settings": settings
-            }
-            await local_store.set_json("all_data", data_dict)
             # Инвалидируем in-memory кеш
             self._cache = None
             self._cache_time = None
-            return data_dict
+            return _snapshot.data
         except Exception as e:
             logging.error(f"Ошибка принудительного обновления данных: {e}")
             # В случае ошибки не ломаемся: возвращаем локальные данные
-            current = await local_store.get_json("all_data")
-            return current or self._create_empty_data_structure()
+            return await self._load_local_or_empty()
+
+    async def _import_remote(self, file_data: bytes) -> bool:
+        """Разбирает удаленную книгу и перезаписывает ею локальную БД; False — если листа участников нет."""
+        data = await excel_io.run_job("parse", excel_io.parse_workbook, file_data)
+        if data is None:
+            return False
+        await self._replace_local(data, from_remote=True)
+        stats = excel_io.get_metrics()["last_import"] or {}
+        logging.info(
+            f"Импорт книги: участников {stats.get('participants')}, отчетов {stats.get('reports')}, "
+            f"настроек {stats.get('settings')}, разбор {stats.get('parse_ms')} мс"
+        )
+        return True
+
+    async def _load_local_or_empty(self) -> Dict[str, Any]:
+        if await local_store.is_loaded():
+            return await self.get_all_data()
+        return self._create_empty_data_structure()
+
+    async def _replace_local(self, data: Dict[str, Any], from_remote: bool = False) -> None:
+        """Полностью перезаписывает локальную БД и снимок в памяти.
+
+        from_remote=True — данные только что прочитаны с Я.Диска, журнал изменений очищается.
+        """
+        normalized = {
+            "participants": [local_store.normalize_participant(p) for p in data.get("participants", [])],
+            "reports": [local_store.normalize_report(r) for r in data.get("reports", [])],
+            "settings": {k: v for k, v in (data.get("settings", {}) or {}).items() if v is not None},
+        }
+        version = await local_store.replace_all(normalized, synced=from_remote)
+        _snapshot.set(version, normalized)
+
+    def get_cache_stats(self) -> Dict[str, Any]:
+        """Статистика попаданий в снимок данных в памяти"""
+        return _snapshot.stats()
     
-    async def save_data(self, data: Dict[str, Any], sync_to_main: bool = False) -> None:
-        """Сохраняет данные локально и планирует синхронизацию на Я.Диск."""
-        await local_store.set_json("all_data", data)
+    async def _after_write(self, sync_to_main: bool) -> None:
+        """Инвалидирует кеш и планирует синхронизацию после записи в локальную БД."""
         # инвалидация in-memory
         self._cache = None
         self._cache_time = None
         # Планируем фоновой синк; если sync_to_main=True — синкнем раньше (через малую задержку)
-        if sync_to_main:
-            prev = self._sync_delay_seconds
-            self._sync_delay_seconds = 2
-            await self._schedule_sync()
-            self._sync_delay_seconds = prev
-        else:
-            await self._schedule_sync()
+        await self._schedule_sync(urgent=sync_to_main)
     
     async def get_settings(self) -> Dict[str, Any]:
-        """Получает настройки из файла"""
+        """Получает настройки из файла (копию — снимок в памяти общий)"""
         data = await self.get_all_data()
-        return data.get("settings", {})
+        return copy.deepcopy(data.get("settings", {}))
     
     async def save_settings(self, settings: Dict[str, Any]) -> None:
         """Сохраняет настройки в файл"""
-        data = await self.get_all_data()
-        data["settings"] = settings
-        await self.save_data(data, sync_to_main=True)
-        # Инвалидируем кеш, чтобы изменения применились сразу
-        self._cache = None
-        self._cache_time = None
+        await self.get_all_data()  # гарантируем первичную загрузку данных
+        settings = {k: v for k, v in settings.items() if v is not None}
+        version = await local_store.replace_settings(settings)
+        _snapshot.apply(version, lambda indexed: indexed.set_settings(copy.deepcopy(settings)))
+        await self._after_write(sync_to_main=True)
     
     async def get_chat_config(self) -> Dict[str, Optional[int]]:
         """Получает конфигурацию чата (chat_id и thread_id)"""
@@ -533,16 +630,191 @@ class GameDataManager:
     
     def is_user_registered(self, user_id: int, data: Dict) -> bool:
         """Проверяет, зарегистрирован ли пользователь"""
-        for participant in data["participants"]:
-            if participant["user_id"] == user_id:
-                return True
-        return False
+        return user_id in _indexed(data).participants
+
+    def find_participant(self, user_id: int, data: Dict) -> Optional[Dict[str, Any]]:
+        """Находит участника по user_id"""
+        return _indexed(data).participants.get(user_id)
+
+    def find_report(self, user_id: int, day: int, data: Dict) -> Optional[Dict[str, Any]]:
+        """Находит отчет пользователя за день"""
+        return _indexed(data).reports.get((user_id, day))
+
+    def has_report(self, user_id: int, day: int, data: Dict) -> bool:
+        """Проверяет, есть ли у пользователя отчет за день"""
+        return (user_id, day) in _indexed(data).reports
+
+    def get_user_reports(self, user_id: int, data: Dict) -> List[Dict[str, Any]]:
+        """Получает отчеты пользователя (по возрастанию дня)"""
+        user_reports = _indexed(data).reports_by_user.get(user_id, {})
+        return [user_reports[day] for day in sorted(user_reports)]
+
+    def get_day_report_user_ids(self, day: int, data: Dict) -> Set[int]:
+        """Получает множество user_id, отправивших отчет за день"""
+        return set(_indexed(data).users_by_day.get(day, ()))
+    
+    def get_day_reports(self, day: int, data: Dict) -> Dict[int, Dict[str, Any]]:
+        """Получает отчеты за день по user_id"""
+        indexed = _indexed(data)
+        return {user_id: indexed.reports[(user_id, day)] for user_id in indexed.users_by_day.get(day, ())}
+    
+    def get_user_goals(self, user_id: int, data: Dict) -> List[str]:
+        """Получает цели пользователя (всегда возвращает список из 10 элементов)"""
+        participant = _indexed(data).participants.get(user_id)
+        if participant is not None:
+            goals = list(participant.get("goals", []))
+            # Гарантируем, что всегда возвращаем список из 10 элементов
+            if len(goals) < 10:
+                goals.extend([""] * (10 - len(goals)))
+            return goals[:10]  # Обрезаем до 10 элементов, если больше
+        # Если пользователь не найден, возвращаем пустой список из 10 элементов
+        return [""] * 10
     
-    def register_user(self, user_id: int, username: str, full_name: str, game_name: str, data: Dict) -> None:
-        """Регистрирует нового пользователя"""
-        if self.is_user_registered(user_id, data):
+    def get_user_reports_count(self, user_id: int, data: Dict) -> int:
+        """Получает количество отчетов пользователя"""
+        return len(_indexed(data).reports_by_user.get(user_id, ()))
+
+    # Построчные операции: пишут только затронутую строку локальной БД
+    async def _ensure_loaded(self) -> None:
+        """Гарантирует, что локальная БД проинициализирована из Я.Диска до первой записи."""
+        if _snapshot.data is None and not await local_store.is_loaded():
+            await self.get_all_data()
+
+    async def get_participant(self, user_id: int) -> Optional[Dict[str, Any]]:
+        """Получает участника по user_id"""
+        await self._ensure_loaded()
+        return await local_store.get_participant(user_id)
+
+    async def upsert_participant(self, participant: Dict[str, Any], sync_to_main: bool = True) -> None:
+        """Создает или обновляет участника"""
+        await self._ensure_loaded()
+        version = await local_store.upsert_participant(participant)
+        stored = local_store.normalize_participant(participant)
+        _snapshot.apply(version, lambda indexed: indexed.upsert_participant(stored))
+        await self._after_write(sync_to_main)
+
+    async def delete_participant(self, user_id: int) -> bool:
+        """Удаляет участника и все его отчеты"""
+        await self._ensure_loaded()
+        version = await local_store.delete_participant(user_id)
+        if version is None:
+            return False
+        _snapshot.apply(version, lambda indexed: indexed.delete_participant(user_id))
+        await self._after_write(sync_to_main=True)
+        return True
+
+    async def set_participant_statuses(self, user_ids: List[int], status: str, sync_to_main: bool = True) -> None:
+        """Меняет статус у нескольких участников одной записью"""
+        await self._ensure_loaded()
+        version = await local_store.set_participant_statuses(user_ids, status)
+        if version is None:
             return
-        
+        _snapshot.apply(version, lambda indexed: indexed.set_statuses(user_ids, status))
+        await self._after_write(sync_to_main)
+
+    async def get_report(self, user_id: int, day: int) -> Optional[Dict[str, Any]]:
+        """Получает отчет пользователя за день"""
+        await self._ensure_loaded()
+        return await local_store.get_report(user_id, day)
+
+    async def upsert_report(self, report: Dict[str, Any], sync_to_main: bool = True) -> None:
+        """Создает или обновляет отчет (ключ — user_id и day)"""
+        await self._ensure_loaded()
+        version = await local_store.upsert_report(report)
+        stored = local_store.normalize_report(report)
+        _snapshot.apply(version, lambda indexed: indexed.upsert_report(stored))
+        await self._after_write(sync_to_main)
+
+    async def delete_report(self, user_id: int, day: int) -> bool:
+        """Удаляет отчет пользователя за день"""
+        await self._ensure_loaded()
+        version = await local_store.delete_report(user_id, day)
+        if version is None:
+            return False
+        _snapshot.apply(version, lambda indexed: indexed.delete_report(user_id, day))
+        await self._after_write(sync_to_main=True)
+        return True
+
+    async def get_progress_stats(self, user_id: int) -> Dict[int, Dict[str, Any]]:
+        """Агрегаты прогресса пользователя по номеру цели (поддерживаются при записи отчетов)"""
+        await self._ensure_loaded()
+        return await local_store.get_progress_stats(user_id)
+
+    async def get_all_progress_stats(self) -> Dict[int, Dict[int, Dict[str, Any]]]:
+        """Агрегаты прогресса всех пользователей: user_id -> номер цели -> агрегаты"""
+        await self._ensure_loaded()
+        return await local_store.get_all_progress_stats()
+
+    async def query_reports(self, **filters: Any) -> Dict[str, Any]:
+        """Страница отчетов с фильтрами прямо из БД (см. local_store.query_reports)"""
+        await self._ensure_loaded()
+        return await local_store.query_reports(**filters)
+
+    async def export_stream(self, **options: Any) -> Iterator[bytes]:
+        """Потоковая выгрузка данных из БД (см. data_export.iter_export)"""
+        await self._ensure_loaded()
+        return data_export.iter_export(**options)
+
+    async def bulk_import(self, parsed: Dict[str, Any], dry_run: bool = False,
+                          sync_to_main: bool = False) -> Dict[str, Any]:
+        """Применяет проверенный импорт (см. data_import.parse) одной транзакцией.
+
+        Отчеты неизвестных участников отбрасываются с ошибкой. Вместо полной перезаписи — upsert
+        строк и одна отложенная синхронизация с Я.Диском (sync_to_main=True — вскоре, как после
+        правок админа). Возвращает сводку с ошибками и скоростью.
+        """
+        data = await self.get_all_data()
+        data_import.check_references(parsed, set(_indexed(data).participants))
+        participants, reports, settings = parsed["participants"], parsed["reports"], parsed["settings"]
+        started_at = time.perf_counter()
+        if not dry_run and (participants or reports or settings):
+            version = await local_store.bulk_upsert(participants, reports, settings)
+            stored_reports = [local_store.normalize_report(r) for r in reports]
+            merged_settings = {**data.get("settings", {}), **{k: v for k, v in settings.items() if v is not None}}
+
+            def change(indexed: _IndexedData) -> None:
+                for participant in participants:
+                    # Как в БД: поля, которых нет в импорте, остаются прежними
+                    existing = indexed.participants.get(participant["user_id"], {})
+                    indexed.upsert_participant(local_store.normalize_participant({**existing, **participant}))
+                for report in stored_reports:
+                    indexed.upsert_report(report)
+                if settings:
+                    indexed.set_settings(merged_settings)
+
+            _snapshot.apply(version, change)
+            await self._after_write(sync_to_main)
+        apply_ms = (time.perf_counter() - started_at) * 1000
+        applied = len(participants) + len(reports)
+        total_ms = parsed["parse_ms"] + apply_ms
+        return {
+            "dry_run": dry_run,
+            "rows": parsed["rows"],
+            "participants": len(participants),
+            "reports": len(reports),
+            "settings": len(settings),
+            "error_count": parsed["error_count"],
+            "errors": parsed["errors"],
+            "parse_ms": parsed["parse_ms"],
+            "apply_ms": round(apply_ms, 2),
+            "rows_per_second": round(parsed["rows"] / (total_ms / 1000), 1) if total_ms > 0 else 0.0,
+            "applied": 0 if dry_run else applied,
+        }
+
+    async def get_leaderboard(self, offset: int = 0, limit: Optional[int] = None) -> Dict[str, Any]:
+        """Срез рейтинга активных участников (поддерживается в БД при записи)"""
+        await self._ensure_loaded()
+        return await local_store.get_leaderboard(offset, limit)
+
+    async def get_leaderboard_rank(self, user_id: int) -> Optional[int]:
+        """Место участника в рейтинге; None — участник не активен"""
+        await self._ensure_loaded()
+        return await local_store.get_leaderboard_rank(user_id)
+
+    async def register_user_async(self, user_id: int, username: str, full_name: str, game_name: str) -> Optional[Dict[str, Any]]:
+        """Регистрирует нового пользователя; возвращает None, если он уже зарегистрирован"""
+        if await self.get_participant(user_id):
+            return None
         participant = {
             "user_id": user_id,
             "username": username,
@@ -552,80 +824,69 @@ class GameDataManager:
             "status": "active",
             "goals": [""] * 10
         }
-        data["participants"].append(participant)
-    
-    def get_user_goals(self, user_id: int, data: Dict) -> List[str]:
-        """Получает цели пользователя (всегда возвращает список из 10 элементов)"""
-        for participant in data["participants"]:
-            if participant["user_id"] == user_id:
-                goals = participant.get("goals", [])
-                # Гарантируем, что всегда возвращаем список из 10 элементов
-                if len(goals) < 10:
-                    goals.extend([""] * (10 - len(goals)))
-                return goals[:10]  # Обрезаем до 10 элементов, если больше
-        # Если пользователь не найден, возвращаем пустой список из 10 элементов
-        return [""] * 10
-    
-    def set_user_goal(self, user_id: int, goal_number: int, goal_text: str, data: Dict) -> None:
-        """Устанавливает цель пользователя"""
-        for participant in data["participants"]:
-            if participant["user_id"] == user_id:
-                if 1 <= goal_number <= 10:
-                    participant["goals"][goal_number - 1] = goal_text
-                break
-    
-    def save_daily_report(self, user_id: int, day: int, goals_progress: Dict[int, str], rest_day: bool, data: Dict) -> None:
-        """Сохраняет ежедневный отчет"""
-        # Проверяем, нет ли уже отчета за этот день
-        for report in data["reports"]:
-            if report["user_id"] == user_id and report["day"] == day:
-                # Обновляем существующий отчет
-                report["date"] = datetime.now().strftime("%Y-%m-%d")
-                report["rest_day"] = rest_day
-                for goal_num, progress in goals_progress.items():
-                    if 1 <= goal_num <= 10:
-                        report["progress"][goal_num - 1] = progress
-                return
-        
-        # Создаем новый отчет
-        progress_list = [""] * 10
-        for goal_num, progress_text in goals_progress.items():
-            if 1 <= goal_num <= 10:
-                progress_list[goal_num - 1] = progress_text
-        
-        report = {
+        await self.upsert_participant(participant, sync_to_main=True)
+        return participant
+
+    async def set_user_goals_async(self, user_id: int, goals: Dict[int, str],
+                                   sync_to_main: bool = False) -> Optional[List[str]]:
+        """Устанавливает отдельные цели пользователя ({номер цели: текст}).
+
+        Меняются только переданные цели, остальные берутся из БД как есть. Возвращает все цели
+        участника после записи или None, если участника нет.
+        """
+        await self._ensure_loaded()
+        goals = {n: text for n, text in goals.items() if 1 <= n <= 10}
+        version = await local_store.set_participant_goals(user_id, goals)
+        if version is None:
+            return None
+        _snapshot.apply(version, lambda indexed: indexed.set_goals(user_id, goals))
+        await self._after_write(sync_to_main)
+        participant = await local_store.get_participant(user_id)
+        return participant["goals"] if participant else None
+
+    async def save_daily_report_async(self, user_id: int, day: int, goals_progress: Dict[int, str], rest_day: bool) -> Dict[str, Any]:
+        """Сохраняет ежедневный отчет одной строкой в локальную БД"""
+        report = await self.get_report(user_id, day) or {
             "user_id": user_id,
             "day": day,
-            "date": datetime.now().strftime("%Y-%m-%d"),
-            "progress": progress_list,
-            "rest_day": rest_day
+            "progress": [""] * 10,
         }
-        data["reports"].append(report)
-    
-    def get_user_reports_count(self, user_id: int, data: Dict) -> int:
-        """Получает количество отчетов пользователя"""
-        count = 0
-        for report in data["reports"]:
-            if report["user_id"] == user_id:
-                count += 1
-        return count
-    
+        report["date"] = bot_now(await self.get_settings()).strftime("%Y-%m-%d")
+        report["rest_day"] = rest_day
+        for goal_num, progress in goals_progress.items():
+            if 1 <= goal_num <= 10:
+                report["progress"][goal_num - 1] = progress
+        await self.upsert_report(report, sync_to_main=True)
+        return report
+
     async def get_current_day_async(self) -> int:
-        """Получает текущий день из настроек или вычисляет"""
+        """Текущий день игры для отчетов, статистики и API (см. game_day)"""
         try:
             settings = await self.get_settings()
-            if settings.get("current_day"):
-                return int(settings.get("current_day"))
-        except:
-            pass
-        return self.get_current_day()
+        except Exception:
+            settings = {}
+        return self.game_day(settings)
+
+    def game_day(self, settings: Dict[str, Any], now: Optional[datetime] = None) -> int:
+        """День игры по настройкам: заданный админом current_day, иначе по времени бота (bot_now).
+
+        По этому дню записываются отчеты и его же проверяют напоминания и исключение,
+        поэтому при ненулевом time_offset_hours отчет около полуночи не уходит в соседний день.
+        """
+        if settings.get("current_day"):
+            try:
+                return int(settings["current_day"])
+            except (TypeError, ValueError):
+                pass
+        return self.get_current_day(now=now or bot_now(settings))
     
-    def get_current_day(self, start_date: Optional[str] = None) -> int:
-        """Вычисляет текущий день игры"""
+    def get_current_day(self, start_date: Optional[str] = None, now: Optional[datetime] = None) -> int:
+        """Вычисляет текущий день игры (now — момент, на который считать; по умолчанию сейчас)"""
+        if now is None:
+            now = datetime.now()
         if start_date is None:
             # Старт игры - 5 ноября (из game_concept.txt)
             # Определяем год автоматически
-            now = datetime.now()
             year = now.year
             # Если ноябрь еще не наступил, берем прошлый год
             if now.month < 11:
@@ -634,10 +895,21 @@ class GameDataManager:
         
         try:
             start = datetime.strptime(start_date, "%Y-%m-%d")
-            now = datetime.now()
             delta = now - start
             day = delta.days + 1
             return max(1, min(day, 90))  # Ограничиваем от 1 до 90
         except Exception as e:
             logging.error(f"Ошибка вычисления дня: {e}")
             return 1
+
+
+_instance: Optional[GameDataManager] = None
+
+
+def get_game_data() -> GameDataManager:
+    """Общий для всего процесса менеджер данных (бот, обработчики, сервисы, API)."""
+    global _instance
+    if _instance is None:
+        _instance = GameDataManager()
+    return _instance
+
@@ -0,0 +1,57 @@
+import os
+import time
+import socket
+import secrets
+import logging
+from typing import Any, Dict, Optional
+
+from services import local_store
+
+
+class LeaderLease:
+    """Лидерство одного процесса по аренде в локальной БД.
+
+    Процессы (бот, воркеры API) периодически вызывают refresh(): лидер продлевает аренду,
+    остальные забирают ее, только когда она истекла (лидер упал или остановился).
+    Пока refresh() ни разу не вызывался, выбор не ведется (active=False) — процесс один.
+    """
+
+    def __init__(self, name: str, ttl: float = 30):
+        self.name = name
+        self.ttl = ttl
+        self.owner = f"{socket.gethostname()}:{os.getpid()}:{secrets.token_hex(4)}"
+        self.active = False
+        self.is_leader = False
+        self._acquired_at: Optional[float] = None
+
+    async def refresh(self) -> bool:
+        """Берет или продлевает аренду; возвращает, лидер ли процесс сейчас."""
+        self.active = True
+        was_leader = self.is_leader
+        try:
+            self.is_leader = await local_store.acquire_lease(self.name, self.owner, self.ttl, time.time())
+        except Exception as e:
+            # Без подтвержденной аренды считаем себя ведомым, чтобы не выгружать параллельно с лидером
+            logging.error(f"Ошибка продления аренды {self.name}: {e}")
+            self.is_leader = False
+        if self.is_leader and not was_leader:
+            self._acquired_at = time.time()
+            logging.info(f"Процесс {self.owner} стал лидером {self.name}")
+        elif was_leader and not self.is_leader:
+            logging.warning(f"Процесс {self.owner} потерял лидерство {self.name}")
+        return self.is_leader
+
+    async def release(self) -> None:
+        """Отдает аренду при остановке, чтобы другой процесс подхватил ее сразу."""
+        if self.is_leader:
+            await local_store.release_lease(self.name, self.owner)
+        self.is_leader = False
+
+    async def status(self) -> Dict[str, Any]:
+        return {
+            "active": self.active,
+            "owner": self.owner,
+            "is_leader": self.is_leader,
+            "leader_since": self._acquired_at if self.is_leader else None,
+            "lease": await local_store.get_lease(self.name),
+        }
@@ -1,7 +1,10 @@
 import os
 import json
 import asyncio
-from typing import Optional, Any, Dict
+import logging
+import sqlite3
+from contextlib import asynccontextmanager, contextmanager
+from typing import Optional, Any, Dict, List, AsyncIterator, Iterator
 
 import aiosqlite
 
@@ -9,44 +12,442 @@ import aiosqlite
 DB_PATH = os.path.join(os.path.dirname(os.path.dirname(__file__)), 'data')
 DB_FILE = os.path.join(DB_PATH, 'data.db')
 
+# Служебные ключи в kv
+LEGACY_DATA_KEY = 'all_data'
+DATA_LOADED_KEY = 'data_loaded'
+DATA_VERSION_KEY = 'data_version'
+LAST_FULL_SYNC_KEY = 'last_full_sync_at'
+LEDGER_PARTS_KEY = 'sync_ledger_parts'
+SYNC_URGENT_KEY = 'sync_urgent_requested'
+
+# Журнал изменений для выгрузки на Я.Диск: сущность и ключ строки, а не сами данные —
+# при выгрузке берется текущее состояние строки.
+CHANGE_PARTICIPANT = 'participant'
+CHANGE_REPORT = 'report'
+CHANGE_SETTINGS = 'settings'
+CHANGE_RESET = 'reset'
+
+_SCHEMA = (
+    "CREATE TABLE IF NOT EXISTS kv (key TEXT PRIMARY KEY, value TEXT NOT NULL, updated_at INTEGER NOT NULL)",
+    "CREATE TABLE IF NOT EXISTS participants ("
+    " id INTEGER PRIMARY KEY,"
+    " user_id INTEGER NOT NULL UNIQUE,"
+    " username TEXT NOT NULL DEFAULT '',"
+    " full_name TEXT NOT NULL DEFAULT '',"
+    " game_name TEXT NOT NULL DEFAULT '',"
+    " registered_date TEXT NOT NULL DEFAULT '',"
+    " status TEXT NOT NULL DEFAULT 'active',"
+    " goals TEXT NOT NULL DEFAULT '[]',"
+    " updated_at INTEGER NOT NULL)",
+    "CREATE TABLE IF NOT EXISTS reports ("
+    " id INTEGER PRIMARY KEY,"
+    " user_id INTEGER NOT NULL,"
+    " day INTEGER NOT NULL,"
+    " date TEXT NOT NULL DEFAULT '',"
+    " progress TEXT NOT NULL DEFAULT '[]',"
+    " rest_day INTEGER NOT NULL DEFAULT 0,"
+    " updated_at INTEGER NOT NULL,"
+    " UNIQUE (user_id, day))",
+    "CREATE INDEX IF NOT EXISTS idx_reports_day ON reports (day, user_id)",
+    "CREATE TABLE IF NOT EXISTS settings (key TEXT PRIMARY KEY, value TEXT, updated_at INTEGER NOT NULL)",
+    "CREATE TABLE IF NOT EXISTS changes ("
+    " id INTEGER PRIMARY KEY AUTOINCREMENT,"
+    " entity TEXT NOT NULL,"
+    " entity_key TEXT NOT NULL,"
+    " op TEXT NOT NULL,"
+    " created_at INTEGER NOT NULL)",
+    "CREATE TABLE IF NOT EXISTS outbox ("
+    " id INTEGER PRIMARY KEY,"
+    " dedup_key TEXT NOT NULL UNIQUE,"
+    " chat_id INTEGER NOT NULL,"
+    " thread_id INTEGER,"
+    " text TEXT NOT NULL,"
+    " parse_mode TEXT,"
+    " status TEXT NOT NULL DEFAULT 'pending',"
+    " attempts INTEGER NOT NULL DEFAULT 0,"
+    " next_attempt_at INTEGER NOT NULL,"
+    " last_error TEXT,"
+    " created_at INTEGER NOT NULL,"
+    " sent_at INTEGER)",
+    "CREATE INDEX IF NOT EXISTS idx_outbox_due ON outbox (status, next_attempt_at)",
+    "CREATE TABLE IF NOT EXISTS progress_stats ("
+    " user_id INTEGER NOT NULL,"
+    " goal_num INTEGER NOT NULL,"
+    " progress_days INTEGER NOT NULL DEFAULT 0,"
+    " rest_days INTEGER NOT NULL DEFAULT 0,"
+    " last_progress_day INTEGER NOT NULL DEFAULT 0,"
+    " reports_count INTEGER NOT NULL DEFAULT 0,"
+    " PRIMARY KEY (user_id, goal_num))",
+    "CREATE TABLE IF NOT EXISTS leaderboard ("
+    " user_id INTEGER PRIMARY KEY,"
+    " active INTEGER NOT NULL,"
+    " reports_count INTEGER NOT NULL,"
+    " progress_days INTEGER NOT NULL,"
+    " active_goals INTEGER NOT NULL,"
+    " score REAL NOT NULL)",
+    "CREATE INDEX IF NOT EXISTS idx_leaderboard_rank ON leaderboard (active, reports_count DESC, score DESC, user_id)",
+    "CREATE TABLE IF NOT EXISTS auth_tokens ("
+    " token_hash TEXT PRIMARY KEY,"
+    " user_id INTEGER NOT NULL,"
+    " expires_at INTEGER NOT NULL,"
+    " created_at INTEGER NOT NULL)",
+    "CREATE INDEX IF NOT EXISTS idx_auth_tokens_expires ON auth_tokens (expires_at)",
+    "CREATE TABLE IF NOT EXISTS leases (name TEXT PRIMARY KEY, owner TEXT NOT NULL, expires_at REAL NOT NULL)",
+    "CREATE TABLE IF NOT EXISTS fsm ("
+    " key TEXT PRIMARY KEY,"
+    " state TEXT,"
+    " data TEXT NOT NULL DEFAULT '{}',"
+    " updated_at INTEGER NOT NULL)",
+    "CREATE INDEX IF NOT EXISTS idx_fsm_updated ON fsm (updated_at)",
+)
+
+_PARTICIPANT_COLUMNS = "user_id, username, full_name, game_name, registered_date, status, goals"
+_REPORT_COLUMNS = "user_id, day, date, progress, rest_day"
+
+_UPSERT_PARTICIPANT = (
+    f"INSERT INTO participants({_PARTICIPANT_COLUMNS}, updated_at) VALUES(?, ?, ?, ?, ?, ?, ?, strftime('%s','now')) "
+    "ON CONFLICT(user_id) DO UPDATE SET username=excluded.username, full_name=excluded.full_name, "
+    "game_name=excluded.game_name, registered_date=excluded.registered_date, status=excluded.status, "
+    "goals=excluded.goals, updated_at=excluded.updated_at"
+)
+_PARTICIPANT_FIELDS = ("username", "full_name", "game_name", "registered_date", "status", "goals")
+_UPSERT_REPORT = (
+    f"INSERT INTO reports({_REPORT_COLUMNS}, updated_at) VALUES(?, ?, ?, ?, ?, strftime('%s','now')) "
+    "ON CONFLICT(user_id, day) DO UPDATE SET date=excluded.date, progress=excluded.progress, "
+    "rest_day=excluded.rest_day, updated_at=excluded.updated_at"
+)
+_UPSERT_SETTING = (
+    "INSERT INTO settings(key, value, updated_at) VALUES(?, ?, strftime('%s','now')) "
+    "ON CONFLICT(key) DO UPDATE SET value=excluded.value, updated_at=excluded.updated_at"
+)
+_UPSERT_KV = (
+    "INSERT INTO kv(key, value, updated_at) VALUES(?, ?, strftime('%s','now')) "
+    "ON CONFLICT(key) DO UPDATE SET value=excluded.value, updated_at=strftime('%s','now')"
+)
+_RECORD_CHANGE = "INSERT INTO changes(entity, entity_key, op, created_at) VALUES(?, ?, ?, strftime('%s','now'))"
+_BUMP_VERSION = (
+    "INSERT INTO kv(key, value, updated_at) VALUES(?, '1', strftime('%s','now')) "
+    "ON CONFLICT(key) DO UPDATE SET value=CAST(CAST(value AS INTEGER) + 1 AS TEXT), updated_at=strftime('%s','now')"
+)
+
 
 _init_lock = asyncio.Lock()
 _initialized = False
 
+# Долгоживущие соединения: одно пишущее (записи сериализуются через _write_lock)
+# и одно читающее — в режиме WAL читатели не блокируются писателем.
+_writer: Optional[aiosqlite.Connection] = None
+_reader: Optional[aiosqlite.Connection] = None
+_write_lock = asyncio.Lock()
+
+# sqlite3 держит кеш подготовленных выражений на соединение; все запросы модуля —
+# константы с параметрами, поэтому при долгоживущем соединении они компилируются один раз.
+_STATEMENT_CACHE_SIZE = 256
+
+
+async def _connect() -> aiosqlite.Connection:
+    db = await aiosqlite.connect(DB_FILE, cached_statements=_STATEMENT_CACHE_SIZE)
+    await db.execute("PRAGMA journal_mode=WAL")
+    await db.execute("PRAGMA synchronous=NORMAL")
+    await db.execute("PRAGMA busy_timeout=5000")
+    return db
+
 
 async def init_db() -> None:
-    global _initialized
+    global _initialized, _writer, _reader
     if _initialized:
         return
     async with _init_lock:
         if _initialized:
             return
         os.makedirs(DB_PATH, exist_ok=True)
-        async with aiosqlite.connect(DB_FILE) as db:
-            await db.execute(
-                "CREATE TABLE IF NOT EXISTS kv (key TEXT PRIMARY KEY, value TEXT NOT NULL, updated_at INTEGER NOT NULL)"
-            )
-            await db.commit()
+        _writer = await _connect()
+        for statement in _SCHEMA:
+            await _writer.execute(statement)
+        await _migrate_legacy_blob(_writer)
+        await _backfill_progress_stats(_writer)
+        await _writer.commit()
+        _reader = await _connect()
         _initialized = True
 
 
-async def get_value(key: str) -> Optional[str]:
+async def close_db() -> None:
+    """Закрывает соединения с БД (вызывается при остановке бота/API)."""
+    global _initialized, _writer, _reader
+    async with _init_lock:
+        async with _write_lock:
+            for db in (_reader, _writer):
+                if db is not None:
+                    try:
+                        await db.close()
+                    except Exception as e:
+                        logging.warning(f"Ошибка при закрытии БД: {e}")
+            _writer = None
+            _reader = None
+            _initialized = False
+
+
+async def _read_conn() -> aiosqlite.Connection:
     await init_db()
-    async with aiosqlite.connect(DB_FILE) as db:
-        async with db.execute("SELECT value FROM kv WHERE key = ?", (key,)) as cur:
-            row = await cur.fetchone()
-            return row[0] if row else None
+    return _reader
 
 
-async def set_value(key: str, value: str) -> None:
+@asynccontextmanager
+async def _write_tx() -> AsyncIterator[aiosqlite.Connection]:
+    """Транзакция на пишущем соединении: commit при успехе, rollback при ошибке."""
     await init_db()
-    async with aiosqlite.connect(DB_FILE) as db:
-        await db.execute(
-            "INSERT INTO kv(key, value, updated_at) VALUES(?, ?, strftime('%s','now')) "
-            "ON CONFLICT(key) DO UPDATE SET value=excluded.value, updated_at=strftime('%s','now')",
-            (key, value),
-        )
-        await db.commit()
+    async with _write_lock:
+        try:
+            yield _writer
+            await _writer.commit()
+        except BaseException:
+            await _writer.rollback()
+            raise
+
+
+async def _migrate_legacy_blob(db: aiosqlite.Connection) -> None:
+    """Однократно переносит старый JSON-блоб kv['all_data'] в таблицы."""
+    async with db.execute("SELECT value FROM kv WHERE key = ?", (LEGACY_DATA_KEY,)) as cur:
+        row = await cur.fetchone()
+    if not row:
+        return
+    try:
+        data = json.loads(row[0])
+    except Exception:
+        data = None
+    if isinstance(data, dict):
+        await _replace_all(db, data)
+    await db.execute("DELETE FROM kv WHERE key = ?", (LEGACY_DATA_KEY,))
+
+
+async def _backfill_progress_stats(db: aiosqlite.Connection) -> None:
+    """Строит агрегаты прогресса и рейтинг для БД, созданной до появления этих таблиц."""
+    async with db.execute("SELECT EXISTS(SELECT 1 FROM progress_stats), EXISTS(SELECT 1 FROM reports)") as cur:
+        has_stats, has_reports = await cur.fetchone()
+    if has_reports and not has_stats:
+        await _rebuild_progress_stats(db)
+    async with db.execute("SELECT EXISTS(SELECT 1 FROM leaderboard), EXISTS(SELECT 1 FROM participants)") as cur:
+        has_board, has_participants = await cur.fetchone()
+    if has_participants and not has_board:
+        await _rebuild_leaderboard(db)
+
+
+def _normalize_list(values: Optional[List[Any]]) -> List[str]:
+    values = list(values or [])
+    if len(values) < 10:
+        values.extend([""] * (10 - len(values)))
+    return ["" if v is None else v for v in values[:10]]
+
+
+def _participant_params(participant: Dict[str, Any]) -> tuple:
+    return (
+        participant["user_id"],
+        participant.get("username") or "",
+        participant.get("full_name") or "",
+        participant.get("game_name") or "",
+        participant.get("registered_date") or "",
+        participant.get("status") or "active",
+        json.dumps(_normalize_list(participant.get("goals")), ensure_ascii=False),
+    )
+
+
+def _merge_participant_sql(fields: tuple) -> str:
+    """Upsert участника, который у существующей строки обновляет только поля fields (импорт)."""
+    updates = "".join(f"{field}=excluded.{field}, " for field in fields)
+    return (
+        f"INSERT INTO participants({_PARTICIPANT_COLUMNS}, updated_at) VALUES(?, ?, ?, ?, ?, ?, ?, strftime('%s','now')) "
+        f"ON CONFLICT(user_id) DO UPDATE SET {updates}updated_at=excluded.updated_at"
+    )
+
+
+def _report_params(report: Dict[str, Any]) -> tuple:
+    return (
+        report["user_id"],
+        report.get("day") or 1,
+        report.get("date") or "",
+        json.dumps(_normalize_list(report.get("progress")), ensure_ascii=False),
+        1 if report.get("rest_day") else 0,
+    )
+
+
+def _participant_from_row(row) -> Dict[str, Any]:
+    return {
+        "user_id": row[0],
+        "username": row[1],
+        "full_name": row[2],
+        "game_name": row[3],
+        "registered_date": row[4],
+        "status": row[5],
+        "goals": json.loads(row[6]),
+    }
+
+
+def _report_from_row(row) -> Dict[str, Any]:
+    return {
+        "user_id": row[0],
+        "day": row[1],
+        "date": row[2],
+        "progress": json.loads(row[3]),
+        "rest_day": bool(row[4]),
+    }
+
+
+async def _record_change(db: aiosqlite.Connection, entity: str, key: Any, op: str = 'upsert') -> None:
+    await db.execute(_RECORD_CHANGE, (entity, str(key), op))
+
+
+async def _bump_version(db: aiosqlite.Connection) -> int:
+    await db.execute(_BUMP_VERSION, (DATA_VERSION_KEY,))
+    async with db.execute("SELECT value FROM kv WHERE key = ?", (DATA_VERSION_KEY,)) as cur:
+        row = await cur.fetchone()
+    return int(row[0])
+
+
+def normalize_participant(participant: Dict[str, Any]) -> Dict[str, Any]:
+    """Приводит участника к виду, в котором он читается из БД."""
+    return _participant_from_row(_participant_params(participant))
+
+
+def normalize_report(report: Dict[str, Any]) -> Dict[str, Any]:
+    """Приводит отчет к виду, в котором он читается из БД."""
+    return _report_from_row(_report_params(report))
+
+
+# Агрегаты прогресса по целям: (user_id, goal_num) -> дни с прогрессом, дни отдыха,
+# последний день с прогрессом и число отчетов пользователя. Пересчитываются в той же
+# транзакции, что и запись отчетов, — по отчетам одного пользователя (не больше 90 строк).
+_NO_PROGRESS_VALUES = ("Отдых", "❌ Не выполнено")
+_INSERT_PROGRESS_STATS = (
+    "INSERT INTO progress_stats(user_id, goal_num, progress_days, rest_days, last_progress_day, reports_count) "
+    "VALUES(?, ?, ?, ?, ?, ?)"
+)
+
+
+def is_progress(value: Any) -> bool:
+    """Есть ли в отметке по цели прогресс (не пусто, не отдых и не «не выполнено»)."""
+    return bool(value) and bool(str(value).strip()) and value not in _NO_PROGRESS_VALUES
+
+
+def _progress_stats_rows(user_id: int, reports: List[tuple]) -> List[tuple]:
+    """Строки progress_stats по отчетам пользователя (progress JSON, rest_day, day)."""
+    progress_days = [0] * 10
+    last_progress_day = [0] * 10
+    rest_days = 0
+    for progress_json, rest_day, day in reports:
+        if rest_day:
+            rest_days += 1
+            continue
+        for i, value in enumerate(json.loads(progress_json)[:10]):
+            if is_progress(value):
+                progress_days[i] += 1
+                last_progress_day[i] = max(last_progress_day[i], day)
+    return [
+        (user_id, i + 1, progress_days[i], rest_days, last_progress_day[i], len(reports))
+        for i in range(10)
+    ]
+
+
+async def _refresh_progress_stats(db: aiosqlite.Connection, user_id: int) -> None:
+    async with db.execute("SELECT progress, rest_day, day FROM reports WHERE user_id = ?", (user_id,)) as cur:
+        reports = await cur.fetchall()
+    await db.execute("DELETE FROM progress_stats WHERE user_id = ?", (user_id,))
+    if reports:
+        await db.executemany(_INSERT_PROGRESS_STATS, _progress_stats_rows(user_id, reports))
+
+
+async def _rebuild_progress_stats(db: aiosqlite.Connection) -> None:
+    by_user: Dict[int, List[tuple]] = {}
+    async with db.execute("SELECT user_id, progress, rest_day, day FROM reports") as cur:
+        async for row in cur:
+            by_user.setdefault(row[0], []).append(row[1:])
+    await db.execute("DELETE FROM progress_stats")
+    await db.executemany(
+        _INSERT_PROGRESS_STATS,
+        [row for user_id, reports in by_user.items() for row in _progress_stats_rows(user_id, reports)],
+    )
+
+
+# Рейтинг участников: порядок (reports_count, score) по убыванию держит индекс idx_leaderboard_rank.
+# score — дни с прогрессом на одну активную цель; при общем текущем дне он упорядочивает так же,
+# как средний процент прогресса. Строка участника пересчитывается при записи его отчетов
+# и изменении участника, место считается по индексу при чтении.
+_UPSERT_LEADERBOARD = (
+    "INSERT INTO leaderboard(user_id, active, reports_count, progress_days, active_goals, score) "
+    "VALUES(?, ?, ?, ?, ?, ?) ON CONFLICT(user_id) DO UPDATE SET active=excluded.active, "
+    "reports_count=excluded.reports_count, progress_days=excluded.progress_days, "
+    "active_goals=excluded.active_goals, score=excluded.score"
+)
+_RANK_ORDER = "reports_count DESC, score DESC, user_id"
+
+
+def _leaderboard_row(user_id: int, status: str, goals_json: str, stats: Dict[int, tuple]) -> tuple:
+    """stats: номер цели -> (progress_days, reports_count)."""
+    active_goals = [i + 1 for i, goal in enumerate(json.loads(goals_json)[:10]) if str(goal).strip()]
+    progress_days = sum(stats[num][0] for num in active_goals if num in stats)
+    reports_count = next(iter(stats.values()))[1] if stats else 0
+    score = progress_days / len(active_goals) if active_goals else 0.0
+    return (user_id, 1 if status == "active" else 0, reports_count, progress_days, len(active_goals), score)
+
+
+async def _refresh_leaderboard(db: aiosqlite.Connection, user_id: int) -> None:
+    async with db.execute("SELECT status, goals FROM participants WHERE user_id = ?", (user_id,)) as cur:
+        participant = await cur.fetchone()
+    if participant is None:
+        await db.execute("DELETE FROM leaderboard WHERE user_id = ?", (user_id,))
+        return
+    async with db.execute(
+        "SELECT goal_num, progress_days, reports_count FROM progress_stats WHERE user_id = ?", (user_id,)
+    ) as cur:
+        stats = {row[0]: (row[1], row[2]) for row in await cur.fetchall()}
+    await db.execute(_UPSERT_LEADERBOARD, _leaderboard_row(user_id, participant[0], participant[1], stats))
+
+
+async def _rebuild_leaderboard(db: aiosqlite.Connection) -> None:
+    stats: Dict[int, Dict[int, tuple]] = {}
+    async with db.execute("SELECT user_id, goal_num, progress_days, reports_count FROM progress_stats") as cur:
+        async for row in cur:
+            stats.setdefault(row[0], {})[row[1]] = (row[2], row[3])
+    async with db.execute("SELECT user_id, status, goals FROM participants") as cur:
+        rows = [_leaderboard_row(row[0], row[1], row[2], stats.get(row[0], {})) async for row in cur]
+    await db.execute("DELETE FROM leaderboard")
+    await db.executemany(_UPSERT_LEADERBOARD, rows)
+
+
+async def _replace_settings(db: aiosqlite.Connection, settings: Dict[str, Any]) -> None:
+    await db.execute("DELETE FROM settings")
+    await db.executemany(
+        _UPSERT_SETTING,
+        [(str(k), json.dumps(v, ensure_ascii=False)) for k, v in (settings or {}).items() if v is not None],
+    )
+
+
+async def _replace_all(db: aiosqlite.Connection, data: Dict[str, Any], synced: bool = False) -> int:
+    """Полная перезапись данных; synced=True — данные пришли с Я.Диска и выгружать их обратно не нужно."""
+    if synced:
+        await db.execute("DELETE FROM changes")
+    else:
+        await _record_change(db, CHANGE_RESET, '*', 'replace')
+    await db.execute("DELETE FROM participants")
+    await db.execute("DELETE FROM reports")
+    await db.executemany(_UPSERT_PARTICIPANT, [_participant_params(p) for p in data.get("participants", [])])
+    await db.executemany(_UPSERT_REPORT, [_report_params(r) for r in data.get("reports", [])])
+    await _replace_settings(db, data.get("settings", {}))
+    await _rebuild_progress_stats(db)
+    await _rebuild_leaderboard(db)
+    await db.execute(_UPSERT_KV, (DATA_LOADED_KEY, "1"))
+    return await _bump_version(db)
+
+
+async def get_value(key: str) -> Optional[str]:
+    db = await _read_conn()
+    async with db.execute("SELECT value FROM kv WHERE key = ?", (key,)) as cur:
+        row = await cur.fetchone()
+        return row[0] if row else None
+
+
+async def set_value(key: str, value: str) -> None:
+    async with _write_tx() as db:
+        await db.execute(_UPSERT_KV, (key, value))
 
 
 async def get_json(key: str) -> Optional[Dict[str, Any]]:
@@ -64,9 +465,577 @@ async def set_json(key: str, value: Dict[str, Any]) -> None:
 
 
 async def get_updated_at(key: str) -> Optional[int]:
-    await init_db()
-    async with aiosqlite.connect(DB_FILE) as db:
-        async with db.execute("SELECT updated_at FROM kv WHERE key = ?", (key,)) as cur:
+    db = await _read_conn()
+    async with db.execute("SELECT updated_at FROM kv WHERE key = ?", (key,)) as cur:
+        row = await cur.fetchone()
+        return int(row[0]) if row and row[0] is not None else None
+
+
+async def is_loaded() -> bool:
+    """Были ли данные игры хоть раз загружены в локальную БД."""
+    return await get_value(DATA_LOADED_KEY) is not None
+
+
+async def get_data_version() -> int:
+    """Счетчик записей данных игры; растет при каждой записи из любого процесса."""
+    value = await get_value(DATA_VERSION_KEY)
+    return int(value) if value else 0
+
+
+async def get_data_updated_at() -> Optional[int]:
+    """Время последней записи данных игры (epoch, сек)."""
+    return await get_updated_at(DATA_VERSION_KEY)
+
+
+async def load_all() -> Dict[str, Any]:
+    db = await _read_conn()
+    async with db.execute(f"SELECT {_PARTICIPANT_COLUMNS} FROM participants ORDER BY id") as cur:
+        participants = [_participant_from_row(row) for row in await cur.fetchall()]
+    async with db.execute(f"SELECT {_REPORT_COLUMNS} FROM reports ORDER BY id") as cur:
+        reports = [_report_from_row(row) for row in await cur.fetchall()]
+    async with db.execute("SELECT key, value FROM settings") as cur:
+        settings = {row[0]: json.loads(row[1]) for row in await cur.fetchall()}
+    return {"participants": participants, "reports": reports, "settings": settings}
+
+
+@contextmanager
+def export_reader(day_from: Optional[int] = None, day_to: Optional[int] = None) -> Iterator[Dict[str, Iterator[Any]]]:
+    """Синхронное чтение всех данных для выгрузки из рабочего потока.
+
+    Открывает отдельное соединение с одной транзакцией чтения (в WAL — согласованный снимок)
+    и отдает строки курсорами, не загружая все отчеты в память. Итераторы читаются по порядку
+    и только внутри блока with. day_from/day_to ограничивают выгружаемые отчеты.
+    Соединение можно читать из разных потоков пула (но не одновременно).
+    """
+    conn = sqlite3.connect(DB_FILE, timeout=5, check_same_thread=False)
+    if day_from is None and day_to is None:
+        reports_sql, report_params = f"SELECT {_REPORT_COLUMNS} FROM reports ORDER BY id", ()
+    else:
+        # С диапазоном дней идем по индексу idx_reports_day, без сортировки во временной таблице
+        reports_sql = f"SELECT {_REPORT_COLUMNS} FROM reports WHERE day BETWEEN ? AND ? ORDER BY day, user_id"
+        report_params = (day_from if day_from is not None else 0, day_to if day_to is not None else 2 ** 31)
+    try:
+        conn.execute("BEGIN")
+        yield {
+            "participants": (_participant_from_row(row) for row in conn.execute(
+                f"SELECT {_PARTICIPANT_COLUMNS} FROM participants ORDER BY id")),
+            "reports": (_report_from_row(row) for row in conn.execute(reports_sql, report_params)),
+            "settings": ((row[0], json.loads(row[1])) for row in conn.execute("SELECT key, value FROM settings")),
+        }
+    finally:
+        conn.rollback()
+        conn.close()
+
+
+async def replace_all(data: Dict[str, Any], synced: bool = False) -> int:
+    async with _write_tx() as db:
+        return await _replace_all(db, data, synced)
+
+
+async def bulk_upsert(participants: List[Dict[str, Any]], reports: List[Dict[str, Any]],
+                      settings: Optional[Dict[str, Any]] = None, batch_size: int = 500) -> int:
+    """Массовая запись (импорт): участники и отчеты пачками по batch_size одной транзакцией.
+
+    У существующего участника обновляются только переданные поля: строка CSV без целей или имени
+    их не затирает. Настройки объединяются с текущими. Агрегаты и рейтинг пересчитываются один раз
+    на затронутого пользователя, версия данных растет один раз.
+    """
+    async with _write_tx() as db:
+        for start in range(0, len(participants), batch_size):
+            chunk = participants[start:start + batch_size]
+            by_fields: Dict[tuple, List[tuple]] = {}
+            for participant in chunk:
+                fields = tuple(field for field in _PARTICIPANT_FIELDS if field in participant)
+                by_fields.setdefault(fields, []).append(_participant_params(participant))
+            for fields, batch in by_fields.items():
+                await db.executemany(_merge_participant_sql(fields), batch)
+            await db.executemany(_RECORD_CHANGE, [(CHANGE_PARTICIPANT, str(p["user_id"]), 'upsert') for p in chunk])
+        for start in range(0, len(reports), batch_size):
+            batch = [_report_params(r) for r in reports[start:start + batch_size]]
+            await db.executemany(_UPSERT_REPORT, batch)
+            await db.executemany(
+                _RECORD_CHANGE, [(CHANGE_REPORT, f"{params[0]}:{params[1]}", 'upsert') for params in batch])
+        if settings:
+            await db.executemany(
+                _UPSERT_SETTING,
+                [(str(k), json.dumps(v, ensure_ascii=False)) for k, v in settings.items() if v is not None],
+            )
+            await _record_change(db, CHANGE_SETTINGS, '*', 'replace')
+        for user_id in sorted({r["user_id"] for r in reports}):
+            await _refresh_progress_stats(db, user_id)
+        for user_id in sorted({p["user_id"] for p in participants} | {r["user_id"] for r in reports}):
+            await _refresh_leaderboard(db, user_id)
+        return await _bump_version(db)
+
+
+async def get_participant(user_id: int) -> Optional[Dict[str, Any]]:
+    db = await _read_conn()
+    async with db.execute(f"SELECT {_PARTICIPANT_COLUMNS} FROM participants WHERE user_id = ?", (user_id,)) as cur:
+        row = await cur.fetchone()
+        return _participant_from_row(row) if row else None
+
+
+async def upsert_participant(participant: Dict[str, Any]) -> int:
+    async with _write_tx() as db:
+        await db.execute(_UPSERT_PARTICIPANT, _participant_params(participant))
+        await _refresh_leaderboard(db, participant["user_id"])
+        await _record_change(db, CHANGE_PARTICIPANT, participant["user_id"])
+        return await _bump_version(db)
+
+
+async def delete_participant(user_id: int) -> Optional[int]:
+    """Удаляет участника вместе с его отчетами; None — если участника не было."""
+    async with _write_tx() as db:
+        cur = await db.execute("DELETE FROM participants WHERE user_id = ?", (user_id,))
+        if cur.rowcount <= 0:
+            return None
+        await db.execute("DELETE FROM reports WHERE user_id = ?", (user_id,))
+        await db.execute("DELETE FROM progress_stats WHERE user_id = ?", (user_id,))
+        await db.execute("DELETE FROM leaderboard WHERE user_id = ?", (user_id,))
+        # Удаление участника в журнале подразумевает и удаление всех его отчетов
+        await _record_change(db, CHANGE_PARTICIPANT, user_id, 'delete')
+        return await _bump_version(db)
+
+
+async def set_participant_statuses(user_ids: List[int], status: str) -> Optional[int]:
+    """Меняет статус сразу у нескольких участников одной транзакцией; None — если менять было нечего."""
+    if not user_ids:
+        return None
+    async with _write_tx() as db:
+        await db.executemany(
+            "UPDATE participants SET status = ?, updated_at = strftime('%s','now') WHERE user_id = ?",
+            [(status, user_id) for user_id in user_ids],
+        )
+        await db.executemany(_RECORD_CHANGE, [(CHANGE_PARTICIPANT, str(user_id), 'upsert') for user_id in user_ids])
+        await db.executemany(
+            "UPDATE leaderboard SET active = ? WHERE user_id = ?",
+            [(1 if status == "active" else 0, user_id) for user_id in user_ids],
+        )
+        return await _bump_version(db)
+
+
+async def set_participant_goals(user_id: int, goals: Dict[int, str]) -> Optional[int]:
+    """Меняет отдельные цели участника ({номер: текст}), не трогая остальные поля и цели.
+
+    Каждая цель — одно UPDATE с json_set, без чтения строки: правки других процессов не затираются.
+    None — если участника нет.
+    """
+    async with _write_tx() as db:
+        cur = await db.executemany(
+            "UPDATE participants SET goals = json_set(goals, '$[' || ? || ']', ?), "
+            "updated_at = strftime('%s','now') WHERE user_id = ?",
+            [(goal_num - 1, text, user_id) for goal_num, text in goals.items() if 1 <= goal_num <= 10],
+        )
+        if cur.rowcount <= 0:
+            return None
+        await _refresh_leaderboard(db, user_id)
+        await _record_change(db, CHANGE_PARTICIPANT, user_id)
+        return await _bump_version(db)
+
+
+async def get_report(user_id: int, day: int) -> Optional[Dict[str, Any]]:
+    db = await _read_conn()
+    async with db.execute(f"SELECT {_REPORT_COLUMNS} FROM reports WHERE user_id = ? AND day = ?", (user_id, day)) as cur:
+        row = await cur.fetchone()
+        return _report_from_row(row) if row else None
+
+
+async def query_reports(user_id: Optional[int] = None, day_from: Optional[int] = None, day_to: Optional[int] = None,
+                        rest_day: Optional[bool] = None, status: Optional[str] = None,
+                        after: Optional[tuple] = None, limit: Optional[int] = None) -> Dict[str, Any]:
+    """Отчеты с фильтрами в порядке (day, user_id) по убыванию — по индексам reports.
+
+    after — ключ (day, user_id) последнего отчета предыдущей страницы. Возвращает
+    {"reports", "total", "next"}; next — ключ для следующей страницы или None.
+    У каждого отчета есть вычисляемое поле progress_count (число целей с прогрессом).
+    """
+    where, params = [], []
+    if user_id is not None:
+        where.append("r.user_id = ?")
+        params.append(user_id)
+    if day_from is not None:
+        where.append("r.day >= ?")
+        params.append(day_from)
+    if day_to is not None:
+        where.append("r.day <= ?")
+        params.append(day_to)
+    if rest_day is not None:
+        where.append("r.rest_day = ?")
+        params.append(1 if rest_day else 0)
+    if status is not None:
+        where.append("r.user_id IN (SELECT user_id FROM participants WHERE status = ?)")
+        params.append(status)
+    filters = " AND ".join(where) or "1"
+    db = await _read_conn()
+    async with db.execute(f"SELECT COUNT(*) FROM reports r WHERE {filters}", params) as cur:
+        total = (await cur.fetchone())[0]
+    page_filters, page_params = filters, list(params)
+    if after is not None:
+        page_filters += " AND (r.day < ? OR (r.day = ? AND r.user_id < ?))"
+        page_params += [after[0], after[0], after[1]]
+    columns = ", ".join(f"r.{column.strip()}" for column in _REPORT_COLUMNS.split(","))
+    async with db.execute(
+        f"SELECT {columns} FROM reports r WHERE {page_filters} ORDER BY r.day DESC, r.user_id DESC LIMIT ?",
+        page_params + [-1 if limit is None else limit + 1],
+    ) as cur:
+        rows = await cur.fetchall()
+    has_more = limit is not None and len(rows) > limit
+    reports = []
+    for row in rows[:limit]:
+        report = _report_from_row(row)
+        report["progress_count"] = sum(1 for value in report["progress"] if is_progress(value))
+        reports.append(report)
+    last = reports[-1] if has_more else None
+    return {"reports": reports, "total": total, "next": (last["day"], last["user_id"]) if last else None}
+
+
+async def upsert_report(report: Dict[str, Any]) -> int:
+    async with _write_tx() as db:
+        params = _report_params(report)
+        await db.execute(_UPSERT_REPORT, params)
+        await _refresh_progress_stats(db, params[0])
+        await _refresh_leaderboard(db, params[0])
+        await _record_change(db, CHANGE_REPORT, f"{params[0]}:{params[1]}")
+        return await _bump_version(db)
+
+
+async def delete_report(user_id: int, day: int) -> Optional[int]:
+    """Удаляет отчет; None — если отчета не было."""
+    async with _write_tx() as db:
+        cur = await db.execute("DELETE FROM reports WHERE user_id = ? AND day = ?", (user_id, day))
+        if cur.rowcount <= 0:
+            return None
+        await _refresh_progress_stats(db, user_id)
+        await _refresh_leaderboard(db, user_id)
+        await _record_change(db, CHANGE_REPORT, f"{user_id}:{day}", 'delete')
+        return await _bump_version(db)
+
+
+def _progress_stats_from_row(row) -> Dict[str, Any]:
+    return {
+        "progress_days": row[1],
+        "rest_days": row[2],
+        "last_progress_day": row[3],
+        "reports_count": row[4],
+    }
+
+
+async def get_progress_stats(user_id: int) -> Dict[int, Dict[str, Any]]:
+    """Агрегаты прогресса пользователя по номеру цели (1–10); пусто — отчетов нет."""
+    db = await _read_conn()
+    async with db.execute(
+        "SELECT goal_num, progress_days, rest_days, last_progress_day, reports_count "
+        "FROM progress_stats WHERE user_id = ?", (user_id,)
+    ) as cur:
+        return {row[0]: _progress_stats_from_row(row) for row in await cur.fetchall()}
+
+
+async def get_all_progress_stats() -> Dict[int, Dict[int, Dict[str, Any]]]:
+    """Агрегаты прогресса всех пользователей: user_id -> номер цели -> агрегаты."""
+    db = await _read_conn()
+    result: Dict[int, Dict[int, Dict[str, Any]]] = {}
+    async with db.execute(
+        "SELECT user_id, goal_num, progress_days, rest_days, last_progress_day, reports_count FROM progress_stats"
+    ) as cur:
+        async for row in cur:
+            result.setdefault(row[0], {})[row[1]] = _progress_stats_from_row(row[1:])
+    return result
+
+
+def _leaderboard_entry(row, rank: int) -> Dict[str, Any]:
+    return {
+        "rank": rank,
+        "user_id": row[0],
+        "reports_count": row[1],
+        "progress_days": row[2],
+        "active_goals": row[3],
+    }
+
+
+async def get_leaderboard(offset: int = 0, limit: Optional[int] = None) -> Dict[str, Any]:
+    """Срез рейтинга активных участников: {"total", "entries"}; limit=None — до конца."""
+    db = await _read_conn()
+    async with db.execute("SELECT COUNT(*) FROM leaderboard WHERE active = 1") as cur:
+        total = (await cur.fetchone())[0]
+    async with db.execute(
+        f"SELECT user_id, reports_count, progress_days, active_goals FROM leaderboard WHERE active = 1 "
+        f"ORDER BY {_RANK_ORDER} LIMIT ? OFFSET ?",
+        (-1 if limit is None else limit, offset),
+    ) as cur:
+        entries = [_leaderboard_entry(row, offset + i + 1) for i, row in enumerate(await cur.fetchall())]
+    return {"total": total, "entries": entries}
+
+
+async def get_leaderboard_rank(user_id: int) -> Optional[int]:
+    """Место активного участника в рейтинге (с 1); None — участника нет или он выбыл."""
+    db = await _read_conn()
+    async with db.execute(
+        "SELECT reports_count, score FROM leaderboard WHERE user_id = ? AND active = 1", (user_id,)
+    ) as cur:
+        row = await cur.fetchone()
+    if row is None:
+        return None
+    reports_count, score = row
+    async with db.execute(
+        "SELECT COUNT(*) FROM leaderboard WHERE active = 1 AND (reports_count > ? "
+        "OR (reports_count = ? AND (score > ? OR (score = ? AND user_id < ?))))",
+        (reports_count, reports_count, score, score, user_id),
+    ) as cur:
+        return (await cur.fetchone())[0] + 1
+
+
+async def replace_settings(settings: Dict[str, Any]) -> int:
+    async with _write_tx() as db:
+        await _replace_settings(db, settings)
+        await _record_change(db, CHANGE_SETTINGS, '*', 'replace')
+        return await _bump_version(db)
+
+
+async def last_change_id() -> int:
+    """Номер последней записи журнала изменений (0 — журнал пуст)."""
+    db = await _read_conn()
+    async with db.execute("SELECT MAX(id) FROM changes") as cur:
+        row = await cur.fetchone()
+    return row[0] or 0
+
+
+async def count_changes() -> int:
+    """Число записей журнала изменений, еще не выгруженных на Я.Диск."""
+    db = await _read_conn()
+    async with db.execute("SELECT COUNT(*) FROM changes") as cur:
+        return (await cur.fetchone())[0]
+
+
+async def request_urgent_sync() -> None:
+    """Просит процесс-лидер выгрузить изменения на Я.Диск без обычной задержки."""
+    await set_value(SYNC_URGENT_KEY, "1")
+
+
+async def take_urgent_sync_request() -> bool:
+    """Забирает запрос срочной выгрузки; True — он был."""
+    async with _write_tx() as db:
+        cur = await db.execute("DELETE FROM kv WHERE key = ?", (SYNC_URGENT_KEY,))
+        return cur.rowcount > 0
+
+
+async def load_changes() -> Dict[str, Any]:
+    """Изменения с последней выгрузки: по одной записи на строку с ее текущим состоянием.
+
+    Возвращает {"last_id", "reset", "changes"}; reset=True — данные перезаписывались целиком,
+    и выгружать нужно всю книгу.
+    """
+    db = await _read_conn()
+    async with db.execute("SELECT id, entity, entity_key, op FROM changes ORDER BY id") as cur:
+        rows = await cur.fetchall()
+    latest: Dict[tuple, tuple] = {}
+    for change_id, entity, key, op in rows:
+        latest.pop((entity, key), None)
+        latest[(entity, key)] = (change_id, op)
+    result: Dict[str, Any] = {
+        "last_id": rows[-1][0] if rows else 0,
+        "reset": (CHANGE_RESET, '*') in latest,
+        "changes": [],
+    }
+    if result["reset"]:
+        return result
+    for (entity, key), (change_id, op) in latest.items():
+        item: Dict[str, Any] = {"change_id": change_id, "entity": entity, "key": key, "op": op}
+        if op != 'delete':
+            if entity == CHANGE_PARTICIPANT:
+                item["data"] = await get_participant(int(key))
+            elif entity == CHANGE_REPORT:
+                user_id, day = key.split(":")
+                item["data"] = await get_report(int(user_id), int(day))
+            elif entity == CHANGE_SETTINGS:
+                async with db.execute("SELECT key, value FROM settings") as cur:
+                    item["data"] = {row[0]: json.loads(row[1]) for row in await cur.fetchall()}
+        result["changes"].append(item)
+    return result
+
+
+async def prune_changes(last_id: int) -> None:
+    """Удаляет выгруженные записи журнала (до last_id включительно)."""
+    async with _write_tx() as db:
+        await db.execute("DELETE FROM changes WHERE id <= ?", (last_id,))
+
+
+# Исходящие сообщения. Выбранные к отправке строки переводятся в 'sending': если процесс упал
+# посреди отправки, такие строки при старте помечаются 'unknown' и повторно не отправляются.
+OUTBOX_PENDING = 'pending'
+OUTBOX_SENDING = 'sending'
+OUTBOX_UNKNOWN = 'unknown'
+
+
+async def enqueue_messages(messages: List[Dict[str, Any]]) -> int:
+    """Ставит сообщения в очередь; сообщения с уже известным dedup_key пропускаются.
+
+    Возвращает число добавленных сообщений.
+    """
+    async with _write_tx() as db:
+        before = db.total_changes
+        await db.executemany(
+            "INSERT OR IGNORE INTO outbox(dedup_key, chat_id, thread_id, text, parse_mode, next_attempt_at, created_at) "
+            "VALUES(?, ?, ?, ?, ?, strftime('%s','now'), strftime('%s','now'))",
+            [(m["dedup_key"], m["chat_id"], m.get("thread_id"), m["text"], m.get("parse_mode")) for m in messages],
+        )
+        return db.total_changes - before
+
+
+async def recover_outbox() -> int:
+    """Помечает сообщения, отправка которых прервалась остановкой процесса."""
+    async with _write_tx() as db:
+        cur = await db.execute(
+            "UPDATE outbox SET status = ?, last_error = 'interrupted' WHERE status = ?",
+            (OUTBOX_UNKNOWN, OUTBOX_SENDING),
+        )
+        return cur.rowcount
+
+
+async def claim_outbox(limit: int) -> List[Dict[str, Any]]:
+    """Забирает пачку готовых к отправке сообщений, переводя их в 'sending'."""
+    async with _write_tx() as db:
+        async with db.execute(
+            "SELECT id, chat_id, thread_id, text, parse_mode, attempts FROM outbox "
+            "WHERE status = ? AND next_attempt_at <= strftime('%s','now') ORDER BY id LIMIT ?",
+            (OUTBOX_PENDING, limit),
+        ) as cur:
+            rows = await cur.fetchall()
+        await db.executemany("UPDATE outbox SET status = ? WHERE id = ?", [(OUTBOX_SENDING, row[0]) for row in rows])
+    return [
+        {"id": row[0], "chat_id": row[1], "thread_id": row[2], "text": row[3], "parse_mode": row[4], "attempts": row[5]}
+        for row in rows
+    ]
+
+
+async def finish_outbox_message(message_id: int, status: str, error: Optional[str] = None,
+                                retry_in: Optional[int] = None) -> None:
+    """Записывает исход отправки; retry_in — вернуть сообщение в очередь через столько секунд."""
+    async with _write_tx() as db:
+        if retry_in is not None:
+            await db.execute(
+                "UPDATE outbox SET status = ?, attempts = attempts + 1, last_error = ?, "
+                "next_attempt_at = strftime('%s','now') + ? WHERE id = ?",
+                (OUTBOX_PENDING, error, retry_in, message_id),
+            )
+        else:
+            await db.execute(
+                "UPDATE outbox SET status = ?, attempts = attempts + 1, last_error = ?, "
+                "sent_at = strftime('%s','now') WHERE id = ?",
+                (status, error, message_id),
+            )
+
+
+async def release_outbox(message_ids: List[int]) -> None:
+    """Возвращает в очередь забранные, но не отправленные сообщения (остановка посреди пачки)."""
+    async with _write_tx() as db:
+        await db.executemany(
+            "UPDATE outbox SET status = ? WHERE id = ? AND status = ?",
+            [(OUTBOX_PENDING, message_id, OUTBOX_SENDING) for message_id in message_ids],
+        )
+
+
+async def outbox_counts() -> Dict[str, int]:
+    """Число сообщений очереди по статусам"""
+    db = await _read_conn()
+    async with db.execute("SELECT status, COUNT(*) FROM outbox GROUP BY status") as cur:
+        return {row[0]: row[1] for row in await cur.fetchall()}
+
+
+# Токены входа на сайт. Это не данные игры: data_version и журнал изменений не трогаются.
+async def add_auth_token(token_hash: str, user_id: int, expires_at: int) -> None:
+    async with _write_tx() as db:
+        await db.execute(
+            "INSERT OR REPLACE INTO auth_tokens(token_hash, user_id, expires_at, created_at) "
+            "VALUES(?, ?, ?, strftime('%s','now'))",
+            (token_hash, user_id, expires_at),
+        )
+
+
+async def get_auth_token(token_hash: str) -> Optional[Dict[str, Any]]:
+    db = await _read_conn()
+    async with db.execute("SELECT user_id, expires_at FROM auth_tokens WHERE token_hash = ?", (token_hash,)) as cur:
+        row = await cur.fetchone()
+    return {"user_id": row[0], "expires_at": row[1]} if row else None
+
+
+async def delete_auth_token(token_hash: str) -> None:
+    async with _write_tx() as db:
+        await db.execute("DELETE FROM auth_tokens WHERE token_hash = ?", (token_hash,))
+
+
+async def delete_expired_auth_tokens(now: int) -> int:
+    """Удаляет истекшие токены по индексу срока; возвращает их число."""
+    async with _write_tx() as db:
+        cur = await db.execute("DELETE FROM auth_tokens WHERE expires_at <= ?", (now,))
+        return cur.rowcount
+
+
+async def count_auth_tokens() -> int:
+    db = await _read_conn()
+    async with db.execute("SELECT COUNT(*) FROM auth_tokens") as cur:
+        return (await cur.fetchone())[0]
+
+
+# Аренды (leases) для выбора одного процесса-исполнителя среди бота и воркеров API.
+# Владелец продлевает аренду раньше срока; истекшую аренду может забрать любой процесс.
+async def acquire_lease(name: str, owner: str, ttl: float, now: float) -> bool:
+    """Берет или продлевает аренду; True — аренда у owner до now + ttl."""
+    async with _write_tx() as db:
+        await db.execute(
+            "INSERT INTO leases(name, owner, expires_at) VALUES(?, ?, ?) "
+            "ON CONFLICT(name) DO UPDATE SET owner=excluded.owner, expires_at=excluded.expires_at "
+            "WHERE leases.owner = excluded.owner OR leases.expires_at <= ?",
+            (name, owner, now + ttl, now),
+        )
+        async with db.execute("SELECT owner FROM leases WHERE name = ?", (name,)) as cur:
             row = await cur.fetchone()
-            return int(row[0]) if row and row[0] is not None else None
+        return bool(row) and row[0] == owner
+
+
+async def release_lease(name: str, owner: str) -> None:
+    async with _write_tx() as db:
+        await db.execute("DELETE FROM leases WHERE name = ? AND owner = ?", (name, owner))
+
+
+async def get_lease(name: str) -> Optional[Dict[str, Any]]:
+    db = await _read_conn()
+    async with db.execute("SELECT owner, expires_at FROM leases WHERE name = ?", (name,)) as cur:
+        row = await cur.fetchone()
+    return {"owner": row[0], "expires_at": row[1]} if row else None
+
+
+# Состояния диалогов бота (FSM aiogram). Как и токены, не являются данными игры:
+# data_version и журнал изменений не трогаются.
+async def get_fsm(key: str) -> Optional[Dict[str, Any]]:
+    db = await _read_conn()
+    async with db.execute("SELECT state, data FROM fsm WHERE key = ?", (key,)) as cur:
+        row = await cur.fetchone()
+    return {"state": row[0], "data": json.loads(row[1])} if row else None
+
+
+async def set_fsm_state(key: str, state: Optional[str]) -> None:
+    async with _write_tx() as db:
+        await db.execute(
+            "INSERT INTO fsm(key, state, updated_at) VALUES(?, ?, strftime('%s','now')) "
+            "ON CONFLICT(key) DO UPDATE SET state=excluded.state, updated_at=excluded.updated_at",
+            (key, state),
+        )
+        await db.execute("DELETE FROM fsm WHERE key = ? AND state IS NULL AND data = '{}'", (key,))
+
+
+async def set_fsm_data(key: str, data: Dict[str, Any]) -> None:
+    async with _write_tx() as db:
+        await db.execute(
+            "INSERT INTO fsm(key, data, updated_at) VALUES(?, ?, strftime('%s','now')) "
+            "ON CONFLICT(key) DO UPDATE SET data=excluded.data, updated_at=excluded.updated_at",
+            (key, json.dumps(data, ensure_ascii=False)),
+        )
+        await db.execute("DELETE FROM fsm WHERE key = ? AND state IS NULL AND data = '{}'", (key,))
+
 
+async def prune_fsm(older_than_seconds: int) -> int:
+    """Удаляет брошенные диалоги, которые не менялись дольше older_than_seconds."""
+    async with _write_tx() as db:
+        cur = await db.execute(
+            "DELETE FROM fsm WHERE updated_at < strftime('%s','now') - ?", (older_than_seconds,))
+        return cur.rowcount
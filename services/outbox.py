@@ -0,0 +1,136 @@
+import asyncio
+import logging
+from datetime import date
+from typing import Any, Dict, List, Optional
+
+from aiogram import Bot
+
+from services import local_store, dispatcher
+
+
+# Очередь исходящих сообщений в локальной БД: рассылки переживают перезапуск бота,
+# а ключ dedup_key (вид, день, получатель) не дает отправить одно и то же дважды.
+# Ставить сообщения может любой процесс с общей БД (бот, воркеры API), а разбирает очередь
+# один потребитель — воркер в процессе бота. Поэтому API и бот должны работать с одним файлом
+# data/data.db (в Docker — общий том ./data), иначе сообщения из API не будут отправлены.
+_BATCH_SIZE = 200
+_POLL_SECONDS = 5
+_MAX_ATTEMPTS = 5
+_RETRY_BASE_SECONDS = 60
+
+_wakeup: Optional[asyncio.Event] = None
+_stopping: Optional[asyncio.Event] = None
+_worker_task: Optional[asyncio.Task] = None
+_stats: Dict[str, Any] = {"batches": 0, "last_batch": None}
+
+
+def message(kind: str, day: int, chat_id: int, text: str, thread_id: Optional[int] = None,
+            parse_mode: Optional[str] = "HTML", *, bot_date: date) -> Dict[str, Any]:
+    """Сообщение для очереди с ключом дедупликации (вид, день, чат).
+
+    В ключ входит и календарная дата: номера дней повторяются, если игру начали заново.
+    bot_date — дата по времени бота (bot_now), по тем же часам, что и номер дня: по системной
+    дате один день бота со смещением мог бы попасть на две даты и уйти дважды.
+    """
+    return {
+        "dedup_key": f"{kind}:{bot_date.isoformat()}:{day}:{chat_id}",
+        "chat_id": chat_id,
+        "thread_id": thread_id,
+        "text": text,
+        "parse_mode": parse_mode,
+    }
+
+
+async def enqueue(messages: List[Dict[str, Any]]) -> Dict[str, int]:
+    """Ставит сообщения в очередь и будит воркер; возвращает число новых и повторных."""
+    if not messages:
+        return {"enqueued": 0, "duplicates": 0}
+    added = await local_store.enqueue_messages(messages)
+    if _wakeup is not None:
+        _wakeup.set()
+    return {"enqueued": added, "duplicates": len(messages) - added}
+
+
+async def _on_result(message: Dict[str, Any], outcome: str, error: Optional[str]) -> None:
+    if outcome == dispatcher.FAILED and message["attempts"] + 1 < _MAX_ATTEMPTS:
+        retry_in = _RETRY_BASE_SECONDS * 2 ** message["attempts"]
+        await local_store.finish_outbox_message(message["id"], outcome, error, retry_in=retry_in)
+    else:
+        await local_store.finish_outbox_message(message["id"], outcome, error)
+
+
+async def drain(bot: Bot) -> int:
+    """Отправляет все готовые сообщения очереди; возвращает число обработанных."""
+    processed = 0
+    while _stopping is None or not _stopping.is_set():
+        batch = await local_store.claim_outbox(_BATCH_SIZE)
+        if not batch:
+            return processed
+        report = await dispatcher.dispatch(bot, batch, name="outbox", on_result=_on_result, stop=_stopping)
+        if report["unsent"]:
+            await local_store.release_outbox(report["unsent"])
+        _stats["batches"] += 1
+        _stats["last_batch"] = {
+            "size": report["total"],
+            "counts": report["counts"],
+            "duration_seconds": report["duration_seconds"],
+            "messages_per_second": report["messages_per_second"],
+        }
+        processed += len(batch) - len(report["unsent"])
+    return processed
+
+
+def start_worker(bot: Bot) -> asyncio.Task:
+    """Запускает фоновый воркер очереди; вызывается только ботом — единственным потребителем."""
+    global _worker_task, _stopping
+    if _worker_task is None or _worker_task.done():
+        _stopping = asyncio.Event()
+        _worker_task = asyncio.get_running_loop().create_task(run_worker(bot))
+    return _worker_task
+
+
+async def stop_worker(timeout: float = 10) -> None:
+    """Останавливает воркер: текущие отправки завершаются, остальные сообщения остаются в очереди.
+
+    Если за timeout отправки не завершились, воркер прерывается — такие сообщения после
+    перезапуска получат статус unknown.
+    """
+    global _worker_task
+    if _worker_task is None:
+        return
+    _stopping.set()
+    if _wakeup is not None:
+        _wakeup.set()
+    try:
+        await asyncio.wait_for(asyncio.shield(_worker_task), timeout)
+    except asyncio.TimeoutError:
+        logging.warning(f"Очередь сообщений: воркер не остановился за {timeout} с, прерываем")
+        _worker_task.cancel()
+        await asyncio.gather(_worker_task, return_exceptions=True)
+    counts = await local_store.outbox_counts()
+    logging.info(f"Очередь сообщений остановлена, ожидают отправки: {counts.get(local_store.OUTBOX_PENDING, 0)}")
+    _worker_task = None
+
+
+async def run_worker(bot: Bot) -> None:
+    """Фоновый воркер очереди: разбирает ее при постановке сообщений и раз в _POLL_SECONDS."""
+    global _wakeup
+    _wakeup = asyncio.Event()
+    interrupted = await local_store.recover_outbox()
+    if interrupted:
+        logging.warning(f"Очередь сообщений: {interrupted} сообщений прерваны при остановке и не будут повторены")
+    while _stopping is None or not _stopping.is_set():
+        try:
+            await drain(bot)
+        except Exception as e:
+            logging.error(f"Ошибка воркера очереди сообщений: {e}")
+        _wakeup.clear()
+        try:
+            await asyncio.wait_for(_wakeup.wait(), _POLL_SECONDS)
+        except asyncio.TimeoutError:
+            pass
+
+
+async def get_stats() -> Dict[str, Any]:
+    """Состояние очереди: число сообщений по статусам и пропускная способность последней пачки"""
+    return {"counts": await local_store.outbox_counts(), **_stats}
@@ -1,12 +1,13 @@
-import asyncio
 import logging
-from datetime import datetime, time
-from typing import List, Optional
+from datetime import datetime
+from typing import Any, Dict, List, Optional
 from aiogram import Bot
-from services.game_data import GameDataManager
+from services.game_data import get_game_data
+from services import elimination, outbox
+from services.scheduler import DailyScheduler, bot_now, parse_time
 from config_reader import config
 
-game_data = GameDataManager()
+game_data = get_game_data()
 
 # Глобальное хранилище для ID треда бота (можно улучшить, добавив в БД)
 _bot_thread_id: Optional[int] = None
@@ -52,8 +53,7 @@ def get_bot_thread_id_sync() -> Optional[int]:
     return _bot_thread_id
 
 
-async def send_reminder(bot: Bot, user_id: int, day: int, is_late: bool = False):
-    """Отправляет напоминание пользователю"""
+def _reminder_text(day: int, is_late: bool = False) -> str:
     if is_late:
         text = (
             f"⚠️ <b>Внимание! Вы не отправили отчет за день #{day}</b>\n\n"
@@ -66,12 +66,7 @@ async def send_reminder(bot: Bot, user_id: int, day: int, is_late: bool = False)
             f"Не забудьте отправить отчет за день #{day}!\n\n"
             "Используйте /report или кнопку '📊 Отправить отчет' в меню."
         )
-    
-    try:
-        await bot.send_message(user_id, text, parse_mode="HTML")
-    except Exception as e:
-        # Пользователь заблокировал бота или другая ошибка
-        logging.warning(f"Не удалось отправить напоминание пользователю {user_id}: {e}")
+    return text
 
 
 async def send_update_to_thread(bot: Bot, chat_id: int, message: str, thread_id: Optional[int] = None):
@@ -91,152 +86,143 @@ async def send_update_to_thread(bot: Bot, chat_id: int, message: str, thread_id:
             logging.error(f"Не удалось отправить сообщение в тред: {e}")
 
 
-async def check_and_remind_users(bot: Bot, chat_id: Optional[int] = None, thread_id: Optional[int] = None):
-    """Проверяет всех пользователей и отправляет напоминания"""
+async def check_and_remind_users(bot: Bot, chat_id: Optional[int] = None,
+                                 thread_id: Optional[int] = None) -> Dict[str, Any]:
+    """Проверяет всех пользователей и ставит напоминания в очередь; возвращает число поставленных"""
     data = await game_data.get_all_data()
-    current_day = game_data.get_current_day()
+    # День и позднее ли напоминание — по тем же часам бота, что и время рассылки
+    settings = await game_data.get_settings()
+    now = bot_now(settings)
+    current_day = game_data.game_day(settings, now)
     
     users_without_report = []
+    reported_today = game_data.get_day_report_user_ids(current_day, data)
     
     # Проверяем всех активных участников
     for participant in data["participants"]:
         if participant["status"] != "active":
             continue
         
-        user_id = participant["user_id"]
-        
         # Проверяем, есть ли отчет за сегодня
-        has_report_today = False
-        for report in data["reports"]:
-            if report["user_id"] == user_id and report["day"] == current_day:
-                has_report_today = True
-                break
-        
-        if not has_report_today:
+        if participant["user_id"] not in reported_today:
             users_without_report.append(participant)
-            # Отправляем напоминание
-            # Проверяем время: если после 20:00, то это позднее напоминание
-            now = datetime.now()
-            is_late = now.hour >= 20
-            
-            await send_reminder(bot, user_id, current_day, is_late)
-            await asyncio.sleep(1)  # Небольшая задержка между отправками
     
-    # Отправляем сводку в тред, если есть пользователи без отчета
+    # Время проверяем один раз на всю рассылку: если после 20:00, то это позднее напоминание
+    is_late = now.hour >= 20
+    kind = "reminder_late" if is_late else "reminder"
+    text = _reminder_text(current_day, is_late)
+    messages = [outbox.message(kind, current_day, p["user_id"], text, bot_date=now.date()) for p in users_without_report]
+    
+    # Сводка в тред, если есть пользователи без отчета
     if users_without_report and chat_id:
-        count = len(users_without_report)
-        if count > 0:
+        thread_id = thread_id or await get_bot_thread_id()
+        if thread_id:
             summary = (
                 f"📊 <b>Напоминание о отчетах за день #{current_day}</b>\n\n"
-                f"Не отправили отчет: <b>{count}</b> участников\n\n"
+                f"Не отправили отчет: <b>{len(users_without_report)}</b> участников\n\n"
                 "Не забудьте отправить отчет до конца дня!"
             )
-            await send_update_to_thread(bot, chat_id, summary, thread_id)
+            messages.append(outbox.message(f"{kind}_summary", current_day, chat_id, summary, thread_id,
+                                           bot_date=now.date()))
+    
+    return await outbox.enqueue(messages)
 
 
-async def check_and_remove_inactive_users(bot: Bot, chat_id: Optional[int] = None, thread_id: Optional[int] = None):
-    """Проверяет и исключает неактивных пользователей"""
-    data = await game_data.get_all_data()
-    current_day = game_data.get_current_day()
+async def check_and_remove_inactive_users(bot: Bot, chat_id: Optional[int] = None, thread_id: Optional[int] = None,
+                                          dry_run: bool = False, at: Optional[datetime] = None) -> Dict[str, Any]:
+    """Исключает неактивных пользователей и ставит уведомления в очередь; возвращает итог прохода.
+
+    Исключение (в том числе ручное из админки) выполняется не раньше removal_time по времени бота:
+    раньше день еще не закончился и исключены были бы все, кто пока не отчитался. Тогда возвращается
+    итог с too_early=True, время бота и removal_time — вызывающий код сообщает причину админу.
+    at — момент по времени бота, за который проверять (срок планировщика, в том числе вчерашний
+    при догоняющем запуске); по умолчанию сейчас.
+    dry_run=True — только предварительный просмотр (в любое время, без записи и уведомлений).
+    """
+    settings = await game_data.get_settings()
+    now = at or bot_now(settings)
+    removal_time = parse_time(settings.get("removal_time"), "23:30")
+    if not dry_run and now.time() < removal_time:
+        return {
+            "too_early": True,
+            "day": game_data.game_day(settings, now),
+            "bot_time": now.strftime("%H:%M"),
+            "removal_time": removal_time.strftime("%H:%M"),
+            "verdicts": [],
+            "removed_count": 0,
+        }
     
-    # Проверяем отчеты только после 23:00
-    now = datetime.now()
-    if now.hour < 23:
-        return
+    result = await elimination.run_elimination(game_data, dry_run=dry_run, day=game_data.game_day(settings, now))
+    verdicts = result["verdicts"]
+    if dry_run or not verdicts:
+        return result
     
-    removed_users = []
-    removed_for_no_report = []
-    removed_for_low_progress = []
+    current_day = result["day"]
+    removed_for_no_report = [v["game_name"] for v in verdicts if v["reason"] == elimination.NO_REPORT]
+    removed_for_low_progress = [v["game_name"] for v in verdicts if v["reason"] == elimination.LOW_PROGRESS]
+    notices = []
+    for verdict in verdicts:
+        if verdict["reason"] == elimination.LOW_PROGRESS:
+            text = (
+                f"❌ Вы исключены из игры за недостаточный прогресс по целям "
+                f"(день #{current_day}).\n\n"
+                f"Требовалось минимум {elimination.MIN_PROGRESS_GOALS} цели с прогрессом."
+            )
+        else:
+            text = f"❌ Вы исключены из игры за отсутствие отчета за день #{current_day}."
+        notices.append(outbox.message("removed", current_day, verdict["user_id"], text, parse_mode=None,
+                                      bot_date=now.date()))
     
-    for participant in data["participants"]:
-        if participant["status"] != "active":
-            continue
-        
-        user_id = participant["user_id"]
-        game_name = participant.get("game_name", f"ID {user_id}")
-        
-        # Проверяем, есть ли отчет за сегодня
-        has_report_today = False
-        for report in data["reports"]:
-            if report["user_id"] == user_id and report["day"] == current_day:
-                has_report_today = True
-                # Проверяем количество целей с прогрессом
-                progress_count = sum(1 for p in report["progress"] if p and p.strip() and p != "Отдых")
-                rest_day = report.get("rest_day", False)
-                
-                # Если не день отдыха и прогресс меньше 2 целей - исключаем
-                if not rest_day and progress_count < 2 and current_day > 1:
-                    participant["status"] = "removed"
-                    removed_users.append(user_id)
-                    removed_for_low_progress.append(game_name)
-                    try:
-                        await bot.send_message(
-                            user_id,
-                            f"❌ Вы исключены из игры за недостаточный прогресс по целям "
-                            f"(день #{current_day}).\n\n"
-                            f"Требовалось минимум 2 цели с прогрессом."
-                        )
-                    except:
-                        pass
-                break
-        
-        # Если нет отчета - исключаем (только после первого дня)
-        if not has_report_today and current_day > 1:
-            participant["status"] = "removed"
-            removed_users.append(user_id)
-            removed_for_no_report.append(game_name)
-            try:
-                await bot.send_message(
-                    user_id,
-                    f"❌ Вы исключены из игры за отсутствие отчета за день #{current_day}."
-                )
-            except:
-                pass
+    # Формируем сообщение для треда
+    message_parts = [
+        f"❌ <b>Исключение участников. День #{current_day}</b>\n",
+        f"Всего исключено: <b>{len(verdicts)}</b>\n"
+    ]
     
-    if removed_users:
-        await game_data.save_data(data, sync_to_main=True)
-        
-        # Формируем сообщение для треда
-        message_parts = [
-            f"❌ <b>Исключение участников. День #{current_day}</b>\n",
-            f"Всего исключено: <b>{len(removed_users)}</b>\n"
-        ]
-        
-        if removed_for_no_report:
-            message_parts.append(f"\n📝 <b>Без отчета ({len(removed_for_no_report)}):</b>")
-            for name in removed_for_no_report[:5]:  # Показываем до 5 имен
-                message_parts.append(f"• {name}")
-            if len(removed_for_no_report) > 5:
-                message_parts.append(f"... и еще {len(removed_for_no_report) - 5}")
-        
-        if removed_for_low_progress:
-            message_parts.append(f"\n📉 <b>Недостаточный прогресс ({len(removed_for_low_progress)}):</b>")
-            for name in removed_for_low_progress[:5]:
-                message_parts.append(f"• {name}")
-            if len(removed_for_low_progress) > 5:
-                message_parts.append(f"... и еще {len(removed_for_low_progress) - 5}")
-        
-        if chat_id:
-            await send_update_to_thread(bot, chat_id, "\n".join(message_parts), thread_id)
-        
-        # Уведомляем админа
-        if config.admin_chat_id:
-            try:
-                await bot.send_message(
-                    config.admin_chat_id,
-                    f"⚠️ Исключены пользователи: {len(removed_users)}"
-                )
-            except:
-                pass
+    if removed_for_no_report:
+        message_parts.append(f"\n📝 <b>Без отчета ({len(removed_for_no_report)}):</b>")
+        for name in removed_for_no_report[:5]:  # Показываем до 5 имен
+            message_parts.append(f"• {name}")
+        if len(removed_for_no_report) > 5:
+            message_parts.append(f"... и еще {len(removed_for_no_report) - 5}")
+    
+    if removed_for_low_progress:
+        message_parts.append(f"\n📉 <b>Недостаточный прогресс ({len(removed_for_low_progress)}):</b>")
+        for name in removed_for_low_progress[:5]:
+            message_parts.append(f"• {name}")
+        if len(removed_for_low_progress) > 5:
+            message_parts.append(f"... и еще {len(removed_for_low_progress) - 5}")
+    
+    if chat_id:
+        thread_id = thread_id or await get_bot_thread_id()
+        if thread_id:
+            notices.append(outbox.message(
+                "removed_summary", current_day, chat_id, "\n".join(message_parts), thread_id,
+                bot_date=now.date(),
+            ))
+    
+    # Уведомляем админа
+    if config.admin_chat_id:
+        notices.append(outbox.message(
+            "removed_admin", current_day, config.admin_chat_id,
+            f"⚠️ Исключены пользователи: {len(verdicts)}",
+            parse_mode=None, bot_date=now.date(),
+        ))
+    
+    # Уведомления уходят через очередь уже после сохранения статусов
+    result["notices"] = await outbox.enqueue(notices)
+    return result
 
 
 async def send_daily_stats(bot: Bot, chat_id: int, thread_id: Optional[int] = None):
-    """Отправляет ежедневную статистику в тред"""
+    """Ставит ежедневную статистику для треда в очередь"""
     data = await game_data.get_all_data()
-    current_day = game_data.get_current_day()
+    settings = await game_data.get_settings()
+    now = bot_now(settings)
+    current_day = game_data.game_day(settings, now)
     
     active_users = sum(1 for p in data["participants"] if p["status"] == "active")
-    reports_today = sum(1 for r in data["reports"] if r["day"] == current_day)
+    reports_today = len(game_data.get_day_report_user_ids(current_day, data))
     
     stats_text = (
         f"📊 <b>Ежедневная статистика. День #{current_day}/90</b>\n\n"
@@ -248,35 +234,42 @@ async def send_daily_stats(bot: Bot, chat_id: int, thread_id: Optional[int] = No
         missing = active_users - reports_today
         stats_text += f"\n⚠️ Еще не отправили отчет: <b>{missing}</b> участников"
     
-    await send_update_to_thread(bot, chat_id, stats_text, thread_id)
+    thread_id = thread_id or await get_bot_thread_id()
+    if chat_id and thread_id:
+        await outbox.enqueue([outbox.message("daily_stats", current_day, chat_id, stats_text, thread_id,
+                                                   bot_date=now.date())])
 
 
-async def reminder_loop(bot: Bot, chat_id: Optional[int] = None, thread_id: Optional[int] = None):
-    """Основной цикл напоминаний"""
-    last_minute = -1
-    
-    while True:
-        try:
-            now = datetime.now()
-            current_minute = now.minute
-            current_hour = now.hour
-            
-            # Проверяем и отправляем напоминания в 18:00 (только один раз в минуту)
-            if current_hour == 18 and current_minute == 0 and last_minute != 0:
-                await check_and_remind_users(bot, chat_id, thread_id)
-                # Отправляем статистику
-                if chat_id:
-                    await send_daily_stats(bot, chat_id, thread_id)
-            
-            # Проверяем и исключаем неактивных в 23:30 (только один раз в минуту)
-            if current_hour == 23 and current_minute == 30 and last_minute != 30:
-                await check_and_remove_inactive_users(bot, chat_id, thread_id)
-            
-            last_minute = current_minute
-            
-            # Ждем минуту перед следующей проверкой
-            await asyncio.sleep(60)
-        except Exception as e:
-            logging.error(f"Ошибка в цикле напоминаний: {e}")
-            await asyncio.sleep(60)
+_scheduler = DailyScheduler(game_data.get_settings)
+_targets: Dict[str, Any] = {"bot": None, "chat_id": None, "thread_id": None}
+
+
+async def _reminders_job(slot: datetime) -> None:
+    bot, chat_id, thread_id = _targets["bot"], _targets["chat_id"], _targets["thread_id"]
+    await check_and_remind_users(bot, chat_id, thread_id)
+    # Отправляем статистику
+    if chat_id:
+        await send_daily_stats(bot, chat_id, thread_id)
+
+
+async def _removal_job(slot: datetime) -> None:
+    # Проверяется день срока: при догоняющем запуске после полуночи — вчерашний
+    await check_and_remove_inactive_users(_targets["bot"], _targets["chat_id"], _targets["thread_id"], at=slot)
+
+
+_scheduler.add_job("reminders", "reminder_time", "18:00", _reminders_job)
+_scheduler.add_job("removal", "removal_time", "23:30", _removal_job, catch_up=True)
+
+
+def start_reminder_scheduler(bot: Bot, chat_id: Optional[int] = None, thread_id: Optional[int] = None) -> bool:
+    """Запускает планировщик напоминаний и исключений (один на процесс).
+
+    Повторный вызов только обновляет чат/тред для сводок; True — планировщик запущен этим вызовом.
+    """
+    _targets.update(bot=bot, chat_id=chat_id, thread_id=thread_id)
+    return _scheduler.start()
+
 
+async def stop_reminder_scheduler() -> None:
+    """Останавливает планировщик при остановке бота (до очереди сообщений и сервиса данных)."""
+    await _scheduler.stop()
@@ -0,0 +1,156 @@
+import asyncio
+import logging
+from datetime import datetime, time, timedelta
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+
+from services import local_store
+
+
+# Проснуться не реже этого интервала, чтобы подхватить время задач, измененное в другом процессе (API)
+_MAX_SLEEP_SECONDS = 600
+_LAST_RUN_KEY = "job_last_run:{name}"
+
+
+def bot_now(settings: Dict[str, Any]) -> datetime:
+    """Текущее время бота с учетом смещения time_offset_hours."""
+    try:
+        offset = int(settings.get("time_offset_hours", 0) or 0)
+    except Exception:
+        offset = 0
+    return datetime.now() + timedelta(hours=offset)
+
+
+def parse_time(value: Any, default: str) -> time:
+    """Разбирает время вида "ЧЧ:ММ"; при ошибке возвращает default."""
+    for candidate in (value, default):
+        try:
+            hours, minutes = str(candidate).strip().split(":")
+            return time(int(hours), int(minutes))
+        except Exception:
+            continue
+    raise ValueError(f"Неверное время по умолчанию: {default}")
+
+
+async def get_last_run(name: str) -> Optional[Dict[str, Any]]:
+    """Последний запуск задачи: {"date": дата срока по времени бота, "ran_at": время запуска}."""
+    return await local_store.get_json(_LAST_RUN_KEY.format(name=name))
+
+
+class DailyJob:
+    """Ежедневная задача: время берется из настроек по setting_key.
+
+    run получает срок запуска (по времени бота). catch_up=True — срок вчерашнего дня, пропущенный
+    из-за остановки процесса через полночь, выполняется один раз после запуска.
+    """
+
+    def __init__(self, name: str, setting_key: str, default_time: str,
+                 run: Callable[[datetime], Awaitable[None]], catch_up: bool = False):
+        self.name = name
+        self.setting_key = setting_key
+        self.default_time = default_time
+        self.run = run
+        self.catch_up = catch_up
+
+
+class DailyScheduler:
+    """Планировщик ежедневных задач по времени бота.
+
+    Спит до ближайшего срока, а не опрашивает часы каждую минуту. Дата срока последнего запуска
+    каждой задачи хранится в локальной БД: после перезапуска пропущенная сегодня задача
+    выполняется сразу; вчерашний срок догоняется только задачами с catch_up (и только если задача
+    уже запускалась раньше — иначе нечего догонять). Цикл в процессе один — повторный start()
+    только будит его.
+    """
+
+    def __init__(self, get_settings: Callable[[], Awaitable[Dict[str, Any]]]):
+        self._get_settings = get_settings
+        self._jobs: List[DailyJob] = []
+        self._task: Optional[asyncio.Task] = None
+        self._wakeup: Optional[asyncio.Event] = None
+        self._stopping = False
+
+    def add_job(self, name: str, setting_key: str, default_time: str,
+                run: Callable[[datetime], Awaitable[None]], catch_up: bool = False) -> None:
+        self._jobs.append(DailyJob(name, setting_key, default_time, run, catch_up))
+
+    def start(self) -> bool:
+        """Запускает цикл, если он еще не запущен; иначе пересчитывает сроки. True — цикл запущен сейчас."""
+        if self._task is not None and not self._task.done():
+            self.reschedule()
+            return False
+        self._stopping = False
+        self._wakeup = asyncio.Event()
+        self._task = asyncio.get_running_loop().create_task(self._run())
+        return True
+
+    def reschedule(self) -> None:
+        """Будит цикл, чтобы он перечитал время задач из настроек."""
+        if self._wakeup is not None:
+            self._wakeup.set()
+
+    async def stop(self, timeout: float = 10) -> None:
+        """Останавливает цикл: новые задачи не запускаются, начатая дорабатывает не дольше timeout."""
+        if self._task is None:
+            return
+        self._stopping = True
+        self.reschedule()
+        try:
+            await asyncio.wait_for(asyncio.shield(self._task), timeout)
+        except asyncio.TimeoutError:
+            logging.warning(f"Планировщик задач не остановился за {timeout} с, прерываем")
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+        self._task = None
+
+    async def _last_run_date(self, job: DailyJob) -> Optional[str]:
+        last_run = await get_last_run(job.name) or {}
+        return last_run.get("date")
+
+    async def _run_job(self, job: DailyJob, slot: datetime) -> None:
+        logging.info(f"Запуск задачи {job.name} (срок {slot:%Y-%m-%d %H:%M})")
+        try:
+            await job.run(slot)
+        except Exception as e:
+            logging.error(f"Ошибка задачи {job.name}: {e}")
+        # Запуск отмечается и при ошибке, чтобы не повторять задачу в цикле весь день
+        await local_store.set_json(_LAST_RUN_KEY.format(name=job.name), {
+            "date": slot.date().isoformat(),
+            "ran_at": datetime.now().isoformat(timespec="seconds"),
+        })
+
+    async def _tick(self) -> float:
+        """Выполняет задачи, срок которых наступил; возвращает, сколько спать до следующего срока."""
+        settings = await self._get_settings()
+        now = bot_now(settings)
+        sleep_for = float(_MAX_SLEEP_SECONDS)
+        for job in self._jobs:
+            if self._stopping:
+                break
+            slot = datetime.combine(now.date(), parse_time(settings.get(job.setting_key), job.default_time))
+            last_date = await self._last_run_date(job)
+            missed = slot - timedelta(days=1)
+            if job.catch_up and last_date is not None and last_date < missed.date().isoformat():
+                # Процесс был остановлен в момент вчерашнего срока (через полночь) — догоняем его
+                await self._run_job(job, missed)
+                last_date = missed.date().isoformat()
+            if slot <= now:
+                if last_date != slot.date().isoformat():
+                    await self._run_job(job, slot)
+                slot += timedelta(days=1)
+            sleep_for = min(sleep_for, (slot - now).total_seconds())
+        return max(sleep_for, 1.0)
+
+    async def _run(self) -> None:
+        while not self._stopping:
+            try:
+                sleep_for = await self._tick()
+            except Exception as e:
+                logging.error(f"Ошибка планировщика задач: {e}")
+                sleep_for = 60.0
+            if self._stopping:
+                break
+            self._wakeup.clear()
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), sleep_for)
+            except asyncio.TimeoutError:
+                pass
@@ -0,0 +1,148 @@
+import time
+import asyncio
+import logging
+from typing import Any, Awaitable, Callable, Dict, Optional
+
+
+class SyncScheduler:
+    """Отложенная синхронизация с объединением записей.
+
+    Каждая запись помечает данные «грязными» и сдвигает срок выгрузки на quiet_delay
+    (для срочных записей — urgent_delay), но не дальше max_staleness от первой
+    несохраненной записи. Между выгрузками проходит не меньше min_interval, а выгрузка
+    одновременно идет только одна: записи во время выгрузки попадут в следующую.
+    """
+
+    def __init__(self, quiet_delay: float = 60, urgent_delay: float = 2,
+                 min_interval: float = 15, max_staleness: float = 300):
+        self.quiet_delay = quiet_delay
+        self.urgent_delay = urgent_delay
+        self.min_interval = min_interval
+        self.max_staleness = max_staleness
+        self._job: Optional[Callable[[], Awaitable[None]]] = None
+        self._task: Optional[asyncio.Task] = None
+        self._wakeup: Optional[asyncio.Event] = None
+        self._dirty = False
+        self._dirty_since: Optional[float] = None
+        self._due_at = 0.0
+        self._in_flight = False
+        self._upload_lock = asyncio.Lock()
+        self._last_finished_at: Optional[float] = None
+        self.uploads = 0
+        self.failures = 0
+        self.consecutive_failures = 0
+        self.last_success_at: Optional[float] = None
+        self.last_error: Optional[str] = None
+
+    def mark_dirty(self, job: Callable[[], Awaitable[None]], urgent: bool = False) -> None:
+        """Отмечает изменение данных и планирует выгрузку через job."""
+        now = time.monotonic()
+        self._job = job
+        if not self._dirty:
+            self._dirty = True
+            self._dirty_since = now
+            self._due_at = now + (self.urgent_delay if urgent else self.quiet_delay)
+        elif urgent:
+            self._due_at = min(self._due_at, now + self.urgent_delay)
+        else:
+            self._due_at = max(self._due_at, now + self.quiet_delay)
+        self._due_at = min(self._due_at, self._dirty_since + self.max_staleness)
+        self._ensure_running()
+        self._wakeup.set()
+
+    @property
+    def dirty(self) -> bool:
+        """Есть несохраненные изменения, выгрузка которых запланирована"""
+        return self._dirty
+
+    def _ensure_running(self) -> None:
+        if self._task is None or self._task.done():
+            self._wakeup = asyncio.Event()
+            self._task = asyncio.get_running_loop().create_task(self._run())
+
+    def _next_run_at(self) -> float:
+        due_at = self._due_at
+        if self._last_finished_at is not None:
+            due_at = max(due_at, self._last_finished_at + self.min_interval)
+        return due_at
+
+    async def _run(self) -> None:
+        while True:
+            if not self._dirty:
+                self._wakeup.clear()
+                await self._wakeup.wait()
+                continue
+            delay = self._next_run_at() - time.monotonic()
+            if delay > 0:
+                self._wakeup.clear()
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), delay)
+                    continue  # срок сдвинулся — пересчитываем
+                except asyncio.TimeoutError:
+                    pass
+            await self._upload()
+
+    async def flush(self) -> bool:
+        """Останавливает цикл и сразу выполняет последнюю выгрузку (при остановке процесса).
+
+        Идущая выгрузка не прерывается — дожидаемся ее. Возвращает True, если выгрузка
+        понадобилась и прошла успешно; False — выгружать было нечего или выгрузка не удалась.
+        """
+        async with self._upload_lock:
+            if self._task is not None and not self._task.done():
+                self._task.cancel()
+                await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+            if not self._dirty or self._job is None:
+                return False
+            failures = self.failures
+            await self._upload_locked()
+            return self.failures == failures
+
+    async def _upload(self) -> None:
+        async with self._upload_lock:
+            await self._upload_locked()
+
+    async def _upload_locked(self) -> None:
+        dirty_since = self._dirty_since
+        self._dirty = False
+        self._dirty_since = None
+        self._in_flight = True
+        try:
+            await self._job()
+            self.uploads += 1
+            self.consecutive_failures = 0
+            self.last_success_at = time.time()
+            self.last_error = None
+        except Exception as e:
+            self.failures += 1
+            self.consecutive_failures += 1
+            self.last_error = str(e)
+            logging.error(f"Ошибка фоновой синхронизации: {e}")
+            # Повторяем с растущей паузой; возраст несохраненных данных считаем от исходной записи
+            retry_in = min(self.min_interval * 2 ** self.consecutive_failures, self.max_staleness)
+            if not self._dirty:
+                self._dirty = True
+                self._dirty_since = dirty_since
+                self._due_at = time.monotonic() + retry_in
+            else:
+                self._dirty_since = min(self._dirty_since, dirty_since)
+                self._due_at = max(self._due_at, time.monotonic() + retry_in)
+        finally:
+            self._in_flight = False
+            self._last_finished_at = time.monotonic()
+
+    def status(self) -> Dict[str, Any]:
+        """Состояние синхронизации для админки"""
+        now = time.monotonic()
+        return {
+            "dirty": self._dirty,
+            "in_flight": self._in_flight,
+            "pending_age_seconds": round(now - self._dirty_since, 1) if self._dirty_since is not None else None,
+            "next_upload_in_seconds": round(max(self._next_run_at() - now, 0.0), 1) if self._dirty else None,
+            "last_success_at": self.last_success_at,
+            "last_error": self.last_error,
+            "uploads": self.uploads,
+            "failures": self.failures,
+            "consecutive_failures": self.consecutive_failures,
+        }
@@ -1,3 +1,4 @@
+import asyncio
 import aiohttp
 import json
 from typing import Dict, List, Any, Optional
@@ -5,23 +6,80 @@ from datetime import datetime
 from config_reader import config
 
 
+DEFAULT_BASE_URL = "https://cloud-api.yandex.net/v1/disk"
+
+# Код ошибки API (поле error ответа) при создании уже существующей папки
+_FOLDER_EXISTS_ERROR = "DiskPathPointsToExistentDirectoryError"
+
+# Одна HTTP-сессия на процесс: соединения с API и узлами хранения переиспользуются (keep-alive),
+# поэтому синхронизация не платит TCP+TLS рукопожатие на каждый запрос.
+_CONNECTOR_LIMIT = 16
+_CONNECTOR_LIMIT_PER_HOST = 8
+_DNS_CACHE_TTL = 300
+_KEEPALIVE_TIMEOUT = 30
+
+_session: Optional[aiohttp.ClientSession] = None
+_session_lock = asyncio.Lock()
+
+
+async def get_session() -> aiohttp.ClientSession:
+    """Возвращает общую сессию, создавая ее при первом обращении."""
+    global _session
+    if _session is not None and not _session.closed:
+        return _session
+    async with _session_lock:
+        if _session is None or _session.closed:
+            connector = aiohttp.TCPConnector(
+                limit=_CONNECTOR_LIMIT,
+                limit_per_host=_CONNECTOR_LIMIT_PER_HOST,
+                ttl_dns_cache=_DNS_CACHE_TTL,
+                keepalive_timeout=_KEEPALIVE_TIMEOUT,
+            )
+            _session = aiohttp.ClientSession(connector=connector)
+        return _session
+
+
+async def close_session() -> None:
+    """Закрывает общую сессию (вызывается при остановке бота/API)."""
+    global _session
+    async with _session_lock:
+        if _session is not None and not _session.closed:
+            await _session.close()
+        _session = None
+
+
 class YandexDiskAPI:
     """Класс для работы с Яндекс.Диском через REST API"""
     
-    def __init__(self, token: str):
+    def __init__(self, token: str, base_url: str = DEFAULT_BASE_URL):
         self.token = token
-        self.base_url = "https://cloud-api.yandex.net/v1/disk"
+        self.base_url = base_url
         self.headers = {
             "Authorization": f"OAuth {token}",
             "Accept": "application/json"
         }
     
     async def _request(self, method: str, url: str, **kwargs) -> Dict[str, Any]:
-        """Выполняет HTTP запрос"""
-        async with aiohttp.ClientSession() as session:
-            async with session.request(method, url, headers=self.headers, **kwargs) as response:
-                response.raise_for_status()
-                return await response.json()
+        """Выполняет HTTP запрос; возвращает JSON ответа или {} (204, пустое тело, не JSON).
+
+        При ошибке в message исключения — код ошибки API (поле error), если он есть.
+        """
+        session = await get_session()
+        async with session.request(method, url, headers=self.headers, **kwargs) as response:
+            if response.status >= 400:
+                message = response.reason or ""
+                try:
+                    message = (await response.json(content_type=None)).get("error") or message
+                except Exception:
+                    pass
+                raise aiohttp.ClientResponseError(
+                    response.request_info, response.history,
+                    status=response.status, message=message, headers=response.headers,
+                )
+            if response.status == 204 or response.content_type != "application/json":
+                return {}
+            body = await response.read()
+            return json.loads(body) if body else {}
     
     async def download_file(self, remote_path: str) -> bytes:
         """Скачивает файл с Яндекс.Диска"""
@@ -30,10 +88,10 @@ class YandexDiskAPI:
         response_data = await self._request("GET", url, params=params)
         download_url = response_data["href"]
         
-        async with aiohttp.ClientSession() as session:
-            async with session.get(download_url) as response:
-                response.raise_for_status()
-                return await response.read()
+        session = await get_session()
+        async with session.get(download_url) as response:
+            response.raise_for_status()
+            return await response.read()
     
     async def upload_file(self, local_data: bytes, remote_path: str, overwrite: bool = True) -> None:
         """Загружает файл на Яндекс.Диск"""
@@ -44,9 +102,9 @@ class YandexDiskAPI:
         upload_url = response_data["href"]
         
         # Загружаем файл
-        async with aiohttp.ClientSession() as session:
-            async with session.put(upload_url, data=local_data) as response:
-                response.raise_for_status()
+        session = await get_session()
+        async with session.put(upload_url, data=local_data) as response:
+            response.raise_for_status()
     
     async def copy_file(self, from_path: str, to_path: str) -> Dict[str, Any]:
         """Копирует файл на Яндекс.Диске"""
@@ -60,6 +118,17 @@ class YandexDiskAPI:
         params = {"path": remote_path}
         return await self._request("GET", url, params=params)
     
+    async def create_folder(self, remote_path: str) -> None:
+        """Создает папку на Яндекс.Диске (если ее еще нет)"""
+        url = f"{self.base_url}/resources"
+        params = {"path": remote_path}
+        try:
+            await self._request("PUT", url, params=params)
+        except aiohttp.ClientResponseError as e:
+            # 409 бывает и когда нет родительской папки — успехом считаем только "папка уже есть"
+            if e.status != 409 or e.message != _FOLDER_EXISTS_ERROR:
+                raise
+    
     async def delete_file(self, remote_path: str) -> None:
         """Удаляет файл с Яндекс.Диска"""
         url = f"{self.base_url}/resources"
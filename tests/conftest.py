@@ -0,0 +1,76 @@
+import os
+import sys
+import asyncio
+import tempfile
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+# config_reader читает .env из текущего каталога и завершает процесс без него
+_ENV_DIR = tempfile.mkdtemp(prefix="90days_tests_")
+with open(os.path.join(_ENV_DIR, ".env"), "w", encoding="utf-8") as f:
+    f.write("BOT_TOKEN=123456:TEST\nYADISK_TOKEN=test\n")
+os.chdir(_ENV_DIR)
+
+from services import local_store  # noqa: E402
+from services import game_data as game_data_module  # noqa: E402
+from services.leader import LeaderLease  # noqa: E402
+from services.sync_scheduler import SyncScheduler  # noqa: E402
+
+
+@pytest.fixture
+def anyio_backend():
+    return "asyncio"
+
+
+@pytest.fixture
+def store(tmp_path, monkeypatch):
+    """Отдельная локальная БД на тест; выгрузка на Я.Диск заменена заглушкой"""
+    monkeypatch.setattr(local_store, "DB_PATH", str(tmp_path))
+    monkeypatch.setattr(local_store, "DB_FILE", str(tmp_path / "data.db"))
+    # Замки и планировщики модулей привязываются к циклу событий, а у каждого теста он свой
+    monkeypatch.setattr(local_store, "_init_lock", asyncio.Lock())
+    monkeypatch.setattr(local_store, "_write_lock", asyncio.Lock())
+    monkeypatch.setattr(game_data_module, "_sync", SyncScheduler())
+    monkeypatch.setattr(game_data_module, "_sync_lease", LeaderLease("yadisk_sync"))
+    monkeypatch.setattr(game_data_module, "_leader_task", None)
+    game_data_module._snapshot.invalidate()
+    manager = game_data_module.get_game_data()
+    uploads = []
+
+    async def fake_upload():
+        uploads.append(await local_store.load_changes())
+
+    monkeypatch.setattr(manager, "_sync_to_remote", fake_upload)
+    yield manager
+    game_data_module._snapshot.invalidate()
+
+
+def participant(user_id, game_name="", **extra):
+    return {
+        "user_id": user_id,
+        "username": f"user{user_id}",
+        "full_name": f"User {user_id}",
+        "game_name": game_name,
+        "registered_date": "2025-11-05",
+        "status": "active",
+        "goals": [f"Цель {i}" for i in range(1, 11)],
+        **extra,
+    }
+
+
+@pytest.fixture
+def client(store):
+    """Клиент API с одним участником в БД; жизненный цикл приложения запускается и останавливается"""
+    from fastapi.testclient import TestClient
+    import api.main as api_main
+
+    api_main._response_cache.clear()
+    api_main._response_cache_state["etag"] = None
+    with TestClient(api_main.app) as client:
+        client.portal.call(local_store.replace_all, {
+            "participants": [participant(1, "Alpha")], "reports": [], "settings": {},
+        }, True)
+        yield client
@@ -0,0 +1,60 @@
+import asyncio
+
+import pytest
+
+import api.main as api_main
+
+
+ORIGIN = "http://localhost:3000"
+
+
+def test_cors_headers_on_cached_and_not_modified_responses(client):
+    first = client.get("/api/participants", headers={"Origin": ORIGIN})
+    assert first.status_code == 200
+    assert "access-control-allow-origin" in first.headers
+    etag = first.headers["etag"]
+
+    cached = client.get("/api/participants", headers={"Origin": ORIGIN})
+    assert cached.status_code == 200
+    assert cached.json() == first.json()
+    assert "access-control-allow-origin" in cached.headers
+    assert api_main._response_cache_state["hits"] >= 1
+
+    not_modified = client.get("/api/participants", headers={"Origin": ORIGIN, "If-None-Match": etag})
+    assert not_modified.status_code == 304
+    assert "access-control-allow-origin" in not_modified.headers
+    assert not_modified.headers["etag"] == etag
+
+
+def test_etag_computed_once_per_cache_miss(client, monkeypatch):
+    calls = []
+    original = api_main._current_etag
+
+    async def counting_etag():
+        calls.append(1)
+        return await original()
+
+    monkeypatch.setattr(api_main, "_current_etag", counting_etag)
+    response = client.get("/api/reports")
+    assert response.status_code == 200
+    assert len(calls) == 1
+
+
+@pytest.mark.anyio
+async def test_lifespan_waits_for_cancelled_token_sweeper(monkeypatch):
+    sweepers = []
+
+    async def sweeper():
+        sweepers.append(asyncio.current_task())
+        await asyncio.Event().wait()
+
+    async def noop():
+        pass
+
+    monkeypatch.setattr(api_main.auth_tokens, "run_sweeper", sweeper)
+    monkeypatch.setattr(api_main.game_data, "start", noop)
+    monkeypatch.setattr(api_main.game_data, "stop", noop)
+    async with api_main.lifespan(api_main.app):
+        await asyncio.sleep(0)
+
+    assert sweepers[0].cancelled()
@@ -0,0 +1,87 @@
+import io
+
+import pytest
+
+from services import data_export, data_import, local_store
+from tests.conftest import participant
+
+
+pytestmark = pytest.mark.anyio
+
+
+def _export(fmt, entity="reports"):
+    return io.BytesIO(b"".join(data_export.iter_export(fmt, entity)))
+
+
+async def _seed():
+    await local_store.replace_all({
+        "participants": [participant(1, "Alpha"), participant(2, "")],
+        "reports": [{"user_id": 2, "day": 3, "date": "2025-11-07", "progress": ["да"] + [""] * 9,
+                     "rest_day": False}],
+        "settings": {"game_start_date": "2025-11-05"},
+    }, synced=True)
+
+
+@pytest.mark.parametrize("fmt, entities", [("ndjson", ("reports",)), ("csv", ("participants", "reports"))])
+async def test_export_import_round_trip_keeps_empty_game_name(store, fmt, entities):
+    await _seed()
+    try:
+        before = await local_store.load_all()
+        exported = {entity: _export(fmt, entity) for entity in entities}
+        await local_store.replace_all({"participants": [], "reports": [], "settings": {}}, synced=True)
+
+        for entity in entities:
+            parsed = data_import.parse(exported[entity], fmt, entity)
+            assert parsed["errors"] == []
+            result = await store.bulk_import(parsed)
+            assert result["error_count"] == 0
+
+        after = await local_store.load_all()
+        assert after["participants"] == before["participants"]
+        assert after["reports"] == before["reports"]
+        assert (await local_store.get_participant(2))["game_name"] == ""
+    finally:
+        await local_store.close_db()
+
+
+async def test_reimport_without_goals_keeps_existing_goals(store):
+    await _seed()
+    try:
+        # В CSV нет колонок целей и игрового имени — прежние значения не затираются
+        parsed = data_import.parse(io.BytesIO("user_id,status\n1,removed\n".encode()), "csv", "participants")
+        result = await store.bulk_import(parsed)
+        assert result["error_count"] == 0
+
+        stored = await local_store.get_participant(1)
+        assert stored["goals"] == participant(1)["goals"]
+        assert stored["game_name"] == "Alpha"
+        assert stored["status"] == "removed"
+        cached = (await store.get_all_data())["participants"][0]
+        assert cached["goals"] == stored["goals"]
+        assert cached["game_name"] == "Alpha"
+    finally:
+        await local_store.close_db()
+
+def test_participant_row_rejects_missing_user_id():
+    parsed = data_import.parse(io.BytesIO(b'{"type": "participant", "game_name": ""}\n'), "ndjson")
+    assert parsed["error_count"] == 1
+    assert "user_id" in parsed["errors"][0]["error"]
+
+
+def test_json_import_upserts_rows_through_the_journal(client):
+    document = {
+        "participants": [participant(2, "Beta")],
+        "reports": [{"user_id": 2, "day": 1, "date": "2025-11-05", "progress": ["да"], "rest_day": False},
+                    {"user_id": 99, "day": 1}],
+        "settings": {},
+    }
+    response = client.post("/api/admin/import", json=document, auth=("admin", "admin"))
+
+    assert response.status_code == 200
+    assert response.json()["participants"] == 1
+    assert response.json()["error_count"] == 1
+    stored = client.portal.call(local_store.load_all)
+    # Участник, которого нет в файле, остается; полной перезаписи в журнале нет
+    assert [p["user_id"] for p in stored["participants"]] == [1, 2]
+    assert len(stored["reports"]) == 1
+    assert not client.portal.call(local_store.load_changes)["reset"]
@@ -0,0 +1,120 @@
+from datetime import datetime, timedelta
+
+import pytest
+
+from services import local_store, reminders, scheduler
+from tests.conftest import participant
+
+
+pytestmark = pytest.mark.anyio
+
+
+def _day_of(now: datetime) -> int:
+    year = now.year if now.month >= 11 else now.year - 1
+    return (now - datetime(year, 11, 5)).days + 1
+
+
+class _FrozenDatetime(datetime):
+    moment = datetime(2025, 11, 21, 1, 30)
+
+    @classmethod
+    def now(cls, tz=None):
+        return cls.moment
+
+
+@pytest.mark.parametrize("offset, bot_date", [(-3, "2025-11-20"), (0, "2025-11-21"), (3, "2025-11-21")])
+async def test_removal_judges_the_bot_clock_day(store, monkeypatch, offset, bot_date):
+    # Системное время 21.11 01:30; со смещением -3 у бота еще 20.11 — проверяется отчет за 20.11
+    monkeypatch.setattr(scheduler, "datetime", _FrozenDatetime)
+    day = _day_of(datetime.strptime(bot_date, "%Y-%m-%d"))
+    await local_store.replace_all({
+        "participants": [participant(1, "Alpha"), participant(2, "Beta")],
+        "reports": [
+            {"user_id": user_id, "day": day, "date": bot_date, "progress": ["да", "да"] + [""] * 8,
+             "rest_day": False}
+            for user_id in (1, 2)
+        ],
+        "settings": {"time_offset_hours": offset},
+    }, synced=True)
+    try:
+        result = await reminders.check_and_remove_inactive_users(None, dry_run=True)
+
+        assert result["day"] == day
+        assert result["verdicts"] == []
+    finally:
+        await local_store.close_db()
+
+
+async def test_removal_waits_for_removal_time_on_bot_clock(store, monkeypatch):
+    monkeypatch.setattr(reminders, "bot_now", lambda settings: datetime(2025, 11, 20, 23, 0))
+    await local_store.replace_all({"participants": [participant(1, "Alpha")], "reports": [],
+                                   "settings": {"removal_time": "23:30"}}, synced=True)
+    try:
+        result = await reminders.check_and_remove_inactive_users(None)
+
+        assert result["too_early"] is True
+        assert (result["bot_time"], result["removal_time"]) == ("23:00", "23:30")
+        assert (await local_store.get_participant(1))["status"] == "active"
+    finally:
+        await local_store.close_db()
+
+
+def test_current_day_uses_given_moment(store):
+    now = datetime(2025, 11, 20, 1, 0)
+    assert store.get_current_day(now=now) == 16
+    assert store.get_current_day(now=now - timedelta(hours=2)) == 15
+
+
+
+async def test_catch_up_removal_judges_the_slot_day(store, monkeypatch):
+    # Догоняющий запуск в 00:30 21.11 за срок 20.11 23:30: проверяется 20.11, без отказа too_early
+    monkeypatch.setattr(scheduler, "datetime", _FrozenDatetime)
+    monkeypatch.setattr(_FrozenDatetime, "moment", datetime(2025, 11, 21, 0, 30))
+    day = _day_of(datetime(2025, 11, 20))
+    await local_store.replace_all({
+        "participants": [participant(1, "Alpha")],
+        "reports": [{"user_id": 1, "day": day, "date": "2025-11-20", "progress": ["да", "да"] + [""] * 8,
+                     "rest_day": False}],
+        "settings": {"removal_time": "23:30"},
+    }, synced=True)
+    try:
+        result = await reminders.check_and_remove_inactive_users(None, at=datetime(2025, 11, 20, 23, 30))
+
+        assert not result.get("too_early")
+        assert result["day"] == day
+        assert result["removed_count"] == 0
+    finally:
+        await local_store.close_db()
+
+async def test_report_filed_near_midnight_survives_elimination(store, monkeypatch):
+    # Смещение -3: в 01:00 по системным часам у бота еще 22:00 20.11 — отчет идет в день 20.11
+    monkeypatch.setattr(scheduler, "datetime", _FrozenDatetime)
+    monkeypatch.setattr(_FrozenDatetime, "moment", datetime(2025, 11, 21, 1, 0))
+    await local_store.replace_all({
+        "participants": [participant(1, "Alpha"), participant(2, "Beta")], "reports": [],
+        "settings": {"time_offset_hours": -3, "removal_time": "23:30"},
+    }, synced=True)
+    try:
+        day = await store.get_current_day_async()
+        await store.save_daily_report_async(1, day, {1: "✅ да", 2: "✅ да"}, rest_day=False)
+
+        monkeypatch.setattr(_FrozenDatetime, "moment", datetime(2025, 11, 21, 2, 45))
+        result = await reminders.check_and_remove_inactive_users(None)
+
+        assert day == _day_of(datetime(2025, 11, 20))
+        assert result["day"] == day
+        assert [v["user_id"] for v in result["verdicts"]] == [2]
+        assert (await local_store.get_participant(1))["status"] == "active"
+        assert (await local_store.get_report(1, day))["date"] == "2025-11-20"
+    finally:
+        await local_store.close_db()
+
+
+def test_manual_removal_before_removal_time_is_refused_with_reason(client, monkeypatch):
+    monkeypatch.setattr(reminders, "bot_now", lambda settings: datetime(2025, 11, 20, 12, 0))
+
+    response = client.post("/api/admin/remove-inactive", auth=("admin", "admin"))
+
+    assert response.status_code == 409
+    assert "12:00" in response.json()["detail"] and "23:30" in response.json()["detail"]
+    assert client.portal.call(local_store.get_participant, 1)["status"] == "active"
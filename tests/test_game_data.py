@@ -0,0 +1,49 @@
+import sqlite3
+
+import pytest
+
+from services import local_store
+from services import game_data as game_data_module
+from tests.conftest import participant
+
+
+pytestmark = pytest.mark.anyio
+
+
+async def _seed(*participants):
+    await local_store.replace_all({"participants": list(participants), "reports": [], "settings": {}}, synced=True)
+
+
+def _locked(*args, **kwargs):
+    raise sqlite3.OperationalError("database is locked")
+
+
+async def test_read_error_returns_snapshot_without_writing(store, monkeypatch):
+    await _seed(participant(1, "Alpha"), participant(2, "Beta"))
+    try:
+        assert len((await store.get_all_data())["participants"]) == 2
+        with monkeypatch.context() as patch:
+            patch.setattr(local_store, "get_data_version", _locked)
+            data = await store.get_all_data()
+
+        assert [p["user_id"] for p in data["participants"]] == [1, 2]
+        assert len((await local_store.load_all())["participants"]) == 2
+        assert await local_store.count_changes() == 0
+        assert not (await local_store.load_changes())["reset"]
+    finally:
+        await local_store.close_db()
+
+
+async def test_read_error_without_snapshot_raises(store, monkeypatch):
+    await _seed(participant(1, "Alpha"))
+    try:
+        game_data_module._snapshot.invalidate()
+        with monkeypatch.context() as patch:
+            patch.setattr(local_store, "load_all", _locked)
+            with pytest.raises(sqlite3.OperationalError):
+                await store.get_all_data()
+
+        assert len((await local_store.load_all())["participants"]) == 1
+        assert await local_store.count_changes() == 0
+    finally:
+        await local_store.close_db()
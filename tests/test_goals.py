@@ -0,0 +1,55 @@
+from types import SimpleNamespace
+
+import pytest
+from aiogram.fsm.context import FSMContext
+from aiogram.fsm.storage.base import StorageKey
+
+from handlers import goals as goals_handlers
+from services import local_store
+from services.fsm_storage import SQLiteStorage
+from states import GoalSettingStates
+from tests.conftest import participant
+
+
+pytestmark = pytest.mark.anyio
+
+
+class _Message:
+    def __init__(self, user_id, text):
+        self.text = text
+        self.from_user = SimpleNamespace(id=user_id)
+        self.answers = []
+
+    async def answer(self, text, **kwargs):
+        self.answers.append(text)
+
+
+async def test_goal_input_keeps_concurrent_edits(store):
+    user = participant(1, "Alpha", goals=["Цель 1", "Цель 2"] + [""] * 8)
+    await local_store.replace_all({"participants": [user], "reports": [], "settings": {}}, synced=True)
+    state = FSMContext(SQLiteStorage(), StorageKey(bot_id=1, chat_id=1, user_id=1))
+    try:
+        await state.set_state(GoalSettingStates.setting_goal_3)
+        # Между шагами диалога цель 1 и имя меняют через сайт
+        await store.upsert_participant({**user, "game_name": "Web", "goals": ["С сайта"] + user["goals"][1:]},
+                                       sync_to_main=False)
+
+        await goals_handlers.handle_goal_input(_Message(1, "Третья цель"), state, 3)
+
+        stored = await local_store.get_participant(1)
+        assert stored["game_name"] == "Web"
+        assert stored["goals"][:3] == ["С сайта", "Цель 2", "Третья цель"]
+        assert await state.get_state() == GoalSettingStates.setting_goal_4.state
+        assert await state.get_data() == {}
+        assert (await store.get_all_data())["participants"][0]["goals"][2] == "Третья цель"
+    finally:
+        await local_store.close_db()
+
+
+async def test_set_user_goals_for_unknown_participant(store):
+    await local_store.replace_all({"participants": [], "reports": [], "settings": {}}, synced=True)
+    try:
+        assert await store.set_user_goals_async(42, {1: "Цель"}) is None
+        assert await local_store.count_changes() == 0
+    finally:
+        await local_store.close_db()
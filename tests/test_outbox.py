@@ -0,0 +1,47 @@
+from datetime import date, datetime
+
+import pytest
+
+from services import local_store, outbox, reminders, scheduler
+from tests.conftest import participant
+
+
+pytestmark = pytest.mark.anyio
+
+
+class _FrozenDatetime(datetime):
+    moment = datetime(2025, 11, 20, 22, 30)
+
+    @classmethod
+    def now(cls, tz=None):
+        return cls.moment
+
+
+class _FrozenDate(date):
+    @classmethod
+    def today(cls):
+        return _FrozenDatetime.moment.date()
+
+
+async def test_reminder_is_queued_once_per_bot_day_across_system_midnight(store, monkeypatch):
+    # Смещение +3: 22:30 и 00:30 по системным часам — это один и тот же день бота (21.11)
+    monkeypatch.setattr(scheduler, "datetime", _FrozenDatetime)
+    monkeypatch.setattr(outbox, "date", _FrozenDate)
+    await local_store.replace_all({"participants": [participant(1, "Alpha")], "reports": [],
+                                   "settings": {"time_offset_hours": 3}}, synced=True)
+    try:
+        _FrozenDatetime.moment = datetime(2025, 11, 20, 21, 30)
+        first = await reminders.check_and_remind_users(None)
+        _FrozenDatetime.moment = datetime(2025, 11, 21, 0, 30)
+        second = await reminders.check_and_remind_users(None)
+
+        assert first == {"enqueued": 1, "duplicates": 0}
+        assert second["enqueued"] == 0
+        assert await local_store.outbox_counts() == {local_store.OUTBOX_PENDING: 1}
+    finally:
+        await local_store.close_db()
+
+
+def test_dedup_key_uses_given_bot_date():
+    message = outbox.message("reminder", 17, 5, "текст", bot_date=datetime(2025, 11, 21).date())
+    assert message["dedup_key"] == "reminder:2025-11-21:17:5"
@@ -0,0 +1,118 @@
+import asyncio
+from datetime import datetime
+
+import pytest
+
+from services import local_store, scheduler as scheduler_module
+from services.scheduler import DailyScheduler, get_last_run
+
+
+pytestmark = pytest.mark.anyio
+
+
+class _FrozenDatetime(datetime):
+    moment = datetime(2025, 11, 21, 0, 30)
+
+    @classmethod
+    def now(cls, tz=None):
+        return cls.moment
+
+
+async def test_stop_waits_for_running_job_and_skips_the_rest(store):
+    started, release = asyncio.Event(), asyncio.Event()
+    ran = []
+
+    async def slow_job(slot):
+        started.set()
+        await release.wait()
+        ran.append("slow")
+
+    async def next_job(slot):
+        ran.append("next")
+
+    async def settings():
+        return {"first_time": "00:00", "second_time": "00:00"}
+
+    scheduler = DailyScheduler(settings)
+    scheduler.add_job("first", "first_time", "00:00", slow_job)
+    scheduler.add_job("second", "second_time", "00:00", next_job)
+    try:
+        scheduler.start()
+        await asyncio.wait_for(started.wait(), 5)
+        stopping = asyncio.ensure_future(scheduler.stop(timeout=5))
+        await asyncio.sleep(0)
+        release.set()
+        await stopping
+
+        assert ran == ["slow"]
+        assert scheduler._task is None
+    finally:
+        await local_store.close_db()
+
+
+async def test_stop_cancels_job_after_timeout(store):
+    async def stuck_job(slot):
+        await asyncio.sleep(3600)
+
+    async def settings():
+        return {}
+
+    scheduler = DailyScheduler(settings)
+    scheduler.add_job("stuck", "stuck_time", "00:00", stuck_job)
+    try:
+        scheduler.start()
+        await asyncio.sleep(0.1)
+        await scheduler.stop(timeout=0.1)
+        assert scheduler._task is None
+    finally:
+        await local_store.close_db()
+
+
+async def test_restart_across_midnight_catches_up_yesterdays_slot_once(store, monkeypatch):
+    # Последний запуск — срок 19.11; процесс стоял с 23:00 20.11 до 00:30 21.11 и пропустил 23:30
+    monkeypatch.setattr(scheduler_module, "datetime", _FrozenDatetime)
+    ran = {"removal": [], "reminders": []}
+
+    async def removal_job(slot):
+        ran["removal"].append(slot)
+
+    async def reminders_job(slot):
+        ran["reminders"].append(slot)
+
+    async def settings():
+        return {"removal_time": "23:30", "reminder_time": "18:00"}
+
+    scheduler = DailyScheduler(settings)
+    scheduler.add_job("removal", "removal_time", "23:30", removal_job, catch_up=True)
+    scheduler.add_job("reminders", "reminder_time", "18:00", reminders_job)
+    await local_store.set_json("job_last_run:removal", {"date": "2025-11-19", "ran_at": "2025-11-19T23:30:00"})
+    await local_store.set_json("job_last_run:reminders", {"date": "2025-11-20", "ran_at": "2025-11-20T18:00:00"})
+    try:
+        await scheduler._tick()
+        # Повторный запуск процесса не выполняет вчерашний срок второй раз
+        await scheduler._tick()
+
+        assert ran["removal"] == [datetime(2025, 11, 20, 23, 30)]
+        assert ran["reminders"] == []
+        assert (await get_last_run("removal"))["date"] == "2025-11-20"
+    finally:
+        await local_store.close_db()
+
+
+async def test_first_start_does_not_catch_up(store, monkeypatch):
+    monkeypatch.setattr(scheduler_module, "datetime", _FrozenDatetime)
+    ran = []
+
+    async def removal_job(slot):
+        ran.append(slot)
+
+    async def settings():
+        return {"removal_time": "23:30"}
+
+    scheduler = DailyScheduler(settings)
+    scheduler.add_job("removal", "removal_time", "23:30", removal_job, catch_up=True)
+    try:
+        await scheduler._tick()
+        assert ran == []
+    finally:
+        await local_store.close_db()
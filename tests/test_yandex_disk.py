@@ -0,0 +1,147 @@
+import pytest
+from aiohttp import web
+
+from services import yandex_sheets
+
+
+pytestmark = pytest.mark.anyio
+
+TOKEN = "test-token"
+
+
+class _FakeDisk:
+    """Локальный стенд REST API Яндекс.Диска: файлы в памяти, ссылки на загрузку — на этот же сервер"""
+
+    def __init__(self):
+        self.files = {}
+        self.folders = {""}  # корень диска
+        self.peers = set()  # адреса клиентских соединений
+        app = web.Application()
+        app.router.add_route("GET", "/v1/disk/resources/upload", self.upload_link)
+        app.router.add_route("GET", "/v1/disk/resources/download", self.download_link)
+        app.router.add_route("POST", "/v1/disk/resources/copy", self.copy)
+        app.router.add_route("GET", "/v1/disk/resources", self.info)
+        app.router.add_route("PUT", "/v1/disk/resources", self.mkdir)
+        app.router.add_route("DELETE", "/v1/disk/resources", self.delete)
+        app.router.add_route("PUT", "/storage", self.store)
+        app.router.add_route("GET", "/storage", self.fetch)
+        self.app = app
+
+    def _authorized(self, request):
+        self.peers.add(request.transport.get_extra_info("peername"))
+        return request.headers.get("Authorization") == f"OAuth {TOKEN}"
+
+    def _error(self, status, code):
+        return web.json_response({"error": code}, status=status)
+
+    def _storage_link(self, request, path):
+        return web.json_response({"href": str(request.url.with_path("/storage").with_query(path=path)),
+                                  "method": "GET", "templated": False})
+
+    async def upload_link(self, request):
+        if not self._authorized(request):
+            return self._error(401, "UnauthorizedError")
+        return self._storage_link(request, request.query["path"])
+
+    async def download_link(self, request):
+        if not self._authorized(request):
+            return self._error(401, "UnauthorizedError")
+        if request.query["path"] not in self.files:
+            return self._error(404, "DiskNotFoundError")
+        return self._storage_link(request, request.query["path"])
+
+    async def store(self, request):
+        self.files[request.query["path"]] = await request.read()
+        return web.Response(status=201)
+
+    async def fetch(self, request):
+        return web.Response(body=self.files[request.query["path"]], content_type="application/octet-stream")
+
+    async def copy(self, request):
+        if not self._authorized(request):
+            return self._error(401, "UnauthorizedError")
+        self.files[request.query["path"]] = self.files[request.query["from"]]
+        return web.json_response({"href": "link", "method": "GET", "templated": False}, status=201)
+
+    async def info(self, request):
+        path = request.query["path"]
+        if path not in self.files:
+            return self._error(404, "DiskNotFoundError")
+        return web.json_response({"path": path, "size": len(self.files[path]), "modified": "2025-11-05T10:00:00+00:00"})
+
+    async def mkdir(self, request):
+        path = request.query["path"].rstrip("/")
+        if path in self.folders:
+            return self._error(409, "DiskPathPointsToExistentDirectoryError")
+        if path.rsplit("/", 1)[0] not in self.folders:
+            return self._error(409, "DiskPathDoesntExistsError")
+        self.folders.add(path)
+        return web.json_response({"href": "link", "method": "GET", "templated": False}, status=201)
+
+    async def delete(self, request):
+        if self.files.pop(request.query["path"], None) is None:
+            return self._error(404, "DiskNotFoundError")
+        # Файл удаляется сразу: 204 без тела
+        return web.Response(status=204)
+
+
+@pytest.fixture
+async def disk():
+    fake = _FakeDisk()
+    runner = web.AppRunner(fake.app)
+    await runner.setup()
+    site = web.TCPSite(runner, "127.0.0.1", 0)
+    await site.start()
+    port = site._server.sockets[0].getsockname()[1]
+    fake.api = yandex_sheets.YandexDiskAPI(TOKEN, base_url=f"http://127.0.0.1:{port}/v1/disk")
+    yield fake
+    await yandex_sheets.close_session()
+    await runner.cleanup()
+
+
+async def test_delete_returns_on_204_without_body(disk):
+    disk.files["/app/part.jsonl"] = b"{}"
+
+    await disk.api.delete_file("/app/part.jsonl")
+
+    assert "/app/part.jsonl" not in disk.files
+
+
+async def test_create_folder_only_ignores_existing_folder(disk):
+    await disk.api.create_folder("/app")
+    await disk.api.create_folder("/app")
+    assert "/app" in disk.folders
+
+    with pytest.raises(yandex_sheets.aiohttp.ClientResponseError) as error:
+        await disk.api.create_folder("/missing/child")
+    assert error.value.status == 409
+    assert error.value.message == "DiskPathDoesntExistsError"
+
+
+async def test_round_trip_reuses_one_pooled_connection(disk):
+    await disk.api.upload_file(b"workbook v1", "/app/track_copy.xlsx")
+    assert await disk.api.download_file("/app/track_copy.xlsx") == b"workbook v1"
+
+    # Публикация: копия книги переносится в основной файл
+    await disk.api.copy_file("/app/track_copy.xlsx", "/app/track.xlsx")
+    assert disk.files["/app/track.xlsx"] == b"workbook v1"
+    assert (await disk.api.get_file_info("/app/track.xlsx"))["size"] == len(b"workbook v1")
+
+    await disk.api.delete_file("/app/track_copy.xlsx")
+    assert set(disk.files) == {"/app/track.xlsx"}
+
+    # Все запросы к API шли через одну сессию и одно keep-alive соединение
+    assert len(disk.peers) == 1
+    assert (await yandex_sheets.get_session()) is (await yandex_sheets.get_session())
+
+
+async def test_errors_carry_api_error_code(disk):
+    with pytest.raises(yandex_sheets.aiohttp.ClientResponseError) as error:
+        await disk.api.download_file("/app/missing.xlsx")
+    assert error.value.status == 404
+    assert error.value.message == "DiskNotFoundError"
+
+    unauthorized = yandex_sheets.YandexDiskAPI("wrong", base_url=disk.api.base_url)
+    with pytest.raises(yandex_sheets.aiohttp.ClientResponseError) as error:
+        await unauthorized.upload_file(b"x", "/app/x.xlsx")
+    assert error.value.status == 401
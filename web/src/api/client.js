@@ -33,16 +33,16 @@ export const api = {
   getParticipant: (userId) => apiClient.get(`/api/participants/${userId}`),
   
   // Отчеты
-  getReports: (userId = null) => {
-    const params = userId ? { user_id: userId } : {}
-    return apiClient.get('/api/reports', { params })
+  getReports: (userId = null, params = {}) => {
+    const query = userId ? { ...params, user_id: userId } : params
+    return apiClient.get('/api/reports', { params: query })
   },
   
   // Статистика
   getUserStats: (userId) => apiClient.get(`/api/stats/${userId}`),
   getCurrentDay: () => apiClient.get('/api/current-day'),
   getBotStatus: () => apiClient.get('/api/admin/bot-status', { requiresAuth: true }),
-  getCommunityStats: () => apiClient.get('/api/community/stats'),
+  getCommunityStats: (params = {}) => apiClient.get('/api/community/stats', { params }),
   
   // Админские методы
   getAdminStats: () => apiClient.get('/api/admin/stats', { requiresAuth: true }),
@@ -63,8 +63,15 @@ export const api = {
   deleteReport: (userId, day) => apiClient.delete(`/api/admin/reports/${userId}/${day}`, { requiresAuth: true }),
   
   // Экспорт/импорт
-  exportData: () => apiClient.get('/api/admin/export', { requiresAuth: true }),
+  exportData: (params = {}) =>
+    apiClient.get('/api/admin/export', { params, responseType: 'blob', requiresAuth: true }),
   importData: (data) => apiClient.post('/api/admin/import', data, { requiresAuth: true }),
+  bulkImport: (file, params = {}) =>
+    apiClient.post('/api/admin/import/bulk', file, {
+      params,
+      headers: { 'Content-Type': 'application/octet-stream' },
+      requiresAuth: true,
+    }),
   
   // Управление днем игры
   setGameDay: (day) => apiClient.post('/api/admin/game-day', { day }, { requiresAuth: true }),
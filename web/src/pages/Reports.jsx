@@ -1,14 +1,40 @@
-import { useQuery } from '@tanstack/react-query'
+import { useQuery, useInfiniteQuery } from '@tanstack/react-query'
 import { Link } from 'react-router-dom'
 import { api } from '../api/client'
 import { FileText, Calendar, User } from 'lucide-react'
 
+// Страница списка без текстов прогресса: для карточки хватает числа целей с прогрессом
+const PAGE_SIZE = 200
+const PAGE_FIELDS = 'user_id,day,date,rest_day,progress_count'
+
 export default function Reports() {
-  const { data: reports, isLoading } = useQuery({
-    queryKey: ['reports'],
-    queryFn: () => api.getReports().then((res) => res.data),
+  const {
+    data,
+    isLoading,
+    fetchNextPage,
+    hasNextPage,
+    isFetchingNextPage,
+  } = useInfiniteQuery({
+    queryKey: ['reports', 'pages'],
+    queryFn: ({ pageParam }) =>
+      api
+        .getReports(null, {
+          limit: PAGE_SIZE,
+          fields: PAGE_FIELDS,
+          ...(pageParam ? { cursor: pageParam } : {}),
+        })
+        .then((res) => ({
+          reports: res.data,
+          nextCursor: res.headers['x-next-cursor'] || null,
+          total: Number(res.headers['x-total-count'] ?? res.data.length),
+        })),
+    initialPageParam: null,
+    getNextPageParam: (lastPage) => lastPage.nextCursor,
   })
 
+  const reports = data?.pages.flatMap((page) => page.reports)
+  const totalReports = data?.pages[0]?.total ?? 0
+
   const { data: participants } = useQuery({
     queryKey: ['participants'],
     queryFn: () => api.getParticipants().then((res) => res.data),
@@ -41,7 +67,7 @@ export default function Reports() {
       <div className="mb-8">
         <h1 className="text-3xl font-bold text-gray-900 mb-2">Отчеты</h1>
         <p className="text-gray-600">
-          Всего отчетов: {reports?.length || 0}
+          Всего отчетов: {totalReports}
         </p>
       </div>
 
@@ -88,9 +114,9 @@ export default function Reports() {
                       <div className="text-sm text-gray-600">
                         Прогресс по{' '}
                         <span className="font-medium text-gray-900">
-                          {report.progress.filter((p) => p && p.trim()).length}
+                          {report.progress_count}
                         </span>{' '}
-                        {report.progress.filter((p) => p && p.trim()).length === 1
+                        {report.progress_count === 1
                           ? 'цели'
                           : 'целям'}
                       </div>
@@ -100,6 +126,18 @@ export default function Reports() {
               </div>
             </div>
           ))}
+
+          {hasNextPage && (
+            <div className="text-center">
+              <button
+                onClick={() => fetchNextPage()}
+                disabled={isFetchingNextPage}
+                className="btn btn-secondary"
+              >
+                {isFetchingNextPage ? 'Загрузка...' : 'Показать еще'}
+              </button>
+            </div>
+          )}
         </div>
       ) : (
         <div className="text-center py-12">
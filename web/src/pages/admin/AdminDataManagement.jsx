@@ -14,13 +14,13 @@ export default function AdminDataManagement() {
   })
 
   const exportMutation = useMutation({
-    mutationFn: () => api.exportData(),
-    onSuccess: (data) => {
-      const blob = new Blob([JSON.stringify(data, null, 2)], { type: 'application/json' })
-      const url = URL.createObjectURL(blob)
+    mutationFn: (format = 'json') => api.exportData({ format }),
+    onSuccess: (res, format = 'json') => {
+      // Сервер отдает файл потоком — сохраняем тело ответа как есть
+      const url = URL.createObjectURL(res.data)
       const a = document.createElement('a')
       a.href = url
-      a.download = `game_data_${new Date().toISOString().split('T')[0]}.json`
+      a.download = `game_data_${new Date().toISOString().split('T')[0]}.${format}`
       document.body.appendChild(a)
       a.click()
       document.body.removeChild(a)
@@ -93,6 +93,7 @@ export default function AdminDataManagement() {
           </div>
           <p className="text-gray-600 mb-4 text-sm">
             Скачайте все данные игры в формате JSON для резервного копирования
+            (NDJSON — по записи на строку для больших игр)
           </p>
           <button
             onClick={() => exportMutation.mutate()}
@@ -111,6 +112,14 @@ export default function AdminDataManagement() {
               </>
             )}
           </button>
+          <button
+            onClick={() => exportMutation.mutate('ndjson')}
+            disabled={exportMutation.isPending}
+            className="btn btn-secondary w-full flex items-center justify-center gap-2 mt-2"
+          >
+            <Download size={18} />
+            Экспортировать в NDJSON
+          </button>
         </div>
 
         {/* Управление днем игры */}
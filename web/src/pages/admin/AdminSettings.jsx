@@ -35,6 +35,7 @@ export default function AdminSettings() {
   })
 
   const [botStatusError, setBotStatusError] = useState('')
+  const [removeResult, setRemoveResult] = useState(null)
   const { refetch: refetchBotStatus, isFetching: isBotStatusLoading } = useQuery({
     queryKey: ['admin-bot-status'],
     queryFn: async () => {
@@ -358,13 +359,27 @@ export default function AdminSettings() {
                   <button
                     type="button"
                     onClick={() => {
-                      api.triggerRemoveInactive().then(() => refetchBotStatus())
+                      setRemoveResult(null)
+                      api.triggerRemoveInactive()
+                        .then((response) => {
+                          setRemoveResult({ success: true, message: response.data?.message })
+                          refetchBotStatus()
+                        })
+                        .catch((error) => {
+                          const message = error.response?.data?.detail || error.message || 'Ошибка при исключении'
+                          setRemoveResult({ success: false, message })
+                        })
                     }}
                     className="btn btn-danger flex items-center gap-2"
                   >
                     <ShieldAlert size={18} />
                     Исключить неактивных сейчас
                   </button>
+                  {removeResult && (
+                    <p className={`mt-2 text-sm ${removeResult.success ? 'text-green-700' : 'text-red-700'}`}>
+                      {removeResult.message}
+                    </p>
+                  )}
                 </div>
               </div>
             </div>